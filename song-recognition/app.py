@@ -1,12 +1,15 @@
 """
 Aplicação principal do Song Recognition
 """
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g
 from flask_cors import CORS
 from controllers.audio_controller import AudioController
 from controllers.recognition_controller import RecognitionController
+from services.recognition_jobs import QueueFullError
+from services.metrics import metrics
 from services.music_database import MusicDatabase
 import os
+import time
 from dotenv import load_dotenv
 
 # Carregar variáveis de ambiente
@@ -27,6 +30,30 @@ audio_controller = AudioController()
 recognition_controller = RecognitionController()
 music_database = MusicDatabase()
 
+@app.before_request
+def start_request_timer():
+    """Marca o início da requisição"""
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    """Registra a latência da requisição por endpoint"""
+    start = getattr(g, 'request_start', None)
+    if start is not None and request.endpoint:
+        metrics.observe(f'http.{request.endpoint}', time.perf_counter() - start)
+        metrics.increment(f'http.{request.endpoint}.{response.status_code}')
+    return response
+
+def page_limit(default: int = 50) -> int:
+    """Parâmetro `limit` da paginação; um valor não inteiro gera ValueError (400)"""
+    value = request.args.get('limit')
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('Parâmetro limit deve ser um número inteiro')
+
 @app.route('/')
 def index():
     """Página principal"""
@@ -63,11 +90,150 @@ def recognize_song():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/recognize/jobs', methods=['POST'])
+def submit_recognition_job():
+    """Enfileira um reconhecimento e retorna o id do job imediatamente"""
+    try:
+        audio_file = request.files.get('audio')
+        if not audio_file:
+            return jsonify({'error': 'Nenhum arquivo de áudio fornecido'}), 400
+        
+        job_id = recognition_controller.submit_recognition(audio_file)
+        return jsonify({'job_id': job_id, 'status_url': f'/recognize/jobs/{job_id}'}), 202
+    except QueueFullError as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/recognize/batch', methods=['POST'])
+def recognize_batch():
+    """Reconhece vários trechos (arquivos 'audio' ou JSON {"paths": [...]}) em uma requisição"""
+    try:
+        audio_files = request.files.getlist('audio')
+        data = request.get_json(silent=True)
+        audio_paths = data.get('paths') if isinstance(data, dict) else None
+        
+        if audio_paths is not None and not (
+            isinstance(audio_paths, list) and audio_paths
+            and all(isinstance(path, str) and path for path in audio_paths)
+        ):
+            return jsonify({'error': 'paths deve ser uma lista não vazia de caminhos (strings)'}), 400
+        audio_paths = audio_paths or []
+        
+        if not audio_files and not audio_paths:
+            return jsonify({'error': 'Nenhum arquivo de áudio fornecido'}), 400
+        
+        if audio_paths and not recognition_controller.ingest_root:
+            return jsonify({'error': 'Caminhos locais desabilitados, envie os arquivos'}), 403
+        
+        # Só arquivos dentro de INGEST_ROOT (caminhos relativos a ele)
+        resolved = [recognition_controller.resolve_ingest_path(path) for path in audio_paths]
+        rejected = [path for path, real in zip(audio_paths, resolved) if real is None]
+        if rejected:
+            return jsonify({'error': 'Caminhos fora do diretório de ingestão', 'paths': rejected}), 403
+        
+        missing = [path for path, real in zip(audio_paths, resolved) if not os.path.isfile(real)]
+        if missing:
+            return jsonify({'error': 'Arquivos não encontrados', 'paths': missing}), 400
+        
+        results = recognition_controller.recognize_batch(audio_files, resolved)
+        return jsonify({'results': results})
+    except QueueFullError as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/recognize/jobs/<job_id>', methods=['GET'])
+def get_recognition_job(job_id):
+    """Estado de um job (com ?wait=segundos aguarda a conclusão)"""
+    try:
+        wait = request.args.get('wait', 0, type=float)
+        status = recognition_controller.get_job_status(job_id, wait)
+        if status:
+            return jsonify(status)
+        else:
+            return jsonify({'error': 'Job não encontrado'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/recognize/live', methods=['POST'])
+def start_live_recognition():
+    """Endpoint para iniciar reconhecimento incremental pelo microfone"""
+    try:
+        data = request.get_json(silent=True) or {}
+        result = audio_controller.start_live_recognition(data.get('max_seconds', 15.0))
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/recognize/live', methods=['GET'])
+def live_recognition_status():
+    """Endpoint para consultar o reconhecimento ao vivo"""
+    try:
+        result = audio_controller.get_live_status()
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/recognize/live/stop', methods=['POST'])
+def stop_live_recognition():
+    """Endpoint para interromper o reconhecimento ao vivo"""
+    try:
+        result = audio_controller.stop_live_recognition()
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/history', methods=['GET'])
+def get_history():
+    """Histórico de reconhecimentos (paginado por cursor)"""
+    try:
+        limit = page_limit()
+        cursor = request.args.get('cursor')
+        return jsonify(recognition_controller.get_recognition_history(limit, cursor))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/history/<recognition_id>', methods=['GET'])
+def get_history_item(recognition_id):
+    """Obtém um reconhecimento do histórico"""
+    try:
+        recognition = recognition_controller.get_recognition_by_id(recognition_id)
+        if recognition:
+            return jsonify(recognition)
+        else:
+            return jsonify({'error': 'Reconhecimento não encontrado'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'ok', 'message': 'Song Recognition API funcionando'})
 
+@app.route('/metrics')
+def get_metrics():
+    """Latências por etapa (janela deslizante), contadores e estado da fila e do índice"""
+    snapshot = metrics.snapshot()
+    job_stats = recognition_controller.get_job_stats()
+    if job_stats is not None:
+        snapshot['recognition_jobs'] = job_stats
+    
+    if recognition_controller.result_cache is not None:
+        snapshot['recognition_cache'] = recognition_controller.result_cache.get_stats()
+    
+    fingerprint_system = recognition_controller.recognition_service.fingerprint_system
+    snapshot['fingerprint_lookup'] = fingerprint_system.get_lookup_stats()
+    return jsonify(snapshot)
+
 # Endpoints para gerenciamento do banco de músicas
 @app.route('/api/songs', methods=['GET'])
 def get_songs():
@@ -77,12 +243,15 @@ def get_songs():
         artist = request.args.get('artist', '')
         genre = request.args.get('genre', '')
         year = request.args.get('year', type=int)
-        limit = request.args.get('limit', 50, type=int)
+        limit = page_limit()
+        cursor = request.args.get('cursor')
         
-        songs = music_database.search_songs(
-            query=query, artist=artist, genre=genre, year=year, limit=limit
+        page = music_database.search_songs_page(
+            query=query, artist=artist, genre=genre, year=year, limit=limit, cursor=cursor
         )
-        return jsonify({'songs': songs})
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -108,6 +277,16 @@ def get_similar_songs(song_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/songs/<int:song_id>/sounds-like', methods=['GET'])
+def get_songs_like(song_id):
+    """Obtém músicas com timbre parecido"""
+    try:
+        limit = request.args.get('limit', 10, type=int)
+        songs = music_database.get_songs_like(song_id, limit)
+        return jsonify({'songs': songs})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/songs', methods=['POST'])
 def add_song():
     """Adiciona nova música ao banco"""
@@ -177,5 +356,27 @@ def create_playlist():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/playlists/seed', methods=['POST'])
+def create_seeded_playlist():
+    """Cria playlist a partir de músicas semente (timbre parecido)"""
+    try:
+        data = request.get_json()
+        name = data.get('name')
+        seed_song_ids = data.get('seed_song_ids') or []
+        
+        if not name or not seed_song_ids:
+            return jsonify({'error': 'Nome da playlist e músicas semente são obrigatórios'}), 400
+        
+        result = music_database.create_playlist_from_seeds(
+            name, seed_song_ids, data.get('size', 20), data.get('description')
+        )
+        if result:
+            return jsonify(dict(result, message='Playlist criada com sucesso'))
+        else:
+            return jsonify({'error': 'Erro ao criar playlist'}), 500
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Benchmark de reconhecimento
+Monta um corpus (sintético e determinístico, ou uma pasta local), indexa em um
+banco isolado, recorta trechos de consulta com transformações configuráveis e
+mede throughput de ingestão, tamanho do índice, latência por etapa da consulta
+e acurácia. O resultado sai em JSON para comparar execuções entre commits.
+
+Uso:
+    python benchmark.py [--songs 50 | --corpus <diretório>] [opções] [--output resultado.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import subprocess
+import tempfile
+import contextlib
+import numpy as np
+import soundfile as sf
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from services.audio_fingerprint import AudioFingerprint
+from services.audio_decoder import RESAMPLERS, resample
+from populate_database import create_sample_audio_file
+
+AUDIO_EXTENSIONS = {'.wav', '.mp3', '.flac', '.ogg', '.m4a', '.aac'}
+STAGES = ('decode', 'fingerprint', 'lookup', 'score')
+
+def build_corpus(args, work_dir: str) -> Tuple[List[str], List[str]]:
+    """Retorna (arquivos indexados, arquivos fora do índice para medir falsos positivos)"""
+    rng = np.random.default_rng(args.seed)
+    
+    if args.corpus:
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(args.corpus)
+            for name in names
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS
+        )
+        paths = [paths[i] for i in rng.permutation(len(paths))]
+        negatives = min(args.negatives, max(0, len(paths) - 1))
+        return paths[negatives:], paths[:negatives]
+    
+    corpus_dir = os.path.join(work_dir, 'corpus')
+    os.makedirs(corpus_dir, exist_ok=True)
+    
+    paths = []
+    for i in range(args.songs + args.negatives):
+        seed = args.seed * 100000 + i
+        path = os.path.join(corpus_dir, f'song_{seed}_{int(args.song_duration)}s.wav')
+        if not os.path.exists(path):
+            create_sample_audio_file(path, seed=seed, duration=args.song_duration)
+        paths.append(path)
+    
+    return paths[:args.songs], paths[args.songs:]
+
+def ingest(fingerprint_system: AudioFingerprint, paths: List[str]) -> Tuple[Dict[str, int], Dict]:
+    """Gera fingerprints e grava o corpus no índice, medindo o throughput"""
+    start = time.perf_counter()
+    songs, audio_seconds = [], 0.0
+    
+    for path in paths:
+        hashes, offsets, duration = fingerprint_system.fingerprint_file(path)
+        audio_seconds += duration
+        songs.append({
+            'title': os.path.basename(path),
+            'artist': 'benchmark',
+            'file_path': path,
+            'duration': duration,
+            'hashes': hashes,
+            'offsets': offsets
+        })
+    fingerprint_time = time.perf_counter() - start
+    
+    song_ids = fingerprint_system.add_fingerprinted_songs(songs)
+    total_time = time.perf_counter() - start
+    total_hashes = sum(len(song['hashes']) for song in songs)
+    
+    stats = {
+        'songs': len(songs),
+        'audio_seconds': audio_seconds,
+        'hashes': total_hashes,
+        'fingerprint_seconds': fingerprint_time,
+        'total_seconds': total_time,
+        'songs_per_second': len(songs) / total_time if total_time > 0 else 0,
+        'audio_seconds_per_second': audio_seconds / total_time if total_time > 0 else 0,
+        'hashes_per_second': total_hashes / total_time if total_time > 0 else 0
+    }
+    return dict(zip(paths, song_ids)), stats
+
+def directory_size(path: str) -> int:
+    """Tamanho total (bytes) dos arquivos de um diretório"""
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+def parse_conditions(args) -> List[Dict]:
+    """Combinações de transformações aplicadas aos trechos de consulta"""
+    snrs = [None if value == 'clean' else float(value) for value in args.snrs]
+    rates = [rate or None for rate in args.resample_rates]
+    return [
+        {'clip_seconds': length, 'snr_db': snr, 'gain_db': gain, 'sample_rate': rate}
+        for length, snr, gain, rate in itertools.product(args.lengths, snrs, args.gains, rates)
+    ]
+
+def condition_name(condition: Dict) -> str:
+    """Nome curto e estável de uma condição (chave no JSON)"""
+    snr = 'clean' if condition['snr_db'] is None else f"snr{condition['snr_db']:g}"
+    rate = 'native' if condition['sample_rate'] is None else f"{condition['sample_rate']}hz"
+    return f"{condition['clip_seconds']:g}s_{snr}_gain{condition['gain_db']:g}_{rate}"
+
+def make_clip(path: str, condition: Dict, rng: np.random.Generator, clip_path: str) -> Optional[float]:
+    """Recorta e transforma um trecho do arquivo, gravando-o em clip_path; retorna o offset (s)"""
+    info = sf.info(path)
+    length = int(condition['clip_seconds'] * info.samplerate)
+    if info.frames <= length:
+        start = 0
+    else:
+        start = int(rng.integers(0, info.frames - length))
+    
+    y, sr = sf.read(path, start=start, stop=start + length, dtype='float32', always_2d=True)
+    y = y.mean(axis=1)
+    if len(y) == 0:
+        return None
+    
+    y = y * 10 ** (condition['gain_db'] / 20)
+    
+    if condition['snr_db'] is not None:
+        signal_power = np.mean(y ** 2) or 1e-12
+        noise_power = signal_power / 10 ** (condition['snr_db'] / 10)
+        y = y + rng.standard_normal(len(y)).astype(np.float32) * np.sqrt(noise_power)
+    
+    if condition['sample_rate'] is not None and condition['sample_rate'] != sr:
+        y = resample(y, sr, condition['sample_rate'], 'soxr_hq')
+        sr = condition['sample_rate']
+    
+    # Captura real: PCM 16 bits, com saturação
+    sf.write(clip_path, np.clip(y, -1.0, 1.0), sr, subtype='PCM_16')
+    return start / info.samplerate
+
+def run_query(fingerprint_system: AudioFingerprint, clip_path: str, top_k: int) -> Tuple[List[Dict], Dict]:
+    """Consulta um trecho medindo cada etapa (decodificação, fingerprint, busca, pontuação)"""
+    timings = {}
+    
+    start = time.perf_counter()
+    y = fingerprint_system.load_audio(clip_path)
+    timings['decode'] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    hashes, offsets = fingerprint_system.fingerprint_signal(y)
+    timings['fingerprint'] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    if len(hashes):
+        song_ids, deltas = fingerprint_system._find_candidate_matches(hashes, offsets)
+    else:
+        song_ids, deltas = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+    timings['lookup'] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    candidates = fingerprint_system._calculate_match_scores(song_ids, deltas, top_k)
+    timings['score'] = time.perf_counter() - start
+    
+    timings['total'] = sum(timings[stage] for stage in STAGES)
+    return candidates, timings
+
+def exhaustive_candidates(fingerprint_system: AudioFingerprint, clip_path: str, top_k: int) -> List[Dict]:
+    """Candidatas da busca exaustiva, para comparar com a busca em dois estágios"""
+    matcher = fingerprint_system.matcher
+    fingerprint_system.matcher = 'exhaustive'
+    try:
+        return run_query(fingerprint_system, clip_path, top_k)[0]
+    finally:
+        fingerprint_system.matcher = matcher
+
+def latency_summary(samples: List[float]) -> Dict:
+    """Percentis de latência em milissegundos"""
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    return {
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p90_ms': float(np.percentile(values, 90)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max())
+    }
+
+def summarize(outcomes: List[Dict]) -> Dict:
+    """Acurácia e latências de um conjunto de consultas"""
+    positives = [outcome for outcome in outcomes if outcome['expected'] is not None]
+    negatives = [outcome for outcome in outcomes if outcome['expected'] is None]
+    
+    # Busca em dois estágios: quanto das respostas da busca exaustiva foi mantido
+    compared = [outcome for outcome in outcomes if 'exhaustive_predicted' in outcome]
+    exhaustive_matches = [outcome for outcome in compared if outcome['exhaustive_predicted'] is not None]
+    
+    correct = sum(1 for outcome in positives if outcome['predicted'] == outcome['expected'])
+    wrong = sum(1 for outcome in positives if outcome['predicted'] not in (None, outcome['expected']))
+    false_positives = sum(1 for outcome in negatives if outcome['predicted'] is not None)
+    in_top_k = sum(1 for outcome in positives if outcome['expected'] in outcome['candidates'])
+    
+    return {
+        'queries': len(outcomes),
+        'positives': len(positives),
+        'negatives': len(negatives),
+        'top1_accuracy': correct / len(positives) if positives else None,
+        'top_k_recall': in_top_k / len(positives) if positives else None,
+        'wrong_match_rate': wrong / len(positives) if positives else None,
+        'false_positive_rate': false_positives / len(negatives) if negatives else None,
+        'agreement_with_exhaustive': (
+            sum(1 for outcome in compared if outcome['predicted'] == outcome['exhaustive_predicted']) / len(compared)
+            if compared else None
+        ),
+        'recall_vs_exhaustive': (
+            sum(1 for outcome in exhaustive_matches if outcome['predicted'] == outcome['exhaustive_predicted'])
+            / len(exhaustive_matches) if exhaustive_matches else None
+        ),
+        'latency': {
+            stage: latency_summary([outcome['timings'][stage] for outcome in outcomes])
+            for stage in STAGES + ('total',)
+        }
+    }
+
+def git_commit() -> Optional[str]:
+    """Commit atual do repositório (se houver)"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(args) -> Dict:
+    """Executa o benchmark completo e retorna o relatório"""
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='song_benchmark_')
+    index_dir = os.path.join(work_dir, 'index')
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.makedirs(index_dir)
+    
+    indexed, held_out = build_corpus(args, work_dir)
+    if not indexed:
+        raise ValueError('Corpus vazio')
+    
+    fingerprint_system = AudioFingerprint(os.path.join(index_dir, 'fingerprints.db'))
+    fingerprint_system.resampler = args.resampler
+    fingerprint_system.matcher = args.matcher
+    fingerprint_system.shortlist_size = args.shortlist_size
+    fingerprint_system.shortlist_sample_rate = args.shortlist_sample_rate
+    if args.max_df_ratio is not None:
+        fingerprint_system.index.max_df_ratio = args.max_df_ratio or None
+    if args.min_stop_df is not None:
+        fingerprint_system.index.min_stop_df = args.min_stop_df
+    song_ids, ingest_stats = ingest(fingerprint_system, indexed)
+    
+    if args.prune:
+        ingest_stats['prune'] = fingerprint_system.index.prune_common_hashes()
+    
+    rng = np.random.default_rng(args.seed + 1)
+    clip_path = os.path.join(work_dir, 'query.wav')
+    conditions = parse_conditions(args)
+    
+    results, all_outcomes = {}, []
+    for condition in conditions:
+        outcomes = []
+        queries = [(path, song_ids[path]) for path in rng.choice(indexed, args.queries)]
+        if held_out:
+            queries += [(path, None) for path in rng.choice(held_out, args.negative_queries)]
+        
+        for path, expected in queries:
+            if make_clip(path, condition, rng, clip_path) is None:
+                continue
+            candidates, timings = run_query(fingerprint_system, clip_path, args.top_k)
+            
+            best = candidates[0] if candidates else None
+            predicted = best['song_id'] if best and best['score'] >= args.threshold else None
+            outcome = {
+                'expected': expected,
+                'predicted': predicted,
+                'candidates': [candidate['song_id'] for candidate in candidates],
+                'timings': timings
+            }
+            
+            if args.matcher == 'two_stage':
+                reference = exhaustive_candidates(fingerprint_system, clip_path, args.top_k)
+                best = reference[0] if reference else None
+                outcome['exhaustive_predicted'] = best['song_id'] if best and best['score'] >= args.threshold else None
+            outcomes.append(outcome)
+        
+        results[condition_name(condition)] = dict(summarize(outcomes), condition=condition)
+        all_outcomes.extend(outcomes)
+    
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'params': {
+            'corpus': args.corpus,
+            'songs': len(indexed),
+            'held_out_songs': len(held_out),
+            'song_duration': args.song_duration if not args.corpus else None,
+            'seed': args.seed,
+            'queries_per_condition': args.queries,
+            'negative_queries_per_condition': args.negative_queries if held_out else 0,
+            'threshold': args.threshold,
+            'top_k': args.top_k,
+            'resampler': args.resampler,
+            'max_df_ratio': fingerprint_system.index.max_df_ratio,
+            'min_stop_df': fingerprint_system.index.min_stop_df,
+            'prune': args.prune,
+            'matcher': args.matcher,
+            'shortlist_size': args.shortlist_size if args.matcher == 'two_stage' else None,
+            'shortlist_sample_rate': args.shortlist_sample_rate if args.matcher == 'two_stage' else None
+        },
+        'ingest': ingest_stats,
+        'index': {
+            'index_bytes': directory_size(os.path.join(index_dir, 'fingerprint_index')),
+            'database_bytes': os.path.getsize(os.path.join(index_dir, 'fingerprints.db')),
+            'stats': fingerprint_system.index.get_stats()
+        },
+        'conditions': results,
+        'overall': summarize(all_outcomes)
+    }
+    
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    return report
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description='Benchmark de acurácia e throughput do reconhecimento')
+    parser.add_argument('--corpus', help='Diretório com áudios (padrão: corpus sintético)')
+    parser.add_argument('--songs', type=int, default=50, help='Músicas sintéticas indexadas')
+    parser.add_argument('--negatives', type=int, default=10, help='Músicas fora do índice (falsos positivos)')
+    parser.add_argument('--song-duration', type=float, default=30.0, help='Duração das músicas sintéticas (s)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed do corpus e dos trechos')
+    parser.add_argument('--queries', type=int, default=50, help='Consultas positivas por condição')
+    parser.add_argument('--negative-queries', type=int, default=20, help='Consultas negativas por condição')
+    parser.add_argument('--lengths', type=float, nargs='+', default=[5.0, 10.0], help='Duração dos trechos (s)')
+    parser.add_argument('--snrs', nargs='+', default=['clean', '10', '0'],
+                        help="Relação sinal-ruído dos trechos em dB ('clean' = sem ruído)")
+    parser.add_argument('--gains', type=float, nargs='+', default=[0.0], help='Ganho aplicado aos trechos (dB)')
+    parser.add_argument('--resample-rates', type=int, nargs='+', default=[0],
+                        help='Taxa de amostragem dos trechos (0 = original)')
+    parser.add_argument('--threshold', type=float, default=0.3, help='Confiança mínima para aceitar um match')
+    parser.add_argument('--top-k', type=int, default=5, help='Candidatas retornadas por consulta')
+    parser.add_argument('--resampler', choices=RESAMPLERS, default=None,
+                        help='Reamostrador da decodificação das consultas (padrão: AUDIO_RESAMPLER ou soxr_hq)')
+    parser.add_argument('--max-df-ratio', type=float, default=None,
+                        help='Fração de músicas acima da qual um hash é ignorado na consulta (0 desliga)')
+    parser.add_argument('--min-stop-df', type=int, default=None,
+                        help='Mínimo de músicas para um hash ser considerado comum')
+    parser.add_argument('--prune', action='store_true', help='Podar hashes comuns do índice após a ingestão')
+    parser.add_argument('--matcher', choices=['exhaustive', 'two_stage'], default='exhaustive',
+                        help='Busca exaustiva ou em dois estágios (relata a concordância com a exaustiva)')
+    parser.add_argument('--shortlist-size', type=int, default=200, help='Músicas verificadas no segundo estágio')
+    parser.add_argument('--shortlist-sample-rate', type=float, default=0.25,
+                        help='Fração dos hashes da consulta usada no primeiro estágio')
+    parser.add_argument('--work-dir', help='Diretório de trabalho mantido entre execuções (corpus e índice)')
+    parser.add_argument('--output', help='Arquivo JSON de saída (padrão: stdout)')
+    args = parser.parse_args()
+    
+    # Mensagens de progresso vão para stderr; stdout fica só com o JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_benchmark(args)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        overall = report['overall']
+        print(f"✅ Resultado salvo em {args.output}: acurácia top-1 {overall['top1_accuracy']}, "
+              f"falsos positivos {overall['false_positive_rate']}, "
+              f"p50 {overall['latency']['total'].get('p50_ms', 0):.1f} ms", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
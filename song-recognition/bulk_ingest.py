@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Ingestão em massa de músicas
+Decodifica e gera fingerprints em paralelo (um processo por núcleo) e grava os
+resultados em lotes por um único escritor. O progresso por arquivo fica salvo,
+então uma execução interrompida continua de onde parou.
+
+Uso:
+    python bulk_ingest.py <diretório | manifesto.json | manifesto.csv> [opções]
+"""
+import os
+import sys
+import csv
+import json
+import time
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Tuple
+from services.music_database import MusicDatabase
+from services.audio_fingerprint import AudioFingerprint
+from services.audio_analyzer import AudioAnalyzer
+from services.ingestion_pipeline import IngestionPipeline
+
+AUDIO_EXTENSIONS = {'.wav', '.mp3', '.flac', '.ogg', '.m4a', '.aac'}
+
+# Pipeline de cada processo de trabalho (criado uma vez por processo)
+_worker_pipeline = None
+
+def _init_worker(fingerprint_db_path: str, analyze: bool):
+    """Inicializa o pipeline dentro do processo de trabalho"""
+    global _worker_pipeline
+    fingerprint_system = AudioFingerprint(fingerprint_db_path)
+    audio_analyzer = AudioAnalyzer() if analyze else None
+    _worker_pipeline = IngestionPipeline(fingerprint_system, audio_analyzer, None)
+
+def _process_entry(entry: Dict, analyze: bool) -> Dict:
+    """Decodifica, gera fingerprint e (opcionalmente) analisa um arquivo"""
+    try:
+        processed = _worker_pipeline.process(entry['file_path'], analyze=analyze)
+        if not processed:
+            return {'entry': entry, 'processed': None, 'error': 'Falha ao processar áudio'}
+        if len(processed['hashes']) == 0:
+            return {'entry': entry, 'processed': None, 'error': 'Nenhum fingerprint gerado'}
+        return {'entry': entry, 'processed': processed, 'error': None}
+    except Exception as e:
+        return {'entry': entry, 'processed': None, 'error': str(e)}
+
+class IngestState:
+    """Status de ingestão por arquivo, usado para retomar execuções interrompidas"""
+    
+    def __init__(self, db_path='data/ingest_state.db'):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ingest_files (
+                    file_path TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    song_id INTEGER,
+                    error TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.commit()
+    
+    def pending(self, entries: List[Dict], retry_failed: bool = False) -> List[Dict]:
+        """Filtra entradas que ainda precisam ser processadas"""
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute('SELECT file_path, status FROM ingest_files').fetchall()
+        
+        status = dict(rows)
+        skip = {'done'} if retry_failed else {'done', 'failed'}
+        return [e for e in entries if status.get(e['file_path']) not in skip]
+    
+    def mark(self, results: List[tuple]):
+        """Registra (file_path, status, song_id, error) de vários arquivos"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO ingest_files (file_path, status, song_id, error, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', results)
+            conn.commit()
+
+def load_entries(source: str) -> List[Dict]:
+    """Lê as músicas a ingerir de um diretório ou manifesto (JSON ou CSV)"""
+    if os.path.isdir(source):
+        entries = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                    entries.append(_entry_from_filename(os.path.join(root, name)))
+        return entries
+    
+    if source.lower().endswith('.json'):
+        with open(source, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+    else:
+        with open(source, 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f))
+    
+    entries = []
+    for row in rows:
+        entry = _entry_from_filename(row['file_path'])
+        entry.update({k: v for k, v in row.items() if v not in (None, '')})
+        if entry.get('year'):
+            entry['year'] = int(entry['year'])
+        entries.append(entry)
+    return entries
+
+def _entry_from_filename(file_path: str) -> Dict:
+    """Monta metadados a partir do nome do arquivo ('Artista - Título.ext')"""
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    if ' - ' in stem:
+        artist, title = stem.split(' - ', 1)
+    else:
+        artist, title = 'Artista Desconhecido', stem
+    return {'file_path': file_path, 'title': title.strip(), 'artist': artist.strip()}
+
+def write_batch(pipeline: IngestionPipeline, music_db: MusicDatabase, state: IngestState,
+                batch: List[Dict]) -> Tuple[int, int, int]:
+    """Grava um lote de resultados e atualiza o status dos arquivos
+    
+    Retorna (arquivos gravados, arquivos que já estavam no catálogo, hashes gravados).
+    """
+    to_write, statuses = [], []
+    
+    for result in batch:
+        entry = result['entry']
+        existing = music_db.get_song_by_path(entry['file_path'])
+        if existing:
+            statuses.append((entry['file_path'], 'done', existing['id'], None))
+            continue
+        to_write.append(dict(entry, processed=result['processed']))
+    
+    song_ids = pipeline.write_batch(to_write)
+    statuses.extend((item['file_path'], 'done', song_id, None) for item, song_id in zip(to_write, song_ids))
+    state.mark(statuses)
+    
+    return len(to_write), len(batch) - len(to_write), sum(len(item['processed']['hashes']) for item in to_write)
+
+def run(source: str, workers: int, batch_size: int, analyze: bool, retry_failed: bool,
+        state_path: str) -> Optional[Dict]:
+    """Executa a ingestão em massa"""
+    entries = load_entries(source)
+    state = IngestState(state_path)
+    pending = state.pending(entries, retry_failed)
+    
+    print(f"📂 {len(entries)} arquivos encontrados, {len(pending)} pendentes")
+    if not pending:
+        return None
+    
+    music_db = MusicDatabase()
+    pipeline = music_db.pipeline
+    index = music_db.fingerprint_system.index
+    
+    # Durante a carga, os segmentos são mesclados uma única vez no final
+    index.max_write_segments = sys.maxsize
+    
+    start = time.perf_counter()
+    done = skipped = failed = total_hashes = 0
+    batch = []
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(music_db.fingerprint_system.db_path, analyze)) as executor:
+        queue = iter(pending)
+        in_flight = set()
+        
+        while True:
+            # Manter a fila de trabalho limitada para não acumular resultados em memória
+            while len(in_flight) < workers * 4:
+                entry = next(queue, None)
+                if entry is None:
+                    break
+                in_flight.add(executor.submit(_process_entry, entry, analyze))
+            
+            if not in_flight:
+                break
+            
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                result = future.result()
+                if result['error']:
+                    failed += 1
+                    state.mark([(result['entry']['file_path'], 'failed', None, result['error'])])
+                    print(f"❌ {result['entry']['file_path']}: {result['error']}")
+                    continue
+                
+                batch.append(result)
+                if len(batch) >= batch_size:
+                    written, already, hashes = write_batch(pipeline, music_db, state, batch)
+                    done, skipped, total_hashes = done + written, skipped + already, total_hashes + hashes
+                    batch = []
+                    print(f"🔄 {done + skipped + failed}/{len(pending)} arquivos processados "
+                          f"({skipped} já no catálogo)")
+    
+    if batch:
+        written, already, hashes = write_batch(pipeline, music_db, state, batch)
+        done, skipped, total_hashes = done + written, skipped + already, total_hashes + hashes
+    
+    print("🔄 Mesclando segmentos do índice...")
+    index.merge()
+    
+    elapsed = time.perf_counter() - start
+    return {
+        'files_done': done,
+        'files_skipped': skipped,
+        'files_failed': failed,
+        'hashes': total_hashes,
+        'elapsed_seconds': elapsed,
+        'files_per_second': done / elapsed if elapsed > 0 else 0,
+        'hashes_per_second': total_hashes / elapsed if elapsed > 0 else 0
+    }
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description='Ingestão em massa de músicas')
+    parser.add_argument('source', help='Diretório com áudios ou manifesto (.json/.csv com file_path, title, artist...)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processos de trabalho')
+    parser.add_argument('--batch-size', type=int, default=100, help='Músicas por transação')
+    parser.add_argument('--no-analysis', action='store_true', help='Gerar apenas fingerprints (sem análise)')
+    parser.add_argument('--retry-failed', action='store_true', help='Reprocessar arquivos que falharam')
+    parser.add_argument('--state', default='data/ingest_state.db', help='Arquivo de progresso')
+    args = parser.parse_args()
+    
+    print("🎵 Song Recognition - Ingestão em Massa")
+    print("=" * 60)
+    
+    report = run(args.source, args.workers, args.batch_size, not args.no_analysis,
+                 args.retry_failed, args.state)
+    
+    if report is None:
+        print("✅ Nada a fazer")
+        return
+    
+    print("\n" + "=" * 60)
+    print(f"📊 Resumo:")
+    print(f"   ✅ Arquivos ingeridos: {report['files_done']}")
+    print(f"   ⏭️  Já no catálogo: {report['files_skipped']}")
+    print(f"   ❌ Arquivos com erro: {report['files_failed']}")
+    print(f"   🔑 Hashes gravados: {report['hashes']}")
+    print(f"   ⏱️  Tempo total: {report['elapsed_seconds']:.1f}s")
+    print(f"   🚀 {report['files_per_second']:.2f} arquivos/s, {report['hashes_per_second']:.0f} hashes/s")
+
+if __name__ == '__main__':
+    main()
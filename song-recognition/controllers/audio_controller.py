@@ -7,6 +7,7 @@ import time
 from datetime import datetime
 from models.audio_model import AudioModel
 from services.audio_service import AudioService
+from services.live_recognition import LiveRecognizer
 
 class AudioController:
     def __init__(self):
@@ -16,6 +17,11 @@ class AudioController:
         self.recording_thread = None
         self.recording_start_time = None
         
+        # Reconhecimento ao vivo (fingerprint criado sob demanda)
+        self.fingerprint_system = None
+        self.live_recognizer = None
+        self.live_thread = None
+        
     def start_recording(self):
         """Inicia a gravação de áudio"""
         if self.is_recording:
@@ -83,3 +89,60 @@ class AudioController:
             'is_recording': self.is_recording,
             'start_time': self.recording_start_time.isoformat() if self.recording_start_time else None
         }
+    
+    def start_live_recognition(self, max_seconds: float = 15.0):
+        """Inicia gravação com reconhecimento incremental"""
+        if self.is_recording:
+            return {'error': 'Gravação já está em andamento'}
+        
+        try:
+            if self.fingerprint_system is None:
+                from services.audio_fingerprint import AudioFingerprint
+                self.fingerprint_system = AudioFingerprint()
+            
+            self.live_recognizer = LiveRecognizer(self.fingerprint_system, self.audio_service.sample_rate)
+            self.live_recognizer.max_seconds = max_seconds
+            self.is_recording = True
+            self.recording_start_time = datetime.now()
+            
+            self.live_thread = threading.Thread(target=self._record_live, args=(self.live_recognizer,))
+            self.live_thread.start()
+            
+            return {
+                'status': 'success',
+                'message': 'Reconhecimento ao vivo iniciado',
+                'start_time': self.recording_start_time.isoformat()
+            }
+        except Exception as e:
+            self.is_recording = False
+            return {'error': f'Erro ao iniciar reconhecimento ao vivo: {str(e)}'}
+    
+    def _record_live(self, recognizer: LiveRecognizer):
+        """Grava e entrega cada bloco ao reconhecedor até ele decidir"""
+        try:
+            self.audio_service.record_audio(
+                recognizer.max_seconds,
+                on_chunk=lambda data: recognizer.push_pcm(data) or not self.is_recording
+            )
+        except Exception as e:
+            print(f"Erro no reconhecimento ao vivo: {str(e)}")
+        finally:
+            recognizer.finish()
+            self.is_recording = False
+    
+    def get_live_status(self):
+        """Retorna o estado do reconhecimento ao vivo (candidata atual ou resultado)"""
+        if self.live_recognizer is None:
+            return {'error': 'Nenhum reconhecimento ao vivo iniciado'}
+        return self.live_recognizer.get_status()
+    
+    def stop_live_recognition(self):
+        """Interrompe o reconhecimento ao vivo e retorna o melhor resultado até agora"""
+        if self.live_recognizer is None:
+            return {'error': 'Nenhum reconhecimento ao vivo iniciado'}
+        
+        self.is_recording = False
+        if self.live_thread:
+            self.live_thread.join(timeout=5)
+        
+        return self.live_recognizer.get_status()
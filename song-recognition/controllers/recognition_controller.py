@@ -3,7 +3,11 @@ Controlador para gerenciar reconhecimento de músicas
 """
 from services.recognition_service import RecognitionService
 from services.audio_service import AudioService
+from services.recognition_jobs import RecognitionJobQueue, QueueFullError
+from services.recognition_cache import RecognitionCache
 from models.recognition_model import RecognitionModel
+from services.metrics import trace, stage
+from functools import partial
 import os
 
 class RecognitionController:
@@ -11,22 +15,60 @@ class RecognitionController:
         self.recognition_service = RecognitionService()
         self.audio_service = AudioService()
         self.recognition_model = RecognitionModel()
+        self._job_queue = None
+        
+        # Diretório de onde /recognize/batch aceita caminhos locais (sem INGEST_ROOT, só uploads)
+        self.ingest_root = os.getenv('INGEST_ROOT')
+        
+        # Cache de resultados para trechos reenviados (RECOGNITION_CACHE_SIZE=0 desliga)
+        cache_size = int(os.getenv('RECOGNITION_CACHE_SIZE', 1024))
+        self.result_cache = RecognitionCache(
+            self.recognition_service.fingerprint_system,
+            max_entries=cache_size,
+            ttl_seconds=float(os.getenv('RECOGNITION_CACHE_TTL', 600))
+        ) if cache_size > 0 else None
+    
+    @property
+    def job_queue(self) -> RecognitionJobQueue:
+        """Fila de reconhecimentos assíncronos (pool criado no primeiro uso)"""
+        if self._job_queue is None:
+            self._job_queue = RecognitionJobQueue(
+                max_workers=int(os.getenv('RECOGNITION_WORKERS', 0)) or None,
+                max_queue=int(os.getenv('RECOGNITION_QUEUE_SIZE', 32)),
+                on_result=self._save_result
+            )
+        return self._job_queue
+    
+    def _save_result(self, recognition_result):
+        """Salva no histórico os reconhecimentos bem-sucedidos"""
+        if recognition_result.get('success'):
+            self.recognition_model.save_recognition(recognition_result)
     
     def recognize_song(self, audio_file):
         """Reconhece uma música a partir de um arquivo de áudio"""
         try:
-            # Salvar arquivo temporariamente
-            temp_path = self.audio_service.save_temp_audio(audio_file)
-            
-            # Processar áudio para extrair características
-            audio_features = self.audio_service.extract_features(temp_path)
-            
-            # Tentar reconhecimento usando múltiplos serviços
-            recognition_result = self.recognition_service.recognize(audio_features, temp_path)
-            
-            # Salvar resultado no modelo
-            if recognition_result.get('success'):
-                self.recognition_model.save_recognition(recognition_result)
+            with trace('recognize'):
+                # Salvar arquivo temporariamente
+                with stage('upload'):
+                    temp_path = self.audio_service.save_temp_audio(audio_file)
+                
+                # Mesmo trecho (ou captura quase idêntica) reconhecido há pouco
+                signature, fingerprint, recognition_result = self._lookup_cache(temp_path)
+                
+                if recognition_result is None:
+                    # Processar áudio para extrair características
+                    with stage('feature_extraction'):
+                        audio_features = self.audio_service.extract_features(temp_path)
+                    
+                    # Tentar reconhecimento usando múltiplos serviços
+                    recognition_result = self.recognition_service.recognize(audio_features, temp_path, fingerprint)
+                    
+                    if signature is not None:
+                        self.result_cache.put(signature, recognition_result)
+                
+                # Salvar resultado no modelo
+                with stage('history'):
+                    self._save_result(recognition_result)
             
             # Limpar arquivo temporário
             self.audio_service.cleanup_temp_file(temp_path)
@@ -40,10 +82,111 @@ class RecognitionController:
                 'message': 'Não foi possível reconhecer a música'
             }
     
-    def get_recognition_history(self):
-        """Retorna histórico de reconhecimentos"""
+    def _lookup_cache(self, temp_path):
+        """Consulta o cache de resultados: retorna (assinatura, fingerprint, resultado ou None)
+        
+        Sem cache, retorna (None, None, None).
+        """
+        if self.result_cache is None:
+            return None, None, None
+        
+        with stage('cache_lookup'):
+            # Sinal e fingerprint calculados uma vez: chave do cache e busca no índice
+            fingerprint_system = self.recognition_service.fingerprint_system
+            y = fingerprint_system.load_audio(temp_path)
+            fingerprint = fingerprint_system.fingerprint_signal(y)
+            signature = self.result_cache.signature(y, fingerprint[0])
+            return signature, fingerprint, self.result_cache.get(signature)
+    
+    def submit_recognition(self, audio_file) -> str:
+        """Enfileira o reconhecimento de um arquivo e retorna o id do job
+        
+        Trechos já no cache de resultados viram um job concluído sem passar pelo pool;
+        os demais são guardados no cache ao final do job. Gera QueueFullError quando a
+        fila está cheia.
+        """
+        temp_path = self.audio_service.save_temp_audio(audio_file)
+        try:
+            signature, fingerprint, cached_result = self._lookup_cache(temp_path)
+        except Exception as e:
+            # O job relata o erro de decodificação
+            print(f"Erro ao consultar cache de reconhecimento: {str(e)}")
+            signature, fingerprint, cached_result = None, None, None
+        
+        if cached_result is not None:
+            self.audio_service.cleanup_temp_file(temp_path)
+            self._save_result(cached_result)
+            return self.job_queue.submit_result(cached_result)
+        
+        on_result = partial(self.result_cache.put, signature) if signature is not None else None
+        
+        try:
+            return self.job_queue.submit(temp_path, fingerprint, on_result)
+        except QueueFullError:
+            self.audio_service.cleanup_temp_file(temp_path)
+            raise
+    
+    def get_job_stats(self):
+        """Contadores da fila de reconhecimentos (None se ela ainda não foi criada)"""
+        return self._job_queue.get_stats() if self._job_queue is not None else None
+    
+    def resolve_ingest_path(self, path):
+        """Caminho real de um arquivo dentro de INGEST_ROOT (None se estiver fora ou desabilitado)"""
+        if not self.ingest_root or not isinstance(path, str):
+            return None
+        
+        root = os.path.realpath(self.ingest_root)
+        resolved = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, resolved]) != root:
+            return None
+        return resolved
+    
+    def recognize_batch(self, audio_files=None, audio_paths=None):
+        """Reconhece vários trechos: fingerprints em paralelo e uma única busca no índice
+        
+        Recebe arquivos enviados (audio_files) ou caminhos locais já validados por
+        resolve_ingest_path (audio_paths) e retorna um resultado por trecho, na mesma ordem.
+        """
+        with trace('recognize_batch'):
+            with stage('upload'):
+                temp_paths = [self.audio_service.save_temp_audio(audio_file) for audio_file in audio_files or []]
+            paths = temp_paths + list(audio_paths or [])
+            
+            try:
+                with stage('fingerprint_batch'):
+                    fingerprints = self.job_queue.fingerprint_batch(paths)
+                fingerprint_system = self.recognition_service.fingerprint_system
+                matches = fingerprint_system.find_matching_songs_batch(fingerprints, top_k=1)
+            finally:
+                for temp_path in temp_paths:
+                    self.audio_service.cleanup_temp_file(temp_path)
+        
+        # Mesmo limiar e mesmo formato de resultado do reconhecimento de um trecho
+        results = []
+        for path, (hashes, _), candidates in zip(paths, fingerprints, matches):
+            if len(hashes) == 0:
+                result = {'success': False, 'message': 'Não foi possível gerar fingerprint do trecho'}
+            else:
+                result = self.recognition_service.fingerprint_result(fingerprint_system.best_match(candidates))
+                if result['success']:
+                    self._save_result(dict(result))
+            
+            if audio_paths and path not in temp_paths:
+                result['file_path'] = path
+            results.append(result)
+        
+        return results
+    
+    def get_job_status(self, job_id, wait=0):
+        """Estado de um job de reconhecimento (None se não existir)"""
+        return self.job_queue.get_status(job_id, wait)
+    
+    def get_recognition_history(self, limit: int = 50, cursor: str = None):
+        """Retorna uma página do histórico de reconhecimentos"""
         try:
-            return self.recognition_model.get_history()
+            return self.recognition_model.get_history_page(limit, cursor)
+        except ValueError:
+            raise
         except Exception as e:
             return {'error': f'Erro ao obter histórico: {str(e)}'}
     
@@ -0,0 +1,130 @@
+"""
+Armazenamento de histórico em SQLite
+Cada registro é apenas acrescentado à tabela (custo independente do tamanho do
+histórico) e lido por id ou em páginas, das mais recentes para as mais antigas
+"""
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from services.db_connection import get_connection_manager
+
+MAX_PAGE_SIZE = 200  # registros por página, no máximo
+
+class HistoryStore:
+    def __init__(self, table: str, db_path='data/history.db', legacy_file: str = None):
+        self.table = table
+        self.db_path = db_path
+        self.db = get_connection_manager(db_path)
+        
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._init_table()
+        
+        if legacy_file:
+            self._import_legacy_file(legacy_file)
+    
+    def _init_table(self):
+        """Cria a tabela e os índices do histórico"""
+        with self.db.connection() as conn:
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL UNIQUE,
+                    created_at TEXT NOT NULL,
+                    success INTEGER,
+                    data_json TEXT NOT NULL
+                )
+            ''')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{self.table}_created_at ON {self.table} (created_at)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{self.table}_success ON {self.table} (success, seq)')
+    
+    def _import_legacy_file(self, legacy_file: str):
+        """Importa o arquivo JSON antigo (lista de registros) uma única vez"""
+        if not os.path.exists(legacy_file):
+            return
+        
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Não foi possível importar {legacy_file}: {str(e)}")
+            return
+        
+        # Ordem de criação preservada na sequência da tabela
+        records = sorted(records, key=lambda x: x.get('created_at', ''))
+        with self.db.connection() as conn:
+            conn.executemany(f'''
+                INSERT OR IGNORE INTO {self.table} (id, created_at, success, data_json)
+                VALUES (?, ?, ?, ?)
+            ''', [self._row(record) for record in records if record.get('id')])
+        
+        os.replace(legacy_file, legacy_file + '.imported')
+        print(f"✅ {len(records)} registros importados de {legacy_file}")
+    
+    @staticmethod
+    def _row(record: Dict) -> tuple:
+        """Linha da tabela a partir de um registro"""
+        success = record.get('success')
+        return (record['id'], record.get('created_at', ''), None if success is None else int(bool(success)),
+                json.dumps(record, ensure_ascii=False))
+    
+    def append(self, record: Dict, id_prefix: str) -> str:
+        """Acrescenta um registro (recebe id e created_at) e retorna o id"""
+        now = datetime.now()
+        record['id'] = f"{id_prefix}_{int(now.timestamp())}_{uuid.uuid4().hex[:8]}"
+        record['created_at'] = now.isoformat()
+        
+        with self.db.connection() as conn:
+            conn.execute(f'''
+                INSERT INTO {self.table} (id, created_at, success, data_json)
+                VALUES (?, ?, ?, ?)
+            ''', self._row(record))
+        
+        return record['id']
+    
+    def get(self, record_id: str) -> Optional[Dict]:
+        """Obtém um registro pelo id"""
+        with self.db.connection() as conn:
+            row = conn.execute(f'SELECT data_json FROM {self.table} WHERE id = ?', (record_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def page(self, limit: int = 50, cursor: str = None, success: bool = None) -> Tuple[List[Dict], Optional[str]]:
+        """Registros mais recentes primeiro, continuando após `cursor`
+        
+        Retorna (registros, próximo cursor ou None). O limite é ajustado para [1, MAX_PAGE_SIZE]
+        e um cursor inválido gera ValueError.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        conditions, params = [], []
+        
+        if cursor:
+            try:
+                params.append(int(cursor))
+            except ValueError:
+                raise ValueError('Cursor de paginação inválido')
+            conditions.append('seq < ?')
+        
+        if success is not None:
+            conditions.append('success = ?')
+            params.append(int(success))
+        
+        where_clause = " AND ".join(conditions) if conditions else "1=1"
+        
+        with self.db.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT seq, data_json FROM {self.table}
+                WHERE {where_clause}
+                ORDER BY seq DESC
+                LIMIT ?
+            ''', params + [limit + 1]).fetchall()
+        
+        records = [json.loads(data_json) for _, data_json in rows[:limit]]
+        next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+        return records, next_cursor
+    
+    def delete(self, record_id: str) -> bool:
+        """Remove um registro"""
+        with self.db.connection() as conn:
+            deleted = conn.execute(f'DELETE FROM {self.table} WHERE id = ?', (record_id,)).rowcount
+        return deleted > 0
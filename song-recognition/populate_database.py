@@ -115,30 +115,33 @@ def create_sample_songs():
         else:
             print(f"   {key}: {value}")
 
-def create_sample_audio_file(file_path: str):
-    """Cria um arquivo de áudio de exemplo"""
+def create_sample_audio_file(file_path: str, seed: int = None, duration: float = 30, sample_rate: int = 22050):
+    """Cria um arquivo de áudio de exemplo
+    
+    Com `seed`, gera uma música sintética determinística (melodia, acordes e
+    percussão) diferente para cada seed, útil para testes e benchmarks.
+    """
     try:
         import numpy as np
         import soundfile as sf
         
-        # Parâmetros do áudio
-        duration = 30  # 30 segundos
-        sample_rate = 22050
-        
-        # Gerar sinal de exemplo (tom + ruído)
-        t = np.linspace(0, duration, int(sample_rate * duration))
-        
-        # Tom principal (440 Hz - nota A)
-        frequency = 440
-        signal = 0.3 * np.sin(2 * np.pi * frequency * t)
-        
-        # Adicionar harmônicos
-        signal += 0.1 * np.sin(2 * np.pi * frequency * 2 * t)
-        signal += 0.05 * np.sin(2 * np.pi * frequency * 3 * t)
-        
-        # Adicionar ruído
-        noise = 0.02 * np.random.randn(len(t))
-        signal += noise
+        if seed is not None:
+            signal = synthesize_song(seed, duration, sample_rate)
+        else:
+            # Gerar sinal de exemplo (tom + ruído)
+            t = np.linspace(0, duration, int(sample_rate * duration))
+            
+            # Tom principal (440 Hz - nota A)
+            frequency = 440
+            signal = 0.3 * np.sin(2 * np.pi * frequency * t)
+            
+            # Adicionar harmônicos
+            signal += 0.1 * np.sin(2 * np.pi * frequency * 2 * t)
+            signal += 0.05 * np.sin(2 * np.pi * frequency * 3 * t)
+            
+            # Adicionar ruído
+            noise = 0.02 * np.random.randn(len(t))
+            signal += noise
         
         # Aplicar envelope (fade in/out)
         envelope = np.ones_like(signal)
@@ -155,6 +158,55 @@ def create_sample_audio_file(file_path: str):
     except Exception as e:
         print(f"   ❌ Erro ao criar arquivo: {str(e)}")
 
+def synthesize_song(seed: int, duration: float = 30, sample_rate: int = 22050):
+    """Sinal de uma música sintética determinística para a seed informada"""
+    import numpy as np
+    
+    rng = np.random.default_rng(seed)
+    n_samples = int(sample_rate * duration)
+    signal = np.zeros(n_samples)
+    
+    tempo = rng.uniform(80, 160)
+    beat = 60.0 / tempo
+    root = rng.integers(0, 12)
+    scale = root + np.array([0, 2, 4, 5, 7, 9, 11, 12, 14, 16])
+    
+    def add_note(start, length, frequency, amplitude, harmonics, decay):
+        first = int(start * sample_rate)
+        count = min(int(length * sample_rate), n_samples - first)
+        if count <= 0:
+            return
+        t = np.arange(count) / sample_rate
+        tone = sum(weight * np.sin(2 * np.pi * frequency * (k + 1) * t) for k, weight in enumerate(harmonics))
+        signal[first:first + count] += amplitude * tone * np.exp(-decay * t)
+    
+    # Melodia: notas da escala com durações de meio, um ou dois tempos
+    position = 0.0
+    while position < duration:
+        length = beat * rng.choice([0.5, 1.0, 2.0])
+        if rng.random() > 0.15:
+            frequency = 220.0 * 2 ** (rng.choice(scale) / 12)
+            add_note(position, length, frequency, 0.25, rng.uniform(0.1, 1.0, 4), rng.uniform(1.0, 4.0))
+        position += length
+    
+    # Acordes: tríade a cada compasso (4 tempos)
+    for start in np.arange(0, duration, 4 * beat):
+        degree = rng.integers(0, 7)
+        for step in (0, 2, 4):
+            frequency = 110.0 * 2 ** (scale[(degree + step) % 7] / 12)
+            add_note(start, 4 * beat, frequency, 0.08, (1.0, 0.3, 0.1), 0.5)
+    
+    # Percussão: ruído filtrado em tempos sorteados
+    pattern = rng.random(8) < 0.6
+    for index, start in enumerate(np.arange(0, duration, beat / 2)):
+        if pattern[index % 8]:
+            first = int(start * sample_rate)
+            count = min(int(0.08 * sample_rate), n_samples - first)
+            burst = rng.standard_normal(count) * np.exp(-np.arange(count) / (0.015 * sample_rate))
+            signal[first:first + count] += 0.15 * burst
+    
+    return 0.9 * signal / max(np.abs(signal).max(), 1e-9)
+
 def show_database_info():
     """Mostra informações sobre o banco de dados"""
     print("\n🔍 Informações do banco de dados:")
@@ -180,6 +232,49 @@ def show_database_info():
     except Exception as e:
         print(f"❌ Erro ao obter informações: {str(e)}")
 
+def migrate_fingerprints():
+    """Regenera fingerprints no formato inteiro para bancos criados com hashes MD5"""
+    print("\n🔄 Migrando fingerprints para hashes inteiros...")
+    print("=" * 40)
+    
+    fingerprint_system = AudioFingerprint()
+    result = fingerprint_system.migrate_legacy_fingerprints()
+    
+    print(f"✅ Músicas migradas: {result['migrated']}")
+    if result['missing_files']:
+        print(f"⚠️  Arquivos não encontrados ({len(result['missing_files'])}):")
+        for song in result['missing_files']:
+            print(f"   {song['id']}: {song['title']} ({song['file_path']})")
+        print("   A tabela legada foi mantida até que esses arquivos sejam migrados.")
+
+def rebuild_timbre_index():
+    """Gera embeddings de timbre para as músicas já cadastradas"""
+    print("\n🔄 Gerando embeddings de timbre...")
+    print("=" * 40)
+    
+    music_db = MusicDatabase()
+    result = music_db.rebuild_timbre_index()
+    
+    print(f"✅ Embeddings gerados: {result['added']} (total no índice: {result['total']})")
+    for song in result['failed']:
+        print(f"   ❌ {song['id']}: {song['file_path']} ({song['error']})")
+
+def prune_common_hashes(max_df_ratio=None):
+    """Remove do índice os postings de hashes presentes em muitas músicas"""
+    print("\n✂️  Podando hashes comuns do índice de fingerprints...")
+    print("=" * 40)
+    
+    index = AudioFingerprint().index
+    stats = index.get_hash_stats(top=5)
+    print(f"📊 Hashes únicos: {stats['unique_hashes']} em {stats['songs']} músicas")
+    if stats['unique_hashes']:
+        print(f"   Frequência de documento: média {stats['df_mean']:.1f}, p99 {stats['df_p99']:.0f}, máx {stats['df_max']}")
+    
+    result = index.prune_common_hashes(max_df_ratio)
+    print(f"✅ Hashes podados: {result['new_stop_hashes']} (limite: {result['threshold']} músicas, "
+          f"total podado: {result['stop_hashes']})")
+    print(f"   Postings: {result['postings_before']} → {result['postings_after']}")
+
 def main():
     """Função principal"""
     print("🎵 Song Recognition - Populador de Banco de Dados")
@@ -189,6 +284,18 @@ def main():
         show_database_info()
         return
     
+    if len(sys.argv) > 1 and sys.argv[1] == '--migrate':
+        migrate_fingerprints()
+        return
+    
+    if len(sys.argv) > 1 and sys.argv[1] == '--timbre':
+        rebuild_timbre_index()
+        return
+    
+    if len(sys.argv) > 1 and sys.argv[1] == '--prune-hashes':
+        prune_common_hashes(float(sys.argv[2]) if len(sys.argv) > 2 else None)
+        return
+    
     # Perguntar se quer continuar
     response = input("Deseja popular o banco com músicas de exemplo? (s/N): ").strip().lower()
     
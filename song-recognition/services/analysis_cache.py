@@ -0,0 +1,249 @@
+"""
+Cache persistente de análises de áudio
+Resultados são endereçados pelo hash do áudio decodificado mais o tipo e a versão
+do extrator; um LRU em memória fica na frente do armazenamento em SQLite, que
+também é um LRU limitado em quantidade de resultados e em bytes
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional
+from services.db_connection import get_connection_manager
+
+# Limites do armazenamento em disco (resultados e bytes de JSON); os menos usados são removidos
+DEFAULT_MAX_ROWS = int(os.getenv('ANALYSIS_CACHE_MAX_ROWS', 10000))
+DEFAULT_MAX_BYTES = int(float(os.getenv('ANALYSIS_CACHE_MAX_MB', 256)) * 1024 * 1024)
+
+class AnalysisCache:
+    def __init__(self, db_path='data/analysis_cache.db', max_memory_items: int = 256,
+                 max_rows: int = None, max_bytes: int = None):
+        self.db_path = db_path
+        self.db = get_connection_manager(db_path)
+        self.max_memory_items = max_memory_items
+        self.max_rows = DEFAULT_MAX_ROWS if max_rows is None else max_rows
+        self.max_bytes = DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+        
+        # Limites verificados a cada evict_interval gravações
+        self.evict_interval = 32
+        self._writes_since_evict = 0
+        
+        # Horários de acesso das leituras, gravados em lote junto com a remoção periódica
+        self._accessed: Dict[str, float] = {}
+        
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        
+        self._init_database()
+        self.evict()
+    
+    def _init_database(self):
+        """Inicializa banco do cache"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Resultados por (tipo, versão, hash do conteúdo)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    value_json TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_access REAL NOT NULL DEFAULT 0,
+                    size_bytes INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            
+            # Bancos antigos não têm as colunas usadas na remoção por LRU
+            cursor.execute('PRAGMA table_info(analysis_cache)')
+            columns = {row[1] for row in cursor.fetchall()}
+            if 'last_access' not in columns:
+                cursor.execute('ALTER TABLE analysis_cache ADD COLUMN last_access REAL NOT NULL DEFAULT 0')
+            if 'size_bytes' not in columns:
+                cursor.execute('ALTER TABLE analysis_cache ADD COLUMN size_bytes INTEGER NOT NULL DEFAULT 0')
+                cursor.execute('UPDATE analysis_cache SET size_bytes = length(CAST(value_json AS BLOB))')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_access ON analysis_cache (last_access)')
+            
+            # Hash do conteúdo de arquivos já decodificados (evita decodificar de novo)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS file_hashes (
+                    file_path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL
+                )
+            ''')
+            
+            conn.commit()
+    
+    @staticmethod
+    def content_hash(y: np.ndarray, sr: int) -> str:
+        """Hash SHA-1 do sinal decodificado e da taxa de amostragem"""
+        digest = hashlib.sha1(str(int(sr)).encode())
+        digest.update(np.ascontiguousarray(y, dtype=np.float32).tobytes())
+        return digest.hexdigest()
+    
+    @staticmethod
+    def make_key(kind: str, version: int, content_hash: str) -> str:
+        """Chave de um resultado no cache"""
+        return f'{kind}:{version}:{content_hash}'
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """Retorna uma cópia do resultado armazenado, se existir"""
+        with self._lock:
+            value_json = self._memory.get(key)
+            if value_json is not None:
+                self._memory.move_to_end(key)
+                self._accessed[key] = time.time()
+                self.stats['memory_hits'] += 1
+                return json.loads(value_json)
+        
+        try:
+            with self.db.connection() as conn:
+                row = conn.execute('SELECT value_json FROM analysis_cache WHERE cache_key = ?',
+                                   (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Erro ao ler cache de análise: {str(e)}")
+            row = None
+        
+        with self._lock:
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._accessed[key] = time.time()
+            self._remember(key, row[0])
+        
+        return json.loads(row[0])
+    
+    def put(self, key: str, value: Dict):
+        """Armazena um resultado (serializável em JSON)"""
+        value_json = json.dumps(value, ensure_ascii=False)
+        
+        with self._lock:
+            self._remember(key, value_json)
+            self.stats['writes'] += 1
+            self._writes_since_evict += 1
+            evict = self._writes_since_evict >= self.evict_interval
+            if evict:
+                self._writes_since_evict = 0
+        
+        try:
+            with self.db.connection() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO analysis_cache (cache_key, value_json, last_access, size_bytes)
+                    VALUES (?, ?, ?, ?)
+                ''', (key, value_json, time.time(), len(value_json.encode('utf-8'))))
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar cache de análise: {str(e)}")
+        
+        if evict:
+            self.evict()
+    
+    def flush_access_times(self):
+        """Grava no disco os horários de acesso acumulados pelas leituras"""
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+        if not accessed:
+            return
+        
+        try:
+            with self.db.connection() as conn:
+                conn.executemany('UPDATE analysis_cache SET last_access = MAX(last_access, ?) WHERE cache_key = ?',
+                                 [(access, key) for key, access in accessed.items()])
+        except sqlite3.Error as e:
+            print(f"Erro ao gravar acessos do cache de análise: {str(e)}")
+    
+    def evict(self) -> int:
+        """Remove os resultados menos usados além de max_rows ou max_bytes e retorna quantos saíram"""
+        self.flush_access_times()
+        try:
+            with self.db.connection() as conn:
+                # Posição de cada resultado do mais para o menos recente, com os bytes acumulados até ele
+                removed = conn.execute('''
+                    DELETE FROM analysis_cache WHERE cache_key IN (
+                        SELECT cache_key FROM (
+                            SELECT cache_key,
+                                   ROW_NUMBER() OVER w AS position,
+                                   SUM(size_bytes) OVER w AS total_bytes
+                            FROM analysis_cache
+                            WINDOW w AS (ORDER BY last_access DESC, rowid DESC)
+                        )
+                        WHERE position > ? OR total_bytes > ?
+                    )
+                ''', (self.max_rows, self.max_bytes)).rowcount
+                
+                # Hashes de arquivos: apenas os max_rows gravados por último
+                conn.execute('''
+                    DELETE FROM file_hashes WHERE rowid NOT IN (
+                        SELECT rowid FROM file_hashes ORDER BY rowid DESC LIMIT ?
+                    )
+                ''', (self.max_rows,))
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"Erro ao limpar cache de análise: {str(e)}")
+            return 0
+        
+        with self._lock:
+            self.stats['evictions'] += removed
+        return removed
+    
+    def _remember(self, key: str, value_json: str):
+        """Insere no LRU em memória (chamador já possui o lock)"""
+        self._memory[key] = value_json
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+    
+    def get_file_hash(self, file_path: str) -> Optional[str]:
+        """Hash de conteúdo conhecido de um arquivo, se ele não mudou desde então"""
+        try:
+            stat = os.stat(file_path)
+            with self.db.connection() as conn:
+                row = conn.execute('''
+                    SELECT content_hash FROM file_hashes
+                    WHERE file_path = ? AND mtime_ns = ? AND file_size = ?
+                ''', (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)).fetchone()
+            return row[0] if row else None
+        except (OSError, sqlite3.Error):
+            return None
+    
+    def set_file_hash(self, file_path: str, content_hash: str):
+        """Associa o hash de conteúdo à versão atual de um arquivo"""
+        try:
+            stat = os.stat(file_path)
+            with self.db.connection() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO file_hashes (file_path, mtime_ns, file_size, content_hash)
+                    VALUES (?, ?, ?, ?)
+                ''', (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, content_hash))
+                conn.commit()
+        except (OSError, sqlite3.Error) as e:
+            print(f"Erro ao gravar hash do arquivo: {str(e)}")
+    
+    def get_stats(self) -> Dict:
+        """Retorna contadores de acerto do cache"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_items'] = len(self._memory)
+        
+        try:
+            with self.db.connection() as conn:
+                stats['disk_items'], stats['disk_bytes'] = conn.execute(
+                    'SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM analysis_cache'
+                ).fetchone()
+        except sqlite3.Error:
+            pass
+        stats['max_rows'] = self.max_rows
+        stats['max_bytes'] = self.max_bytes
+        
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups > 0 else 0
+        return stats
@@ -9,9 +9,17 @@ from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 import json
 import os
+from services.feature_context import FeatureContext
+from services.analysis_cache import AnalysisCache
+from services.audio_decoder import decode_audio
+from services.timbre_index import timbre_embedding
+
+# Versão do formato da análise (invalida resultados antigos no cache)
+ANALYZER_VERSION = 3
 
 class AudioAnalyzer:
-    def __init__(self):
+    def __init__(self, cache: AnalysisCache = None):
+        self.cache = cache if cache is not None else AnalysisCache()
         self.sample_rate = 22050
         self.hop_length = 512
         self.n_mfcc = 13
@@ -20,36 +28,76 @@ class AudioAnalyzer:
         self.genre_classifier = self._load_genre_classifier()
         self.key_detector = self._load_key_detector()
     
-    def analyze_audio(self, audio_path: str) -> Optional[Dict]:
-        """Análise completa de características musicais"""
+    def analyze_audio(self, audio_path: str, remember_path: bool = True) -> Optional[Dict]:
+        """Análise completa de características musicais
+        
+        Com remember_path=False (arquivos temporários) o hash do conteúdo não é
+        associado ao caminho; o resultado continua em cache pelo conteúdo.
+        """
+        # Arquivo já analisado e não modificado: dispensa a decodificação
+        content_hash = self.cache.get_file_hash(audio_path) if remember_path else None
+        if content_hash:
+            cached = self.cache.get(AnalysisCache.make_key('analysis', ANALYZER_VERSION, content_hash))
+            if cached is not None:
+                return cached
+        
         try:
             # Carregar áudio
-            y, sr = librosa.load(audio_path, sr=self.sample_rate)
-            
-            if len(y) == 0:
-                return None
+            y, sr = decode_audio(audio_path, sr=self.sample_rate)
+        except Exception as e:
+            print(f"Erro na análise de áudio: {str(e)}")
+            return None
+        
+        content_hash = AnalysisCache.content_hash(y, sr)
+        if remember_path:
+            self.cache.set_file_hash(audio_path, content_hash)
+        return self.analyze_signal(y, sr, content_hash)
+    
+    def analyze_signal(self, y: np.ndarray, sr: int, content_hash: str = None) -> Optional[Dict]:
+        """Análise completa de um sinal já decodificado (resultado em cache pelo conteúdo)"""
+        if len(y) == 0:
+            return None
+        
+        if content_hash is None:
+            content_hash = AnalysisCache.content_hash(y, sr)
+        cache_key = AnalysisCache.make_key('analysis', ANALYZER_VERSION, content_hash)
+        
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        analysis = self._analyze(y, sr)
+        if analysis:
+            self.cache.put(cache_key, analysis)
+        return analysis
+    
+    def _analyze(self, y: np.ndarray, sr: int) -> Optional[Dict]:
+        """Executa todas as análises sobre o sinal"""
+        try:
+            # Primitivas espectrais calculadas sob demanda e compartilhadas entre as análises
+            ctx = FeatureContext(y, sr, hop_length=self.hop_length, n_mfcc=self.n_mfcc)
             
             # Análises básicas
-            tempo = self._extract_tempo(y, sr)
-            key, mode = self._extract_key_and_mode(y, sr)
-            energy = self._extract_energy(y)
-            valence = self._extract_valence(y, sr)
-            danceability = self._extract_danceability(y, sr)
+            tempo = self._extract_tempo(ctx)
+            key, mode = self._extract_key_and_mode(ctx)
+            energy = self._extract_energy(ctx)
+            valence = self._extract_valence(ctx)
+            danceability = self._extract_danceability(ctx)
             
             # Análise espectral
-            spectral_features = self._extract_spectral_features(y, sr)
+            spectral_features = self._extract_spectral_features(ctx)
             
             # Análise rítmica
-            rhythmic_features = self._extract_rhythmic_features(y, sr)
+            rhythmic_features = self._extract_rhythmic_features(ctx)
             
             # Classificação de gênero
-            genre = self._classify_genre(y, sr)
+            genre = self._classify_genre(ctx)
             
             # Análise de instrumentos
-            instruments = self._detect_instruments(y, sr)
+            instruments = self._detect_instruments(ctx)
             
             # Análise de estrutura
-            structure = self._analyze_structure(y, sr)
+            structure = self._analyze_structure(ctx)
             
             return {
                 'tempo': tempo,
@@ -70,19 +118,18 @@ class AudioAnalyzer:
             print(f"Erro na análise de áudio: {str(e)}")
             return None
     
-    def _extract_tempo(self, y: np.ndarray, sr: int) -> float:
+    def _extract_tempo(self, ctx: FeatureContext) -> float:
         """Extrai o tempo (BPM) da música"""
         try:
-            tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-            return float(tempo)
+            return ctx.tempo
         except:
             return 0.0
     
-    def _extract_key_and_mode(self, y: np.ndarray, sr: int) -> tuple:
+    def _extract_key_and_mode(self, ctx: FeatureContext) -> tuple:
         """Extrai tonalidade e modo da música"""
         try:
             # Usar chroma para detectar tonalidade
-            chroma = librosa.feature.chroma_stft(y=y, sr=sr)
+            chroma = ctx.chroma
             
             # Calcular perfil de tonalidade
             key_profile = np.mean(chroma, axis=1)
@@ -109,21 +156,23 @@ class AudioAnalyzer:
         except:
             return 'Desconhecida', 'Desconhecido'
     
-    def _extract_energy(self, y: np.ndarray) -> float:
+    def _extract_energy(self, ctx: FeatureContext) -> float:
         """Extrai energia da música"""
         try:
             # RMS (Root Mean Square) como medida de energia
-            rms = librosa.feature.rms(y=y)[0]
+            rms = ctx.rms
             return float(np.mean(rms))
         except:
             return 0.0
     
-    def _extract_valence(self, y: np.ndarray, sr: int) -> float:
+    def _extract_valence(self, ctx: FeatureContext) -> float:
         """Extrai valência (positividade) da música"""
         try:
+            sr = ctx.sr
+            
             # Usar características espectrais para estimar valência
-            spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-            spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
+            spectral_centroids = ctx.spectral_centroid
+            spectral_rolloff = ctx.spectral_rolloff
             
             # Valência baseada em características espectrais
             # Músicas mais "brilhantes" tendem a ser mais positivas
@@ -135,15 +184,15 @@ class AudioAnalyzer:
         except:
             return 0.5
     
-    def _extract_danceability(self, y: np.ndarray, sr: int) -> float:
+    def _extract_danceability(self, ctx: FeatureContext) -> float:
         """Extrai dançabilidade da música"""
         try:
             # Fatores que influenciam dançabilidade
-            tempo = self._extract_tempo(y, sr)
-            energy = self._extract_energy(y)
+            tempo = self._extract_tempo(ctx)
+            energy = self._extract_energy(ctx)
             
             # Regularidade rítmica
-            onset_frames = librosa.onset.onset_detect(y=y, sr=sr)
+            onset_frames = ctx.onset_frames
             if len(onset_frames) > 1:
                 onset_intervals = np.diff(onset_frames)
                 rhythm_regularity = 1.0 / (1.0 + np.std(onset_intervals))
@@ -160,20 +209,20 @@ class AudioAnalyzer:
         except:
             return 0.5
     
-    def _extract_spectral_features(self, y: np.ndarray, sr: int) -> Dict:
+    def _extract_spectral_features(self, ctx: FeatureContext) -> Dict:
         """Extrai características espectrais"""
         try:
             # MFCCs
-            mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=self.n_mfcc)
+            mfccs = ctx.mfcc
             
             # Centróide espectral
-            spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
+            spectral_centroids = ctx.spectral_centroid
             
             # Rolloff espectral
-            spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
+            spectral_rolloff = ctx.spectral_rolloff
             
             # Zero crossing rate
-            zcr = librosa.feature.zero_crossing_rate(y)[0]
+            zcr = ctx.zcr
             
             return {
                 'mfcc_mean': np.mean(mfccs, axis=1).tolist(),
@@ -183,19 +232,20 @@ class AudioAnalyzer:
                 'spectral_rolloff_mean': float(np.mean(spectral_rolloff)),
                 'spectral_rolloff_std': float(np.std(spectral_rolloff)),
                 'zcr_mean': float(np.mean(zcr)),
-                'zcr_std': float(np.std(zcr))
+                'zcr_std': float(np.std(zcr)),
+                'timbre_embedding': timbre_embedding(mfccs).tolist()
             }
         except:
             return {}
     
-    def _extract_rhythmic_features(self, y: np.ndarray, sr: int) -> Dict:
+    def _extract_rhythmic_features(self, ctx: FeatureContext) -> Dict:
         """Extrai características rítmicas"""
         try:
             # Onset strength
-            onset_strength = librosa.onset.onset_strength(y=y, sr=sr)
+            onset_strength = ctx.onset_envelope
             
             # Tempo e beats
-            tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
+            tempo, beats = ctx.tempo, ctx.beats
             
             # Regularidade rítmica
             if len(beats) > 2:
@@ -214,32 +264,32 @@ class AudioAnalyzer:
         except:
             return {}
     
-    def _classify_genre(self, y: np.ndarray, sr: int) -> str:
+    def _classify_genre(self, ctx: FeatureContext) -> str:
         """Classifica gênero musical"""
         try:
             if self.genre_classifier:
                 # Usar classificador pré-treinado
-                features = self._extract_genre_features(y, sr)
+                features = self._extract_genre_features(ctx)
                 genre = self.genre_classifier.predict([features])[0]
                 return genre
             else:
                 # Classificação baseada em regras
-                return self._rule_based_genre_classification(y, sr)
+                return self._rule_based_genre_classification(ctx)
         except:
             return 'Desconhecido'
     
-    def _extract_genre_features(self, y: np.ndarray, sr: int) -> List[float]:
+    def _extract_genre_features(self, ctx: FeatureContext) -> List[float]:
         """Extrai características para classificação de gênero"""
         try:
             # Características espectrais
-            mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-            spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-            spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-            zcr = librosa.feature.zero_crossing_rate(y)[0]
+            mfccs = ctx.mfcc
+            spectral_centroids = ctx.spectral_centroid
+            spectral_rolloff = ctx.spectral_rolloff
+            zcr = ctx.zcr
             
             # Características rítmicas
-            tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-            onset_strength = librosa.onset.onset_strength(y=y, sr=sr)
+            tempo = ctx.tempo
+            onset_strength = ctx.onset_envelope
             
             # Combinar características
             features = [
@@ -260,12 +310,12 @@ class AudioAnalyzer:
         except:
             return [0.0] * 11
     
-    def _rule_based_genre_classification(self, y: np.ndarray, sr: int) -> str:
+    def _rule_based_genre_classification(self, ctx: FeatureContext) -> str:
         """Classificação de gênero baseada em regras"""
         try:
-            tempo = self._extract_tempo(y, sr)
-            energy = self._extract_energy(y)
-            valence = self._extract_valence(y, sr)
+            tempo = self._extract_tempo(ctx)
+            energy = self._extract_energy(ctx)
+            valence = self._extract_valence(ctx)
             
             # Regras simples para classificação
             if tempo > 140 and energy > 0.7:
@@ -283,14 +333,15 @@ class AudioAnalyzer:
         except:
             return 'Desconhecido'
     
-    def _detect_instruments(self, y: np.ndarray, sr: int) -> List[str]:
+    def _detect_instruments(self, ctx: FeatureContext) -> List[str]:
         """Detecta instrumentos presentes na música"""
         try:
+            sr = ctx.sr
             instruments = []
             
             # Análise de frequências para detectar instrumentos
-            spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-            spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)[0]
+            spectral_centroids = ctx.spectral_centroid
+            spectral_bandwidth = ctx.spectral_bandwidth
             
             # Detecção de baixo (frequências baixas)
             low_freq_energy = np.mean(spectral_centroids[spectral_centroids < sr * 0.1])
@@ -316,14 +367,15 @@ class AudioAnalyzer:
         except:
             return ['Desconhecido']
     
-    def _analyze_structure(self, y: np.ndarray, sr: int) -> Dict:
+    def _analyze_structure(self, ctx: FeatureContext) -> Dict:
         """Analisa estrutura da música"""
         try:
-            # Segmentação automática
-            segments = librosa.segment.agglomerative(y, k=8)
+            chroma = ctx.chroma
+            
+            # Segmentação automática (sobre o chroma, não sobre as amostras)
+            segments = librosa.segment.agglomerative(chroma, k=8)
             
             # Análise de repetição
-            chroma = librosa.feature.chroma_stft(y=y, sr=sr)
             similarity_matrix = np.corrcoef(chroma.T)
             
             # Encontrar seções repetidas
@@ -381,6 +433,11 @@ class AudioAnalyzer:
             with open(output_path, 'w', encoding='utf-8') as f:
                 json.dump(analysis, f, indent=2, ensure_ascii=False)
             
+            # Disponibilizar também no cache, se o conteúdo do arquivo já é conhecido
+            content_hash = self.cache.get_file_hash(audio_path)
+            if content_hash:
+                self.cache.put(AnalysisCache.make_key('analysis', ANALYZER_VERSION, content_hash), analysis)
+            
             print(f"Análise salva em: {output_path}")
         except Exception as e:
             print(f"Erro ao salvar análise: {str(e)}")
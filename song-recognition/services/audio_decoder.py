@@ -0,0 +1,138 @@
+"""
+Decodificação de áudio
+Decodifica direto para mono float32 com soundfile (ou um pipe do ffmpeg para
+formatos que o libsndfile não lê), apenas no intervalo pedido, e reamostra com
+um reamostrador selecionável cujos filtros são reaproveitados entre chamadas
+"""
+import os
+import shutil
+import subprocess
+from functools import lru_cache
+from math import gcd
+from typing import Optional, Tuple
+import numpy as np
+import soundfile as sf
+from scipy.signal import firwin, resample_poly
+from services.metrics import stage
+
+try:
+    import soxr
+except ImportError:
+    soxr = None
+
+# Reamostradores disponíveis: soxr (qualidades do libsoxr) e polifásico com filtro em cache
+SOXR_QUALITIES = {'soxr_vhq': 'VHQ', 'soxr_hq': 'HQ', 'soxr_mq': 'MQ', 'soxr_lq': 'LQ', 'soxr_qq': 'QQ'}
+RESAMPLERS = tuple(SOXR_QUALITIES) + ('polyphase',)
+
+# soxr_hq é o mesmo filtro usado por librosa.load: fingerprints e caches existentes continuam válidos
+DEFAULT_RESAMPLER = os.getenv('AUDIO_RESAMPLER', 'soxr_hq')
+
+FFMPEG = shutil.which('ffmpeg')
+FFPROBE = shutil.which('ffprobe')
+
+def decode_audio(audio_path: str, sr: Optional[int] = None, offset: float = 0.0,
+                 duration: Optional[float] = None, resampler: Optional[str] = None) -> Tuple[np.ndarray, int]:
+    """Decodifica um arquivo para mono float32
+    
+    Com `sr` o sinal é reamostrado para essa taxa (None mantém a taxa original);
+    `offset` e `duration` (segundos) limitam a leitura a um trecho do arquivo.
+    Retorna (sinal, taxa de amostragem).
+    """
+    with stage('decode'):
+        try:
+            y, native_sr = _decode_soundfile(audio_path, offset, duration)
+        except RuntimeError:
+            if not os.path.exists(audio_path):
+                raise FileNotFoundError(f"Arquivo não encontrado: {audio_path}")
+            
+            # Formato não suportado pelo libsndfile (m4a, aac...)
+            if FFMPEG is not None:
+                # O ffmpeg já entrega na taxa pedida, sem reamostrar de novo aqui
+                return _decode_ffmpeg(audio_path, sr, offset, duration)
+            y, native_sr = _decode_librosa(audio_path, offset, duration)
+    
+    if sr is None or sr == native_sr:
+        return y, native_sr
+    
+    with stage('resample'):
+        return resample(y, native_sr, sr, resampler), sr
+
+def resample(y: np.ndarray, orig_sr: int, target_sr: int, resampler: Optional[str] = None) -> np.ndarray:
+    """Reamostra um sinal mono float32"""
+    resampler = resampler or DEFAULT_RESAMPLER
+    if resampler not in RESAMPLERS:
+        raise ValueError(f"Reamostrador desconhecido: {resampler} (opções: {', '.join(RESAMPLERS)})")
+    
+    if orig_sr == target_sr or len(y) == 0:
+        return y
+    
+    if resampler == 'polyphase' or soxr is None:
+        up, down = _polyphase_ratio(orig_sr, target_sr)
+        y = resample_poly(y, up, down, window=_polyphase_filter(up, down))
+    else:
+        y = soxr.resample(y, orig_sr, target_sr, quality=SOXR_QUALITIES[resampler])
+    return np.ascontiguousarray(y, dtype=np.float32)
+
+def _polyphase_ratio(orig_sr: int, target_sr: int) -> Tuple[int, int]:
+    divisor = gcd(int(orig_sr), int(target_sr))
+    return int(target_sr) // divisor, int(orig_sr) // divisor
+
+@lru_cache(maxsize=16)
+def _polyphase_filter(up: int, down: int) -> np.ndarray:
+    """Filtro passa-baixa do reamostrador polifásico (projetado uma vez por razão up/down)"""
+    # Mesmo projeto de scipy.signal.resample_poly (Kaiser, beta 5); o ganho `up` é aplicado por ele
+    max_rate = max(up, down)
+    return firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=('kaiser', 5.0)).astype(np.float32)
+
+def _decode_soundfile(audio_path: str, offset: float, duration: Optional[float]) -> Tuple[np.ndarray, int]:
+    """Lê apenas o trecho pedido com soundfile"""
+    with sf.SoundFile(audio_path) as f:
+        native_sr = f.samplerate
+        if offset:
+            f.seek(min(int(offset * native_sr), f.frames))
+        frames = int(duration * native_sr) if duration is not None else -1
+        data = f.read(frames=frames, dtype='float32', always_2d=True)
+    
+    y = data[:, 0] if data.shape[1] == 1 else data.mean(axis=1)
+    return np.ascontiguousarray(y, dtype=np.float32), native_sr
+
+def _decode_ffmpeg(audio_path: str, sr: Optional[int], offset: float,
+                   duration: Optional[float]) -> Tuple[np.ndarray, int]:
+    """Decodifica com ffmpeg para PCM float32 mono via pipe"""
+    if sr is None:
+        sr = _probe_sample_rate(audio_path)
+    
+    command = [FFMPEG, '-nostdin', '-v', 'error']
+    if offset:
+        command += ['-ss', str(offset)]
+    if duration is not None:
+        command += ['-t', str(duration)]
+    command += ['-i', audio_path, '-f', 'f32le', '-ac', '1', '-ar', str(sr), '-']
+    
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if process.returncode != 0:
+        raise RuntimeError(f"Erro ao decodificar com ffmpeg: {process.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(process.stdout, dtype=np.float32).copy(), sr
+
+def _probe_sample_rate(audio_path: str) -> int:
+    """Taxa de amostragem original do primeiro stream de áudio"""
+    if FFPROBE is None:
+        return 44100
+    
+    process = subprocess.run(
+        [FFPROBE, '-v', 'error', '-select_streams', 'a:0', '-show_entries', 'stream=sample_rate',
+         '-of', 'default=noprint_wrappers=1:nokey=1', audio_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False
+    )
+    try:
+        return int(process.stdout.split()[0])
+    except (IndexError, ValueError):
+        raise RuntimeError(f"Erro ao ler a taxa de amostragem de {audio_path}")
+
+def _decode_librosa(audio_path: str, offset: float, duration: Optional[float]) -> Tuple[np.ndarray, int]:
+    """Último recurso sem ffmpeg no PATH: backends do librosa (audioread)"""
+    import librosa
+    
+    y, native_sr = librosa.load(audio_path, sr=None, mono=True, offset=offset,
+                                duration=duration, dtype=np.float32)
+    return y, native_sr
@@ -4,26 +4,92 @@ Implementa técnicas de reconhecimento de música sem APIs externas
 """
 import numpy as np
 import librosa
-import hashlib
-import sqlite3
 import json
-from typing import List, Dict, Tuple, Optional
+import time
+import itertools
+import soundfile as sf
+from typing import List, Dict, Tuple, Optional, Iterator
 from scipy.signal import find_peaks
+from scipy.ndimage import maximum_filter
 from sklearn.metrics.pairwise import cosine_similarity
 import os
+from services.fingerprint_index import FingerprintIndex
+from services.db_connection import get_connection_manager
+from services.metrics import stage
+from services.audio_decoder import decode_audio
+from services.streaming_fingerprint import StreamingFingerprinter, iter_audio_blocks
+
+# Versão do esquema de fingerprints
+# (1 = hash MD5 em TEXT, 2 = hash inteiro no SQLite, 3 = hashes no índice de segmentos)
+FINGERPRINT_SCHEMA_VERSION = 3
+
+# Layout do hash empacotado: [f1 | Δf | Δt], cada campo com 12 bits (Δf e Δt em complemento de dois)
+HASH_FIELD_BITS = 12
+HASH_FIELD_MASK = (1 << HASH_FIELD_BITS) - 1
+
+# Confiança mínima para considerar a melhor candidata uma correspondência
+MATCH_THRESHOLD = 0.3
 
 class AudioFingerprint:
-    def __init__(self, db_path='data/audio_fingerprints.db'):
+    def __init__(self, db_path='data/audio_fingerprints.db', index_dir: str = None):
         self.db_path = db_path
+        self.db = get_connection_manager(db_path)
+        
+        # Índice invertido de hashes (o SQLite guarda apenas metadados das músicas)
+        if index_dir is None:
+            index_dir = os.path.join(os.path.dirname(self.db_path), 'fingerprint_index')
+        self.index = FingerprintIndex(index_dir)
         self.sample_rate = 22050  # Taxa de amostragem reduzida para eficiência
         self.window_size = 4096
         self.overlap = 0.5
         self.hop_length = int(self.window_size * (1 - self.overlap))
         
         # Parâmetros para fingerprinting
-        self.target_zone_size = 15
+        self.target_zone_size = 15  # frames após a âncora
+        self.target_zone_start = 1  # atraso mínimo (frames) entre âncora e alvo
+        self.target_zone_freq = 128  # distância máxima em bins de frequência
         self.fanout = 15
-        self.min_amplitude = 0.1
+        self.min_amplitude = 0.1  # altura mínima no seletor 'legacy'
+        
+        # Parâmetros do seletor de picos ('constellation' vetorizado ou 'legacy' por frame)
+        self.peak_picker = 'constellation'
+        self.peak_neighborhood = (15, 9)  # (bins de frequência, frames)
+        self.peak_bands = 8
+        self.peak_threshold_factor = 1.5
+        self.min_peak_ratio = 1e-3  # picos mais fracos que esta fração do maior pico do mesmo segundo são ignorados
+        self.max_peaks_per_second = 30
+        self.peak_bucket_frames = max(1, int(round(self.sample_rate / self.hop_length)))
+        
+        # Parâmetros de pontuação
+        self.min_matches = 3  # mínimo de hashes alinhados para considerar uma música
+        self.top_k = 5
+        
+        # Busca 'exhaustive' (todas as músicas com algum hash em comum) ou 'two_stage': uma amostra
+        # dos hashes da consulta escolhe até shortlist_size músicas e só elas são verificadas
+        self.matcher = 'exhaustive'
+        self.shortlist_size = 200
+        self.shortlist_sample_rate = 0.25  # fração dos hashes da consulta usada no primeiro estágio
+        self.recall_check_interval = 0  # a cada N consultas em dois estágios, compara com a busca exaustiva (0 desliga)
+        
+        # Parâmetros do modo streaming (gravações longas)
+        self.stream_block_seconds = 30.0
+        self.streaming_min_duration = 600.0  # arquivos mais longos são processados em blocos
+        
+        # Reamostrador da decodificação (None usa AUDIO_RESAMPLER, padrão soxr_hq)
+        self.resampler = None
+        
+        # Contadores de custo da busca no índice
+        self.lookup_stats = {
+            'queries': 0,
+            'query_hashes': 0,
+            'matched_rows': 0,
+            'search_time': 0.0,
+            'group_time': 0.0,
+            'last_query': None,
+            'shortlist_queries': 0,
+            'recall_checks': 0,
+            'recall_hits': 0
+        }
         
         self._init_database()
     
@@ -31,7 +97,7 @@ class AudioFingerprint:
         """Inicializa banco de dados SQLite para fingerprints"""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self.db.connection() as conn:
             cursor = conn.cursor()
             
             # Tabela de músicas
@@ -43,81 +109,313 @@ class AudioFingerprint:
                     album TEXT,
                     file_path TEXT,
                     duration REAL,
+                    fingerprint_count INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
             
-            # Tabela de fingerprints
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS fingerprints (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    song_id INTEGER,
-                    hash_value TEXT NOT NULL,
-                    offset INTEGER NOT NULL,
-                    FOREIGN KEY (song_id) REFERENCES songs (id)
-                )
-            ''')
+            cursor.execute('PRAGMA table_info(songs)')
+            if 'fingerprint_count' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute('ALTER TABLE songs ADD COLUMN fingerprint_count INTEGER DEFAULT 0')
             
-            # Índices para performance
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_hash ON fingerprints (hash_value)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_song_id ON fingerprints (song_id)')
+            # Bancos antigos guardavam o hash como TEXT (MD5 truncado)
+            self._migrate_legacy_schema(cursor)
+            
+            # Bancos da versão 2 guardavam hashes inteiros no próprio SQLite
+            self._import_sqlite_fingerprints(cursor)
+            
+            cursor.execute(f'PRAGMA user_version = {FINGERPRINT_SCHEMA_VERSION}')
             
             conn.commit()
+            
+            if self._has_legacy_fingerprints(cursor):
+                print("⚠️  Fingerprints no formato antigo (MD5) encontrados. "
+                      "Execute 'python populate_database.py --migrate' para regenerá-los.")
     
-    def generate_fingerprint(self, audio_path: str) -> List[Tuple[str, int]]:
-        """Gera fingerprint de um arquivo de áudio"""
-        try:
-            # Carregar áudio
-            y, sr = librosa.load(audio_path, sr=self.sample_rate)
+    def _migrate_legacy_schema(self, cursor):
+        """Move a tabela de fingerprints com hash TEXT para uma tabela legada"""
+        cursor.execute('PRAGMA table_info(fingerprints)')
+        columns = {row[1]: row[2].upper() for row in cursor.fetchall()}
+        
+        if columns.get('hash_value') != 'TEXT':
+            return
+        
+        # Os índices antigos acompanham a tabela renomeada e ocupariam os nomes novos
+        cursor.execute('DROP INDEX IF EXISTS idx_hash')
+        cursor.execute('DROP INDEX IF EXISTS idx_song_id')
+        cursor.execute('ALTER TABLE fingerprints RENAME TO fingerprints_md5_legacy')
+    
+    def _import_sqlite_fingerprints(self, cursor):
+        """Move fingerprints inteiros armazenados no SQLite para o índice de segmentos"""
+        cursor.execute('PRAGMA table_info(fingerprints)')
+        columns = {row[1]: row[2].upper() for row in cursor.fetchall()}
+        
+        if columns.get('hash_value') != 'INTEGER':
+            return
+        
+        cursor.execute('SELECT hash_value, song_id, offset FROM fingerprints')
+        rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 3)
+        
+        if len(rows):
+            song_ids = rows[:, 1]
+            order = np.argsort(song_ids, kind='stable')
+            unique_ids, starts = np.unique(song_ids[order], return_index=True)
+            groups = np.split(order, starts[1:])
+            counts = self.index.add_songs(
+                (int(song_id), rows[group, 0], rows[group, 2])
+                for song_id, group in zip(unique_ids, groups)
+            )
+            self.index.merge()
             
-            # Aplicar pré-processamento
-            y = self._preprocess_audio(y)
+            cursor.executemany('UPDATE songs SET fingerprint_count = ? WHERE id = ?',
+                               [(count, song_id) for song_id, count in counts.items()])
+            print(f"✅ {len(rows)} fingerprints movidos do SQLite para o índice de segmentos")
+        
+        cursor.execute('DROP TABLE fingerprints')
+    
+    def _has_legacy_fingerprints(self, cursor) -> bool:
+        """Verifica se ainda existem fingerprints legados aguardando migração"""
+        cursor.execute('''
+            SELECT COUNT(*) FROM sqlite_master
+            WHERE type = 'table' AND name = 'fingerprints_md5_legacy'
+        ''')
+        return cursor.fetchone()[0] > 0
+    
+    def migrate_legacy_fingerprints(self) -> Dict:
+        """Regenera fingerprints inteiros para músicas que só possuem hashes MD5 legados"""
+        migrated, missing = 0, []
+        
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
             
-            # Calcular espectrograma
-            stft = librosa.stft(y, n_fft=self.window_size, hop_length=self.hop_length)
-            magnitude = np.abs(stft)
+            if not self._has_legacy_fingerprints(cursor):
+                return {'migrated': 0, 'missing_files': []}
+            
+            cursor.execute('''
+                SELECT s.id, s.title, s.file_path FROM songs s
+                WHERE EXISTS (SELECT 1 FROM fingerprints_md5_legacy l WHERE l.song_id = s.id)
+            ''')
+            pending = cursor.fetchall()
             
-            # Aplicar filtro de frequência
-            magnitude = self._apply_frequency_filter(magnitude)
+            for song_id, title, file_path in pending:
+                if not file_path or not os.path.exists(file_path):
+                    missing.append({'id': song_id, 'title': title, 'file_path': file_path})
+                    continue
+                
+                hashes, offsets = self.generate_fingerprint(file_path)
+                count = self.index.add_song(song_id, hashes, offsets)
+                cursor.execute('UPDATE songs SET fingerprint_count = ? WHERE id = ?', (count, song_id))
+                cursor.execute('DELETE FROM fingerprints_md5_legacy WHERE song_id = ?', (song_id,))
+                conn.commit()
+                migrated += 1
+                print(f"✅ Fingerprints regenerados: {title} ({len(hashes)} hashes)")
+            
+            # Só descarta a tabela legada quando todas as músicas foram migradas
+            if not missing:
+                cursor.execute('DROP TABLE fingerprints_md5_legacy')
+                conn.commit()
+                cursor.execute('VACUUM')
+        
+        return {'migrated': migrated, 'missing_files': missing}
+    
+    def load_audio(self, audio_path: str, offset: float = 0.0, duration: Optional[float] = None) -> np.ndarray:
+        """Decodifica um arquivo (ou um trecho dele) para mono float32 na taxa de amostragem do fingerprint"""
+        y, _ = decode_audio(audio_path, sr=self.sample_rate, offset=offset, duration=duration,
+                            resampler=self.resampler)
+        return y
+    
+    def generate_fingerprint(self, audio_path: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Gera fingerprint de um arquivo de áudio"""
+        try:
+            return self.fingerprint_signal(self.load_audio(audio_path))
+        except Exception as e:
+            print(f"Erro ao gerar fingerprint: {str(e)}")
+            return self._empty_hashes()
+    
+    def fingerprint_signal(self, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Gera fingerprint de um sinal já decodificado em self.sample_rate"""
+        try:
+            with stage('stft'):
+                # Aplicar pré-processamento
+                y = self._preprocess_audio(y)
+                
+                # Calcular espectrograma
+                stft = librosa.stft(y, n_fft=self.window_size, hop_length=self.hop_length)
+                magnitude = np.abs(stft)
+                
+                # Aplicar filtro de frequência
+                magnitude = self._apply_frequency_filter(magnitude)
             
             # Encontrar picos espectrais
-            peaks = self._find_spectral_peaks(magnitude)
+            with stage('peak_picking'):
+                peaks = self._find_spectral_peaks(magnitude)
             
             # Gerar hashes dos picos
-            hashes = self._generate_hashes(peaks)
-            
-            return hashes
+            with stage('hashing'):
+                return self._generate_hashes(peaks)
             
         except Exception as e:
             print(f"Erro ao gerar fingerprint: {str(e)}")
-            return []
+            return self._empty_hashes()
+    
+    def iter_fingerprint_stream(self, audio_path: str) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Gera (hashes, offsets) bloco a bloco, com offsets absolutos em frames
+        
+        A memória usada não depende da duração do arquivo: apenas um bloco de
+        áudio e alguns frames de contexto ficam em memória.
+        """
+        streamer = StreamingFingerprinter(self)
+        
+        try:
+            blocks = iter_audio_blocks(audio_path, self.sample_rate, self.stream_block_seconds)
+            first_block = next(blocks, None)
+        except Exception:
+            # Formato não suportado pelo soundfile: decodificar inteiro e fatiar
+            y = self.load_audio(audio_path)
+            block_size = int(self.stream_block_seconds * self.sample_rate)
+            first_block = y[:block_size] if len(y) else None
+            blocks = (y[i:i + block_size] for i in range(block_size, len(y), block_size))
+        
+        if first_block is not None:
+            for block in itertools.chain([first_block], blocks):
+                hashes, offsets = streamer.push(block)
+                if len(hashes):
+                    yield hashes, offsets
+        
+        hashes, offsets = streamer.flush()
+        if len(hashes):
+            yield hashes, offsets
+    
+    def fingerprint_file(self, audio_path: str) -> Tuple[np.ndarray, np.ndarray, float]:
+        """Gera fingerprint e duração de um arquivo, em streaming se ele for longo"""
+        duration = self._file_duration(audio_path)
+        
+        if duration is not None and duration >= self.streaming_min_duration:
+            hashes, offsets = [], []
+            for chunk_hashes, chunk_offsets in self.iter_fingerprint_stream(audio_path):
+                hashes.append(chunk_hashes)
+                offsets.append(chunk_offsets)
+            if not hashes:
+                return (*self._empty_hashes(), duration)
+            return np.concatenate(hashes), np.concatenate(offsets), duration
+        
+        y = self.load_audio(audio_path)
+        hashes, offsets = self.fingerprint_signal(y)
+        return hashes, offsets, len(y) / self.sample_rate
+    
+    def _file_duration(self, audio_path: str) -> Optional[float]:
+        """Duração do arquivo lida do cabeçalho (None se o formato não for suportado)"""
+        try:
+            return sf.info(audio_path).duration
+        except Exception:
+            return None
     
     def _preprocess_audio(self, y: np.ndarray) -> np.ndarray:
-        """Pré-processa o sinal de áudio"""
-        # Normalizar
-        y = librosa.util.normalize(y)
+        """Pré-processa o sinal de áudio
         
+        Sem normalização pelo pico: os limiares dos picos são relativos à energia de
+        cada segundo (independentes do ganho), e o modo streaming, que não conhece o
+        pico do arquivo inteiro, gera exatamente os mesmos hashes.
+        """
         # Aplicar filtro passa-alta para remover ruído de baixa frequência
-        y = librosa.effects.preemphasis(y)
-        
-        return y
+        return librosa.effects.preemphasis(np.asarray(y, dtype=np.float32))
+    
+    def _frequency_mask(self) -> np.ndarray:
+        """Bins de frequência considerados (30Hz a 3000Hz: voz humana e instrumentos)"""
+        freqs = librosa.fft_frequencies(sr=self.sample_rate, n_fft=self.window_size)
+        return (freqs >= 30) & (freqs <= 3000)
     
     def _apply_frequency_filter(self, magnitude: np.ndarray) -> np.ndarray:
         """Aplica filtro de frequência para focar em frequências relevantes"""
-        # Focar em frequências de 30Hz a 3000Hz (voz humana e instrumentos)
-        freqs = librosa.fft_frequencies(sr=self.sample_rate, n_fft=self.window_size)
-        
-        # Criar máscara de frequência
-        freq_mask = (freqs >= 30) & (freqs <= 3000)
-        
-        # Aplicar máscara
         filtered_magnitude = magnitude.copy()
-        filtered_magnitude[~freq_mask] = 0
+        filtered_magnitude[~self._frequency_mask()] = 0
         
         return filtered_magnitude
     
-    def _find_spectral_peaks(self, magnitude: np.ndarray) -> List[Tuple[int, int, float]]:
-        """Encontra picos no espectrograma"""
+    def _find_spectral_peaks(self, magnitude: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Encontra picos no espectrograma com o seletor configurado"""
+        if self.peak_picker == 'legacy':
+            return self._find_spectral_peaks_legacy(magnitude)
+        return self._find_constellation_peaks(magnitude)
+    
+    def _find_constellation_peaks(self, magnitude: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Encontra picos 2-D (tempo x frequência) de forma vetorizada
+        
+        Retorna arrays (freq_bin, frame, amplitude) ordenados por frame e frequência.
+        """
+        if magnitude.size == 0:
+            return self._empty_peaks()
+        
+        # Máximo local em vizinhanças de tempo x frequência
+        local_max = maximum_filter(magnitude, size=self.peak_neighborhood, mode='constant', cval=0.0)
+        
+        # Limiar adaptativo por banda de frequência
+        thresholds = self._band_thresholds(magnitude)
+        
+        is_peak = (magnitude == local_max) & (magnitude > thresholds)
+        freq_idx, frame_idx = np.nonzero(is_peak)
+        amplitudes = magnitude[freq_idx, frame_idx]
+        
+        # Limitar quantidade de picos por segundo (mantém os mais fortes)
+        keep = self._limit_peaks_per_second(frame_idx, amplitudes)
+        freq_idx, frame_idx, amplitudes = freq_idx[keep], frame_idx[keep], amplitudes[keep]
+        
+        order = np.lexsort((freq_idx, frame_idx))
+        return (
+            freq_idx[order].astype(np.int32),
+            frame_idx[order].astype(np.int32),
+            amplitudes[order].astype(np.float32)
+        )
+    
+    def _band_thresholds(self, magnitude: np.ndarray, first_frame: int = 0) -> np.ndarray:
+        """Limiar (bin x frame) a partir da energia média de cada banda de frequência em cada segundo
+        
+        Os segundos são blocos de peak_bucket_frames contados a partir do frame
+        absoluto 0 (first_frame é o frame da primeira coluna): um bloco do modo
+        streaming e o sinal inteiro têm os mesmos limiares.
+        """
+        n_frames = magnitude.shape[1]
+        thresholds = np.full(magnitude.shape, np.inf, dtype=np.float32)
+        
+        # Considerar apenas bins que passam pelo filtro de frequência
+        active = np.flatnonzero(self._frequency_mask())
+        if active.size == 0 or n_frames == 0:
+            return thresholds
+        
+        bucket = (np.arange(n_frames) + first_frame) // self.peak_bucket_frames
+        bucket_starts = np.flatnonzero(np.diff(bucket, prepend=bucket[0] - 1))
+        bucket_sizes = np.diff(np.append(bucket_starts, n_frames))
+        row_means = np.add.reduceat(magnitude[active], bucket_starts, axis=1) / bucket_sizes
+        
+        n_bands = min(self.peak_bands, active.size)
+        starts = np.unique(np.linspace(0, active.size, n_bands + 1).astype(np.int64)[:-1])
+        band_sizes = np.diff(np.append(starts, active.size))
+        band_means = np.add.reduceat(row_means, starts, axis=0) / band_sizes[:, np.newaxis]
+        
+        band_of_row = np.searchsorted(starts, np.arange(active.size), side='right') - 1
+        bucket_peaks = np.maximum.reduceat(magnitude[active], bucket_starts, axis=1).max(axis=0)
+        bucket_thresholds = np.maximum(band_means[band_of_row] * self.peak_threshold_factor,
+                                       bucket_peaks * self.min_peak_ratio)
+        thresholds[active] = np.repeat(bucket_thresholds, bucket_sizes, axis=1)
+        return thresholds
+    
+    def _limit_peaks_per_second(self, frame_idx: np.ndarray, amplitudes: np.ndarray) -> np.ndarray:
+        """Retorna índices dos picos mais fortes de cada segundo, até o limite configurado"""
+        if frame_idx.size == 0:
+            return np.arange(0)
+        
+        bucket = frame_idx // self.peak_bucket_frames
+        
+        # Ordenar por segundo e amplitude decrescente, depois calcular a posição dentro do segundo
+        order = np.lexsort((-amplitudes, bucket))
+        sorted_bucket = bucket[order]
+        bucket_start = np.searchsorted(sorted_bucket, sorted_bucket, side='left')
+        rank = np.arange(order.size) - bucket_start
+        
+        return np.sort(order[rank < self.max_peaks_per_second])
+    
+    def _find_spectral_peaks_legacy(self, magnitude: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Seletor original: find_peaks frame a frame (mantido para comparação A/B)"""
         peaks = []
         
         for time_idx in range(magnitude.shape[1]):
@@ -137,153 +435,602 @@ class AudioFingerprint:
                 if frame[peak_idx] > self.min_amplitude:
                     peaks.append((peak_idx, time_idx, frame[peak_idx]))
         
-        return peaks
+        if not peaks:
+            return self._empty_peaks()
+        
+        freq_idx, frame_idx, amplitudes = zip(*peaks)
+        return (
+            np.asarray(freq_idx, dtype=np.int32),
+            np.asarray(frame_idx, dtype=np.int32),
+            np.asarray(amplitudes, dtype=np.float32)
+        )
+    
+    def _empty_peaks(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Conjunto vazio de picos"""
+        return (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))
     
-    def _generate_hashes(self, peaks: List[Tuple[int, int, float]]) -> List[Tuple[str, int]]:
-        """Gera hashes a partir dos picos espectrais"""
-        hashes = []
+    def _generate_hashes(self, peaks: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                         max_anchor_frame: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Gera hashes a partir dos picos espectrais
         
-        # Ordenar picos por amplitude
-        peaks_sorted = sorted(peaks, key=lambda x: x[2], reverse=True)
+        Cada pico (âncora) é combinado com até `fanout` picos da sua zona alvo:
+        frames em [t + target_zone_start, t + target_zone_size] e frequência a no
+        máximo `target_zone_freq` bins. Retorna arrays (hash, offset), onde hash
+        empacota (f1, Δf, Δt) em um inteiro de 64 bits. Com `max_anchor_frame`,
+        apenas picos anteriores a esse frame são usados como âncora.
+        """
+        freq_idx, frame_idx, amplitudes = peaks
+        if len(freq_idx) == 0:
+            return self._empty_hashes()
         
-        # Gerar hashes para cada combinação de picos
-        for i, (freq1, time1, amp1) in enumerate(peaks_sorted):
-            for j in range(i + 1, min(i + self.fanout, len(peaks_sorted))):
-                freq2, time2, amp2 = peaks_sorted[j]
-                
-                # Calcular diferenças
-                freq_diff = freq2 - freq1
-                time_diff = time2 - time1
-                
-                # Criar hash da combinação
-                hash_input = f"{freq1}:{freq_diff}:{time_diff}"
-                hash_value = hashlib.md5(hash_input.encode()).hexdigest()[:16]
-                
-                hashes.append((hash_value, time1))
+        # Ordenar picos por tempo (e frequência)
+        order = np.lexsort((freq_idx, frame_idx))
+        freqs = freq_idx[order].astype(np.int64)
+        frames = frame_idx[order].astype(np.int64)
+        
+        n_anchors = len(frames)
+        if max_anchor_frame is not None:
+            n_anchors = int(np.searchsorted(frames, max_anchor_frame, side='left'))
+            if n_anchors == 0:
+                return self._empty_hashes()
+        
+        # Limites da zona alvo de cada âncora no array ordenado
+        anchor_frames = frames[:n_anchors]
+        zone_start = np.searchsorted(frames, anchor_frames + self.target_zone_start, side='left')
+        zone_end = np.searchsorted(frames, anchor_frames + self.target_zone_size, side='right')
+        max_width = int((zone_end - zone_start).max())
+        
+        all_anchors = np.arange(n_anchors)
+        taken = np.zeros(n_anchors, dtype=np.int64)
+        anchors, targets = [], []
+        
+        # Percorrer a zona de todas as âncoras em paralelo, um passo por vez
+        for step in range(max_width):
+            candidate = zone_start + step
+            valid = (candidate < zone_end) & (taken < self.fanout)
+            if not valid.any():
+                break
+            
+            anchor = all_anchors[valid]
+            target = candidate[valid]
+            
+            in_zone = np.abs(freqs[target] - freqs[anchor]) <= self.target_zone_freq
+            anchor, target = anchor[in_zone], target[in_zone]
+            taken[anchor] += 1
+            
+            anchors.append(anchor)
+            targets.append(target)
+        
+        if not anchors:
+            return self._empty_hashes()
+        
+        anchor = np.concatenate(anchors)
+        target = np.concatenate(targets)
+        hashes = self._pack_hashes(freqs[anchor], freqs[target] - freqs[anchor],
+                                   frames[target] - frames[anchor])
+        
+        return hashes, frames[anchor].astype(np.int32)
+    
+    @staticmethod
+    def _pack_hashes(freq: np.ndarray, freq_diff: np.ndarray, time_diff: np.ndarray) -> np.ndarray:
+        """Empacota (f1, Δf, Δt) em inteiros de 64 bits"""
+        freq = np.asarray(freq, dtype=np.int64) & HASH_FIELD_MASK
+        freq_diff = np.asarray(freq_diff, dtype=np.int64) & HASH_FIELD_MASK
+        time_diff = np.asarray(time_diff, dtype=np.int64) & HASH_FIELD_MASK
+        return (freq << (2 * HASH_FIELD_BITS)) | (freq_diff << HASH_FIELD_BITS) | time_diff
+    
+    @staticmethod
+    def _unpack_hashes(hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Separa hashes empacotados em (f1, Δf, Δt), com Δf e Δt de volta com sinal"""
+        hashes = np.asarray(hashes, dtype=np.int64)
+        sign_bit = 1 << (HASH_FIELD_BITS - 1)
         
-        return hashes
+        def signed(field):
+            return (field ^ sign_bit) - sign_bit
+        
+        freq = (hashes >> (2 * HASH_FIELD_BITS)) & HASH_FIELD_MASK
+        freq_diff = signed((hashes >> HASH_FIELD_BITS) & HASH_FIELD_MASK)
+        time_diff = signed(hashes & HASH_FIELD_MASK)
+        return freq, freq_diff, time_diff
+    
+    def _empty_hashes(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Conjunto vazio de hashes"""
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
     
     def add_song_to_database(self, title: str, artist: str, audio_path: str, 
                            album: str = None) -> int:
         """Adiciona uma música ao banco de dados"""
         try:
-            # Gerar fingerprint
-            hashes = self.generate_fingerprint(audio_path)
+            # Decodificar uma única vez para fingerprint e duração
+            hashes, offsets, duration = self.fingerprint_file(audio_path)
             
-            if not hashes:
+            return self.add_fingerprinted_song(title, artist, audio_path, duration,
+                                               hashes, offsets, album)
+        except Exception as e:
+            print(f"❌ Erro ao adicionar música: {str(e)}")
+            return None
+    
+    def add_fingerprinted_song(self, title: str, artist: str, audio_path: str, duration: float,
+                               hashes: np.ndarray, offsets: np.ndarray, album: str = None) -> int:
+        """Grava uma música cujo fingerprint já foi calculado"""
+        try:
+            if len(hashes) == 0:
                 raise Exception("Não foi possível gerar fingerprint")
             
-            # Calcular duração
-            y, sr = librosa.load(audio_path, sr=self.sample_rate)
-            duration = len(y) / sr
+            song_id = None
+            try:
+                with self.db.connection() as conn:
+                    cursor = conn.cursor()
+                    
+                    # Inserir música
+                    cursor.execute('''
+                        INSERT INTO songs (title, artist, album, file_path, duration, fingerprint_count)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (title, artist, album, audio_path, duration, len(hashes)))
+                    
+                    song_id = cursor.lastrowid
+                    
+                    # Inserir fingerprints no índice (novo segmento de escrita); a contagem é a dos postings gravados
+                    count = self.index.add_song(song_id, hashes, offsets)
+                    cursor.execute('UPDATE songs SET fingerprint_count = ? WHERE id = ?', (count, song_id))
+            except Exception:
+                # Música não gravada no catálogo: retirar do índice os postings já escritos
+                if song_id is not None:
+                    self.index.remove_song(song_id)
+                raise
+            
+            print(f"✅ Música '{title}' por '{artist}' adicionada com {len(hashes)} fingerprints")
+            return song_id
             
-            with sqlite3.connect(self.db_path) as conn:
+        except Exception as e:
+            print(f"❌ Erro ao adicionar música: {str(e)}")
+            return None
+    
+    def add_fingerprinted_songs(self, songs: List[Dict]) -> List[int]:
+        """Grava várias músicas já processadas em uma única transação
+        
+        Cada item deve conter title, artist, album, file_path, duration, hashes e offsets.
+        Os fingerprints do lote vão para um único segmento do índice. Se o commit do
+        catálogo falhar, os postings do lote são retirados do índice.
+        """
+        if not songs:
+            return []
+        
+        song_ids = []
+        try:
+            with self.db.connection() as conn:
                 cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
                 
-                # Inserir música
-                cursor.execute('''
-                    INSERT INTO songs (title, artist, album, file_path, duration)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (title, artist, album, audio_path, duration))
-                
-                song_id = cursor.lastrowid
+                # IDs reservados explicitamente para permitir executemany (escritor único no lote)
+                first_id = self._next_song_id(cursor)
+                song_ids = list(range(first_id, first_id + len(songs)))
                 
-                # Inserir fingerprints
-                fingerprint_data = [(song_id, hash_val, offset) for hash_val, offset in hashes]
                 cursor.executemany('''
-                    INSERT INTO fingerprints (song_id, hash_value, offset)
-                    VALUES (?, ?, ?)
-                ''', fingerprint_data)
+                    INSERT INTO songs (id, title, artist, album, file_path, duration, fingerprint_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', [
+                    (song_id, song['title'], song['artist'], song.get('album'), song['file_path'],
+                     song['duration'], len(song['hashes']))
+                    for song_id, song in zip(song_ids, songs)
+                ])
                 
-                conn.commit()
-                
-                print(f"✅ Música '{title}' por '{artist}' adicionada com {len(hashes)} fingerprints")
-                return song_id
-                
-        except Exception as e:
-            print(f"❌ Erro ao adicionar música: {str(e)}")
-            return None
+                counts = self.index.add_songs(
+                    (song_id, song['hashes'], song['offsets']) for song_id, song in zip(song_ids, songs)
+                )
+                cursor.executemany('UPDATE songs SET fingerprint_count = ? WHERE id = ?',
+                                   [(count, song_id) for song_id, count in counts.items()])
+        except Exception:
+            # Ids que não chegaram ao índice são ignorados por remove_song
+            for song_id in song_ids:
+                self.index.remove_song(song_id)
+            raise
+        
+        return song_ids
+    
+    def get_song_ids_by_path(self, file_paths: List[str]) -> Dict[str, int]:
+        """IDs das músicas já gravadas para cada caminho (a mais recente, se houver várias)"""
+        file_paths = list(dict.fromkeys(file_paths))
+        if not file_paths:
+            return {}
+        
+        song_ids = {}
+        with self.db.connection() as conn:
+            # Lotes abaixo do limite de parâmetros do SQLite
+            for start in range(0, len(file_paths), 500):
+                chunk = file_paths[start:start + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                rows = conn.execute(f'''
+                    SELECT file_path, MAX(id) FROM songs
+                    WHERE file_path IN ({placeholders})
+                    GROUP BY file_path
+                ''', chunk).fetchall()
+                song_ids.update(rows)
+        return song_ids
+    
+    def _next_song_id(self, cursor) -> int:
+        """Próximo ID de música sem reaproveitar IDs de músicas removidas"""
+        cursor.execute('''
+            SELECT MAX(
+                COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'songs'), 0),
+                COALESCE((SELECT MAX(id) FROM songs), 0)
+            ) + 1
+        ''')
+        return cursor.fetchone()[0]
     
-    def find_matching_song(self, audio_path: str, threshold: float = 0.3) -> Optional[Dict]:
+    def find_matching_song(self, audio_path: str, threshold: float = MATCH_THRESHOLD,
+                           fingerprint: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Optional[Dict]:
         """Encontra música correspondente no banco de dados"""
+        candidates = self.find_matching_songs(audio_path, top_k=1, fingerprint=fingerprint)
+        return self.best_match(candidates, threshold)
+    
+    @staticmethod
+    def best_match(candidates: List[Dict], threshold: float = MATCH_THRESHOLD) -> Optional[Dict]:
+        """Melhor candidata, se atingir a confiança mínima"""
+        if candidates and candidates[0]['confidence'] >= threshold:
+            return candidates[0]
+        
+        return None
+    
+    def find_matching_songs(self, audio_path: str, top_k: int = None,
+                            fingerprint: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> List[Dict]:
+        """Retorna as top-K músicas candidatas, da mais para a menos provável
+        
+        `fingerprint` (hashes, offsets) já calculado do trecho evita decodificá-lo de novo.
+        """
         try:
             # Gerar fingerprint da música de entrada
-            query_hashes = self.generate_fingerprint(audio_path)
+            if fingerprint is None:
+                fingerprint = self.generate_fingerprint(audio_path)
+            query_hashes, query_offsets = fingerprint
             
-            if not query_hashes:
-                return None
+            if len(query_hashes) == 0:
+                return []
             
             # Buscar correspondências no banco
-            matches = self._find_hash_matches(query_hashes)
-            
-            if not matches:
-                return None
+            song_ids, deltas = self._find_candidate_matches(query_hashes, query_offsets)
             
             # Calcular scores de correspondência
-            song_scores = self._calculate_match_scores(matches)
-            
-            # Encontrar melhor correspondência
-            best_match = max(song_scores.items(), key=lambda x: x[1])
+            with stage('scoring'):
+                candidates = self._calculate_match_scores(song_ids, deltas, top_k or self.top_k)
             
-            if best_match[1] >= threshold:
-                song_id, score = best_match
-                song_info = self._get_song_info(song_id)
-                song_info['confidence'] = score
-                return song_info
+            results = []
+            with stage('metadata'):
+                for candidate in candidates:
+                    song_info = self._get_song_info(candidate['song_id'])
+                    if song_info is None:
+                        continue
+                    song_info.update(candidate)
+                    song_info['confidence'] = candidate['score']
+                    results.append(song_info)
             
-            return None
+            return results
             
         except Exception as e:
             print(f"Erro ao encontrar música correspondente: {str(e)}")
-            return None
+            return []
     
-    def _find_hash_matches(self, query_hashes: List[Tuple[str, int]]) -> Dict[int, List[Tuple[int, int]]]:
-        """Encontra correspondências de hashes no banco de dados"""
-        matches = {}
+    def find_matching_songs_batch(self, fingerprints: List[Tuple[np.ndarray, np.ndarray]],
+                                  top_k: int = None) -> List[List[Dict]]:
+        """Top-K candidatas de vários trechos já processados, com uma única busca no índice
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        Os hashes de todos os trechos são consultados juntos e as correspondências
+        são separadas de volta por trecho pela posição na consulta combinada.
+        """
+        if not fingerprints:
+            return []
+        
+        lengths = np.array([len(hashes) for hashes, _ in fingerprints], dtype=np.int64)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        if lengths.sum() == 0:
+            return [[] for _ in fingerprints]
+        
+        query_hashes = np.concatenate([np.asarray(hashes, dtype=np.int64) for hashes, _ in fingerprints])
+        query_offsets = np.concatenate([np.asarray(offsets, dtype=np.int64) for _, offsets in fingerprints])
+        
+        positions, song_ids, deltas = self._find_hash_matches(query_hashes, query_offsets, return_positions=True)
+        
+        # Trecho de cada correspondência, agrupando as correspondências por trecho
+        clips = np.searchsorted(starts, positions, side='right') - 1
+        order = np.argsort(clips, kind='stable')
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(clips, minlength=len(fingerprints)))))
+        
+        with stage('scoring'):
+            candidates = [
+                self._calculate_match_scores(song_ids[order[bounds[i]:bounds[i + 1]]],
+                                             deltas[order[bounds[i]:bounds[i + 1]]], top_k or self.top_k)
+                for i in range(len(fingerprints))
+            ]
+        
+        with stage('metadata'):
+            songs = self._get_songs_info({candidate['song_id'] for clip in candidates for candidate in clip})
+        
+        results = []
+        for clip in candidates:
+            clip_results = []
+            for candidate in clip:
+                song_info = songs.get(candidate['song_id'])
+                if song_info is None:
+                    continue
+                song_info = dict(song_info, **candidate)
+                song_info['confidence'] = candidate['score']
+                clip_results.append(song_info)
+            results.append(clip_results)
+        
+        return results
+    
+    def find_songs_in_recording(self, audio_path: str, window_seconds: float = 10.0,
+                                hop_seconds: float = 5.0, threshold: float = 0.3) -> List[Dict]:
+        """Identifica quais músicas ocorrem em uma gravação longa (mix, rádio...)
+        
+        O arquivo é processado em streaming; cada bloco de hashes é consultado no
+        índice uma única vez e as correspondências são avaliadas em janelas
+        deslizantes. Janelas consecutivas da mesma música viram um segmento.
+        """
+        try:
+            frames_per_second = self.sample_rate / self.hop_length
+            window_frames = max(1, int(round(window_seconds * frames_per_second)))
+            hop_frames = max(1, int(round(hop_seconds * frames_per_second)))
             
-            for hash_val, offset in query_hashes:
-                cursor.execute('''
-                    SELECT song_id, offset FROM fingerprints 
-                    WHERE hash_value = ?
-                ''', (hash_val,))
+            # Correspondências que ainda caem em alguma janela: (offset na gravação, song_id, delta)
+            pending = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64))
+            window_start = 0
+            frontier = 0
+            detections = []
+            
+            for hashes, offsets in self.iter_fingerprint_stream(audio_path):
+                positions, song_ids, db_offsets = self.index.lookup(hashes)
+                query_offsets = offsets[positions].astype(np.int64)
+                deltas = db_offsets.astype(np.int64) - query_offsets
+                pending = tuple(np.concatenate(pair) for pair in zip(pending, (query_offsets, song_ids, deltas)))
                 
-                results = cursor.fetchall()
+                # Todas as âncoras até o maior offset emitido já foram processadas
+                frontier = max(frontier, int(offsets.max()) + 1)
                 
-                for song_id, db_offset in results:
-                    if song_id not in matches:
-                        matches[song_id] = []
-                    matches[song_id].append((offset, db_offset))
-        
-        return matches
+                while window_start + window_frames <= frontier:
+                    self._detect_window(pending, window_start, window_start + window_frames,
+                                        threshold, detections)
+                    window_start += hop_frames
+                
+                # Descartar correspondências que nenhuma janela futura usa
+                keep = pending[0] >= window_start
+                pending = tuple(values[keep] for values in pending)
+            
+            # Trecho final, mais curto que uma janela
+            if window_start < frontier and (not detections or detections[-1][1] < frontier):
+                self._detect_window(pending, window_start, frontier, threshold, detections)
+            
+            return self._merge_detections(detections, frames_per_second)
+            
+        except Exception as e:
+            print(f"Erro ao analisar gravação: {str(e)}")
+            return []
     
-    def _calculate_match_scores(self, matches: Dict[int, List[Tuple[int, int]]]) -> Dict[int, float]:
-        """Calcula scores de correspondência baseados em offsets"""
-        scores = {}
+    def _detect_window(self, matches: Tuple[np.ndarray, np.ndarray, np.ndarray], start: int, end: int,
+                       threshold: float, detections: List[Tuple[int, int, Dict]]):
+        """Avalia uma janela [start, end) da gravação e registra a melhor música"""
+        query_offsets, song_ids, deltas = matches
+        in_window = (query_offsets >= start) & (query_offsets < end)
         
-        for song_id, offset_pairs in matches.items():
-            if len(offset_pairs) < 3:  # Mínimo de correspondências
+        candidates = self._calculate_match_scores(song_ids[in_window], deltas[in_window], 1)
+        if candidates and candidates[0]['score'] >= threshold:
+            detections.append((start, end, candidates[0]))
+    
+    def _merge_detections(self, detections: List[Tuple[int, int, Dict]],
+                          frames_per_second: float) -> List[Dict]:
+        """Une janelas sobrepostas da mesma música em segmentos"""
+        merged = []
+        for start, end, candidate in detections:
+            previous = merged[-1] if merged else None
+            if previous and previous['song_id'] == candidate['song_id'] and start <= previous['end']:
+                previous['end'] = max(previous['end'], end)
+                previous['matches'] = max(previous['matches'], candidate['matches'])
+                previous['score'] = max(previous['score'], candidate['score'])
                 continue
             
-            # Calcular diferenças de offset
-            offset_diffs = [db_offset - query_offset for query_offset, db_offset in offset_pairs]
+            merged.append({
+                'song_id': candidate['song_id'],
+                'start': start,
+                'end': end,
+                'matches': candidate['matches'],
+                'score': candidate['score'],
+                'offset_seconds': candidate['offset_seconds']
+            })
+        
+        segments = []
+        for segment in merged:
+            song_info = self._get_song_info(segment['song_id'])
+            if song_info is None:
+                continue
             
-            # Encontrar offset mais comum (histograma)
-            from collections import Counter
-            diff_counts = Counter(offset_diffs)
-            most_common_diff, count = diff_counts.most_common(1)[0]
+            start_seconds = segment['start'] / frames_per_second
+            song_info.update({
+                'start_seconds': start_seconds,
+                'end_seconds': segment['end'] / frames_per_second,
+                'song_position_seconds': start_seconds + segment['offset_seconds'],
+                'matches': segment['matches'],
+                'confidence': segment['score']
+            })
+            segments.append(song_info)
+        
+        return segments
+    
+    def _find_candidate_matches(self, query_hashes: np.ndarray,
+                                query_offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Correspondências (song_id, delta) a pontuar, segundo self.matcher
+        
+        Em dois estágios, uma amostra determinística dos hashes (depende só do valor do
+        hash, então a música certa tem os mesmos hashes amostrados) escolhe as músicas da
+        lista curta; os demais hashes só leem os postings dessas músicas.
+        """
+        # Com poucas músicas no índice a lista curta não descartaria nada
+        if self.matcher != 'two_stage' or self.index.song_count <= self.shortlist_size:
+            return self._find_hash_matches(query_hashes, query_offsets)
+        
+        query_hashes = np.asarray(query_hashes, dtype=np.int64)
+        query_offsets = np.asarray(query_offsets)
+        sampled = self._shortlist_sample(query_hashes)
+        
+        song_ids, deltas = self._find_hash_matches(query_hashes[sampled], query_offsets[sampled])
+        shortlist = self._shortlist_songs(song_ids, deltas)
+        
+        in_shortlist = np.isin(song_ids, shortlist)
+        song_ids, deltas = song_ids[in_shortlist], deltas[in_shortlist]
+        if not sampled.all():
+            rest_ids, rest_deltas = self._find_hash_matches(query_hashes[~sampled], query_offsets[~sampled],
+                                                            song_filter=shortlist)
+            song_ids, deltas = np.concatenate([song_ids, rest_ids]), np.concatenate([deltas, rest_deltas])
+        
+        self.lookup_stats['shortlist_queries'] += 1
+        if self.recall_check_interval and self.lookup_stats['shortlist_queries'] % self.recall_check_interval == 0:
+            self._check_recall(query_hashes, query_offsets, song_ids, deltas)
+        return song_ids, deltas
+    
+    def _check_recall(self, query_hashes: np.ndarray, query_offsets: np.ndarray,
+                      song_ids: np.ndarray, deltas: np.ndarray):
+        """Compara a melhor candidata dos dois estágios com a da busca exaustiva (fora dos contadores de busca)"""
+        with stage('recall_check'):
+            positions, all_ids, db_offsets = self.index.lookup(query_hashes)
+            all_deltas = db_offsets.astype(np.int64) - query_offsets.astype(np.int64)[positions]
+            reference = self._calculate_match_scores(all_ids, all_deltas, 1)
+            if not reference:
+                return
+            best = self._calculate_match_scores(song_ids, deltas, 1)
+        
+        self.lookup_stats['recall_checks'] += 1
+        if best and best[0]['song_id'] == reference[0]['song_id']:
+            self.lookup_stats['recall_hits'] += 1
+    
+    def _shortlist_sample(self, query_hashes: np.ndarray) -> np.ndarray:
+        """Máscara dos hashes usados no primeiro estágio (fração shortlist_sample_rate)"""
+        with np.errstate(over='ignore'):
+            mixed = query_hashes.view(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        sampled = (mixed >> np.uint64(48)) < np.uint64(int(self.shortlist_sample_rate * 65536))
+        
+        # Consultas curtas demais para amostrar: usar todos os hashes
+        if sampled.sum() < self.min_matches * 10:
+            sampled[:] = True
+        return sampled
+    
+    def _shortlist_songs(self, song_ids: np.ndarray, deltas: np.ndarray) -> np.ndarray:
+        """Ids (ordenados) das shortlist_size músicas mais alinhadas na amostra"""
+        with stage('shortlist'):
+            candidates = self._calculate_match_scores(song_ids, deltas, self.shortlist_size, min_matches=1)
+        return np.sort(np.asarray([candidate['song_id'] for candidate in candidates], dtype=np.int32))
+    
+    def _find_hash_matches(self, query_hashes: np.ndarray, query_offsets: np.ndarray,
+                           return_positions: bool = False, song_filter: np.ndarray = None) -> Tuple[np.ndarray, ...]:
+        """Encontra correspondências de hashes no índice de fingerprints
+        
+        Retorna arrays planos (song_id, delta), com delta = offset no banco - offset na consulta
+        (precedidos pela posição na consulta com return_positions=True). Com song_filter
+        só as músicas listadas são consideradas.
+        """
+        with stage('index_lookup'):
+            search_start = time.perf_counter()
+            positions, song_ids, db_offsets = self.index.lookup(query_hashes, song_filter)
+            search_time = time.perf_counter() - search_start
             
-            # Score baseado na consistência dos offsets
-            score = count / len(offset_pairs)
-            scores[song_id] = score
+            group_start = time.perf_counter()
+            deltas = db_offsets.astype(np.int64) - np.asarray(query_offsets, dtype=np.int64)[positions]
+            group_time = time.perf_counter() - group_start
+        
+        self._record_lookup(len(query_hashes), len(song_ids), search_time, group_time)
+        if return_positions:
+            return positions, song_ids, deltas
+        return song_ids, deltas
+    
+    def _record_lookup(self, query_hashes: int, matched_rows: int, search_time: float, group_time: float):
+        """Atualiza os contadores de tempo da busca de hashes"""
+        stats = self.lookup_stats
+        stats['queries'] += 1
+        stats['query_hashes'] += query_hashes
+        stats['matched_rows'] += matched_rows
+        stats['search_time'] += search_time
+        stats['group_time'] += group_time
+        stats['last_query'] = {
+            'query_hashes': query_hashes,
+            'matched_rows': matched_rows,
+            'search_ms': search_time * 1000,
+            'group_ms': group_time * 1000
+        }
+    
+    def get_lookup_stats(self) -> Dict:
+        """Retorna contadores de custo das buscas de hashes"""
+        stats = self.lookup_stats
+        queries = stats['queries']
+        total_time = stats['search_time'] + stats['group_time']
+        
+        return {
+            'queries': queries,
+            'query_hashes': stats['query_hashes'],
+            'matched_rows': stats['matched_rows'],
+            'total_ms': total_time * 1000,
+            'avg_ms_per_query': total_time * 1000 / queries if queries > 0 else 0,
+            'avg_search_ms': stats['search_time'] * 1000 / queries if queries > 0 else 0,
+            'avg_group_ms': stats['group_time'] * 1000 / queries if queries > 0 else 0,
+            'last_query': stats['last_query'],
+            'shortlist_queries': stats['shortlist_queries'],
+            'recall_checks': stats['recall_checks'],
+            'shortlist_recall': stats['recall_hits'] / stats['recall_checks'] if stats['recall_checks'] else None
+        }
+    
+    def _calculate_match_scores(self, song_ids: np.ndarray, deltas: np.ndarray, top_k: int,
+                                min_matches: int = None) -> List[Dict]:
+        """Calcula scores de correspondência baseados em offsets
+        
+        Para cada música encontra o pico do histograma de deltas de offset e
+        retorna as top-K por quantidade de hashes alinhados.
+        """
+        if len(song_ids) == 0:
+            return []
+        
+        unique_songs, song_idx, song_totals = np.unique(song_ids, return_inverse=True, return_counts=True)
+        
+        # Histograma conjunto (música, delta) com chave única por par
+        min_delta = deltas.min()
+        span = int(deltas.max() - min_delta) + 1
+        keys = song_idx.astype(np.int64) * span + (deltas - min_delta)
+        pair_keys, pair_counts = np.unique(keys, return_counts=True)
+        pair_song = pair_keys // span
+        pair_delta = pair_keys % span + min_delta
+        
+        # Pico do histograma de cada música (pair_song já está em ordem crescente)
+        order = np.lexsort((-pair_counts, pair_song))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair_song[order][1:] != pair_song[order][:-1]
+        peak = order[first]
+        
+        best_counts = pair_counts[peak]
+        best_deltas = pair_delta[peak]
+        scores = best_counts / song_totals
+        
+        # Mínimo de correspondências alinhadas
+        valid = np.flatnonzero(best_counts >= (self.min_matches if min_matches is None else min_matches))
+        if valid.size == 0:
+            return []
+        
+        # Top-K por contagem absoluta, desempatando pelo score
+        if valid.size > top_k:
+            valid = valid[np.argpartition(-best_counts[valid], top_k - 1)[:top_k]]
+        ranked = valid[np.lexsort((-scores[valid], -best_counts[valid]))]
         
-        return scores
+        seconds_per_frame = self.hop_length / self.sample_rate
+        return [
+            {
+                'song_id': int(unique_songs[i]),
+                'matches': int(best_counts[i]),
+                'total_matches': int(song_totals[i]),
+                'score': float(scores[i]),
+                'offset': int(best_deltas[i]),
+                'offset_seconds': float(best_deltas[i] * seconds_per_frame)
+            }
+            for i in ranked
+        ]
     
     def _get_song_info(self, song_id: int) -> Dict:
         """Obtém informações de uma música pelo ID"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.db.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT title, artist, album, duration, created_at
@@ -302,9 +1049,50 @@ class AudioFingerprint:
                 }
             return None
     
+    def _get_songs_info(self, song_ids) -> Dict[int, Dict]:
+        """Obtém informações de várias músicas em uma única consulta"""
+        song_ids = [int(song_id) for song_id in song_ids]
+        if not song_ids:
+            return {}
+        
+        placeholders = ', '.join('?' * len(song_ids))
+        with self.db.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT id, title, artist, album, duration, created_at
+                FROM songs WHERE id IN ({placeholders})
+            ''', song_ids).fetchall()
+        
+        return {
+            row[0]: {
+                'id': row[0],
+                'title': row[1],
+                'artist': row[2],
+                'album': row[3],
+                'duration': row[4],
+                'created_at': row[5]
+            }
+            for row in rows
+        }
+    
+    def remove_song(self, song_id: int) -> bool:
+        """Remove uma música dos metadados e do índice de fingerprints"""
+        try:
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM songs WHERE id = ?', (song_id,))
+                conn.commit()
+            
+            self.index.remove_song(song_id)
+            return True
+        except Exception as e:
+            print(f"❌ Erro ao remover fingerprints: {str(e)}")
+            return False
+    
     def get_database_stats(self) -> Dict:
         """Retorna estatísticas do banco de dados"""
-        with sqlite3.connect(self.db_path) as conn:
+        index_stats = self.index.get_stats()
+        
+        with self.db.connection() as conn:
             cursor = conn.cursor()
             
             # Contar músicas
@@ -312,15 +1100,12 @@ class AudioFingerprint:
             song_count = cursor.fetchone()[0]
             
             # Contar fingerprints
-            cursor.execute('SELECT COUNT(*) FROM fingerprints')
-            fingerprint_count = cursor.fetchone()[0]
+            fingerprint_count = index_stats['total_postings']
             
             # Música com mais fingerprints
             cursor.execute('''
-                SELECT s.title, s.artist, COUNT(f.id) as fingerprint_count
-                FROM songs s
-                LEFT JOIN fingerprints f ON s.id = f.song_id
-                GROUP BY s.id
+                SELECT title, artist, fingerprint_count
+                FROM songs
                 ORDER BY fingerprint_count DESC
                 LIMIT 1
             ''')
@@ -334,5 +1119,7 @@ class AudioFingerprint:
                     'title': top_song[0] if top_song else None,
                     'artist': top_song[1] if top_song else None,
                     'fingerprint_count': top_song[2] if top_song else 0
-                } if top_song else None
-            }
+                } if top_song else None,
+                'index': index_stats,
+                'lookup': self.get_lookup_stats()
+            }
\ No newline at end of file
@@ -2,7 +2,6 @@
 Serviço para processamento de áudio
 """
 import os
-import librosa
 import numpy as np
 import soundfile as sf
 from pydub import AudioSegment
@@ -10,10 +9,18 @@ from pydub.utils import which
 import tempfile
 import threading
 import time
+import uuid
 from datetime import datetime
+from services.feature_context import FeatureContext
+from services.analysis_cache import AnalysisCache
+from services.audio_decoder import decode_audio
+
+# Versão do formato de extract_features (invalida resultados antigos no cache)
+FEATURES_VERSION = 2
 
 class AudioService:
-    def __init__(self):
+    def __init__(self, cache: AnalysisCache = None):
+        self.cache = cache if cache is not None else AnalysisCache()
         self.recording = False
         self.audio_data = []
         self.sample_rate = 44100
@@ -25,8 +32,12 @@ class AudioService:
         """Garante que o diretório temporário existe"""
         os.makedirs(self.temp_dir, exist_ok=True)
     
-    def record_audio(self, duration=10):
-        """Grava áudio por um período específico"""
+    def record_audio(self, duration=10, on_chunk=None):
+        """Grava áudio por um período específico
+        
+        Se `on_chunk` for informado, cada bloco PCM int16 é entregue a ele assim
+        que lido; a gravação termina antes do tempo quando ele retorna True.
+        """
         try:
             import pyaudio
             
@@ -55,6 +66,8 @@ class AudioService:
                     break
                 data = stream.read(chunk)
                 frames.append(data)
+                if on_chunk is not None and on_chunk(data):
+                    break
             
             stream.stop_stream()
             stream.close()
@@ -114,41 +127,49 @@ class AudioService:
             return None
     
     def extract_features(self, audio_path):
-        """Extrai características do áudio para reconhecimento"""
+        """Extrai características resumidas do áudio para reconhecimento
+        
+        Apenas médias por coeficiente (não as séries por frame), para manter
+        pequeno o resultado guardado no cache de análises.
+        """
         try:
             # Carregar áudio
-            y, sr = librosa.load(audio_path, sr=self.sample_rate)
+            y, sr = decode_audio(audio_path, sr=self.sample_rate)
+            
+            # Mesmo conteúdo já processado: devolver do cache
+            cache_key = AnalysisCache.make_key('features', FEATURES_VERSION, AnalysisCache.content_hash(y, sr))
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            # Primitivas espectrais compartilhadas (uma única STFT)
+            ctx = FeatureContext(y, sr)
             
             # Extrair características
             features = {}
             
             # MFCC (Mel-frequency cepstral coefficients)
-            mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-            features['mfcc'] = mfccs.tolist()
+            features['mfcc_mean'] = ctx.mfcc.mean(axis=1).tolist()
             
             # Spectral centroid
-            spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)
-            features['spectral_centroid'] = spectral_centroids.tolist()
+            features['spectral_centroid_mean'] = float(np.mean(ctx.spectral_centroid))
             
             # Spectral rolloff
-            spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)
-            features['spectral_rolloff'] = spectral_rolloff.tolist()
+            features['spectral_rolloff_mean'] = float(np.mean(ctx.spectral_rolloff))
             
             # Zero crossing rate
-            zcr = librosa.feature.zero_crossing_rate(y)
-            features['zcr'] = zcr.tolist()
+            features['zcr_mean'] = float(np.mean(ctx.zcr))
             
             # Chroma
-            chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-            features['chroma'] = chroma.tolist()
+            features['chroma_mean'] = ctx.chroma.mean(axis=1).tolist()
             
             # Tempo
-            tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-            features['tempo'] = float(tempo)
+            features['tempo'] = ctx.tempo
             
             # Duração
             features['duration'] = len(y) / sr
             
+            self.cache.put(cache_key, features)
             return features
             
         except Exception as e:
@@ -158,8 +179,9 @@ class AudioService:
     def save_temp_audio(self, audio_file):
         """Salva arquivo de áudio temporário"""
         try:
+            # Sufixo aleatório: envios simultâneos no mesmo segundo não se sobrescrevem
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"temp_audio_{timestamp}.wav"
+            filename = f"temp_audio_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
             filepath = os.path.join(self.temp_dir, filename)
             
             audio_file.save(filepath)
@@ -0,0 +1,127 @@
+"""
+Gerenciador de conexões SQLite
+Reaproveita conexões já abertas (com cache de instruções preparadas) em vez de
+abrir uma nova a cada operação, e configura WAL para que leituras não esperem
+pelas escritas de uma ingestão em lote
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+class ConnectionManager:
+    def __init__(self, db_path: str, timeout: float = 30.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        
+        # Pragmas aplicados a cada conexão nova
+        self.mmap_size = 256 * 1024 * 1024  # bytes lidos via mmap em vez de read()
+        self.cache_size_kb = 64 * 1024  # cache de páginas por conexão
+        self.cached_statements = 256  # instruções preparadas mantidas por conexão
+        
+        self.max_idle = 8  # conexões ociosas mantidas para reuso
+        
+        self._local = threading.local()
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._inherited = []
+        self.stats = {'opened': 0, 'reused': 0, 'closed': 0}
+    
+    def _open(self) -> sqlite3.Connection:
+        """Abre e configura uma conexão nova"""
+        # A conexão pode ser usada por outra thread depois de devolvida, nunca por duas ao mesmo tempo
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        self.stats['opened'] += 1
+        return conn
+    
+    def _check_fork(self):
+        """Conexões herdadas de outro processo (fork) não podem ser usadas nem fechadas"""
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._inherited.extend(self._idle)
+            self._idle = []
+            self._local = threading.local()
+    
+    def _acquire(self) -> sqlite3.Connection:
+        """Conexão ociosa mais recente ou uma nova"""
+        with self._lock:
+            self._check_fork()
+            if self._idle:
+                self.stats['reused'] += 1
+                return self._idle.pop()
+        return self._open()
+    
+    def _release(self, conn: sqlite3.Connection):
+        """Devolve a conexão ao conjunto de ociosas"""
+        if conn.in_transaction:
+            conn.rollback()
+        
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self.stats['closed'] += 1
+        conn.close()
+    
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Conexão em uma transação: commit ao final, rollback em caso de exceção
+        
+        Blocos aninhados na mesma thread compartilham a conexão (e a transação) do bloco
+        externo; só o bloco mais externo (profundidade 0) faz commit ou rollback.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+        
+        conn = self._acquire()
+        self._local.conn, self._local.depth = conn, 0
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn)
+    
+    def close_all(self):
+        """Fecha as conexões ociosas"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.stats['closed'] += len(idle)
+        for conn in idle:
+            conn.close()
+    
+    def get_stats(self) -> Dict:
+        """Retorna contadores de conexões"""
+        with self._lock:
+            return dict(self.stats, idle=len(self._idle))
+
+_managers: Dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+def get_connection_manager(db_path: str) -> ConnectionManager:
+    """Gerenciador compartilhado por todos os usuários de um mesmo arquivo de banco"""
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = ConnectionManager(db_path)
+        return manager
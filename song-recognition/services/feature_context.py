@@ -0,0 +1,100 @@
+"""
+Contexto de características de um sinal
+Calcula sob demanda e memoriza STFT, mel, onsets, beats, chroma e MFCC, para
+que cada primitiva espectral seja calculada uma única vez por análise
+"""
+import numpy as np
+import librosa
+from functools import cached_property
+
+class FeatureContext:
+    def __init__(self, y: np.ndarray, sr: int, hop_length: int = 512, n_fft: int = 2048, n_mfcc: int = 13):
+        self.y = y
+        self.sr = sr
+        self.hop_length = hop_length
+        self.n_fft = n_fft
+        self.n_mfcc = n_mfcc
+    
+    @property
+    def duration(self) -> float:
+        """Duração do sinal em segundos"""
+        return len(self.y) / self.sr
+    
+    @cached_property
+    def magnitude(self) -> np.ndarray:
+        """Espectrograma de magnitude (a única STFT da análise)"""
+        return np.abs(librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length))
+    
+    @cached_property
+    def power(self) -> np.ndarray:
+        """Espectrograma de potência"""
+        return self.magnitude ** 2
+    
+    @cached_property
+    def mel(self) -> np.ndarray:
+        """Espectrograma mel (potência)"""
+        return librosa.feature.melspectrogram(S=self.power, sr=self.sr)
+    
+    @cached_property
+    def mel_db(self) -> np.ndarray:
+        """Espectrograma mel em dB"""
+        return librosa.power_to_db(self.mel)
+    
+    @cached_property
+    def onset_envelope(self) -> np.ndarray:
+        """Força de onset por frame"""
+        return librosa.onset.onset_strength(S=self.mel_db, sr=self.sr, hop_length=self.hop_length)
+    
+    @cached_property
+    def onset_frames(self) -> np.ndarray:
+        """Frames com onsets detectados"""
+        return librosa.onset.onset_detect(onset_envelope=self.onset_envelope, sr=self.sr,
+                                          hop_length=self.hop_length)
+    
+    @cached_property
+    def _beat_track(self):
+        """Tempo e beats a partir do envelope de onset (beat_track retorna o tempo como array)"""
+        tempo, beats = librosa.beat.beat_track(onset_envelope=self.onset_envelope, sr=self.sr,
+                                               hop_length=self.hop_length)
+        return float(np.atleast_1d(tempo)[0]), beats
+    
+    @property
+    def tempo(self) -> float:
+        """Tempo estimado (BPM)"""
+        return self._beat_track[0]
+    
+    @property
+    def beats(self) -> np.ndarray:
+        """Frames dos beats"""
+        return self._beat_track[1]
+    
+    @cached_property
+    def chroma(self) -> np.ndarray:
+        """Chromagrama a partir do espectrograma de potência"""
+        return librosa.feature.chroma_stft(S=self.power, sr=self.sr)
+    
+    @cached_property
+    def mfcc(self) -> np.ndarray:
+        """MFCCs a partir do espectrograma mel"""
+        return librosa.feature.mfcc(S=self.mel_db, sr=self.sr, n_mfcc=self.n_mfcc)
+    
+    @cached_property
+    def spectral_centroid(self) -> np.ndarray:
+        return librosa.feature.spectral_centroid(S=self.magnitude, sr=self.sr)[0]
+    
+    @cached_property
+    def spectral_rolloff(self) -> np.ndarray:
+        return librosa.feature.spectral_rolloff(S=self.magnitude, sr=self.sr)[0]
+    
+    @cached_property
+    def spectral_bandwidth(self) -> np.ndarray:
+        return librosa.feature.spectral_bandwidth(S=self.magnitude, sr=self.sr)[0]
+    
+    @cached_property
+    def rms(self) -> np.ndarray:
+        return librosa.feature.rms(S=self.magnitude, frame_length=self.n_fft)[0]
+    
+    @cached_property
+    def zcr(self) -> np.ndarray:
+        return librosa.feature.zero_crossing_rate(self.y, frame_length=self.n_fft,
+                                                  hop_length=self.hop_length)[0]
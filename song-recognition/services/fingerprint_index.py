@@ -0,0 +1,570 @@
+"""
+Índice invertido de fingerprints em segmentos imutáveis
+Cada segmento guarda postings hash -> (song_id, offset) ordenados por hash em
+arquivos .npy mapeados em memória, consultados com busca binária, e a frequência
+de documento (quantas músicas contêm cada hash), usada para ignorar hashes comuns
+"""
+import os
+import json
+import numpy as np
+from typing import Dict, List, Optional, Tuple, Iterable
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+class FingerprintIndex:
+    def __init__(self, index_dir='data/fingerprint_index'):
+        self.index_dir = index_dir
+        self.manifest_path = os.path.join(index_dir, 'manifest.json')
+        self.lock_path = os.path.join(index_dir, '.lock')
+        
+        # Quantidade de segmentos de escrita antes de mesclar tudo em um segmento base
+        self.max_write_segments = 8
+        
+        # Hashes presentes em mais que max_df_ratio das músicas (e em pelo menos min_stop_df
+        # músicas) não são consultados; None desliga. Só prune_common_hashes os remove do índice
+        self.max_df_ratio = 0.1
+        self.min_stop_df = 50
+        
+        self._manifest = self._empty_manifest()
+        self._manifest_stamp = None
+        self._segments = {}
+        self._deleted_songs = np.empty(0, dtype=np.int32)
+        self._stop_hashes = np.empty(0, dtype=np.int64)
+        self.lookup_stats = {'skipped_query_hashes': 0, 'skipped_postings': 0}
+        
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.refresh()
+    
+    def _empty_manifest(self) -> Dict:
+        """Manifesto de um índice vazio"""
+        return {
+            'version': 1,
+            'generation': 0,
+            'catalog_version': 0,
+            'next_segment': 1,
+            'base_segments': [],
+            'write_segments': [],
+            'deleted_songs': [],
+            'segment_songs': {},
+            'stop_hashes': None
+        }
+    
+    def refresh(self):
+        """Recarrega o manifesto se outro processo alterou o índice"""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return
+        
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._manifest_stamp:
+            return
+        
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        
+        self._apply_manifest(manifest)
+        self._manifest_stamp = stamp
+    
+    def _apply_manifest(self, manifest: Dict):
+        """Abre (via mmap) os segmentos listados no manifesto"""
+        names = manifest['base_segments'] + manifest['write_segments']
+        
+        segments = {}
+        for name in names:
+            segments[name] = self._segments.get(name) or self._open_segment(name)
+        
+        stop_name = manifest.get('stop_hashes')
+        if stop_name != self._manifest.get('stop_hashes') or not self._manifest_stamp:
+            self._stop_hashes = (np.load(self._segment_file(stop_name, 'stop'))
+                                 if stop_name else np.empty(0, dtype=np.int64))
+        
+        self._manifest = manifest
+        self._segments = segments
+        self._deleted_songs = np.asarray(sorted(manifest['deleted_songs']), dtype=np.int32)
+    
+    def _open_segment(self, name: str) -> Dict[str, np.ndarray]:
+        """Mapeia em memória os arrays de um segmento"""
+        segment = {
+            'hashes': np.load(self._segment_file(name, 'hashes'), mmap_mode='r'),
+            'song_ids': np.load(self._segment_file(name, 'songs'), mmap_mode='r'),
+            'offsets': np.load(self._segment_file(name, 'offsets'), mmap_mode='r')
+        }
+        
+        # Segmentos antigos não têm o arquivo de frequência: calculado em memória quando necessário
+        df_path = self._segment_file(name, 'df')
+        segment['df'] = np.load(df_path, mmap_mode='r') if os.path.exists(df_path) else None
+        return segment
+    
+    def _segment_df(self, segment: Dict) -> np.ndarray:
+        """Array (2, n) com os hashes únicos do segmento e em quantas músicas cada um aparece"""
+        if segment['df'] is None:
+            segment['df'] = document_frequency(np.asarray(segment['hashes']), np.asarray(segment['song_ids']))
+        return segment['df']
+    
+    def _segment_file(self, name: str, field: str) -> str:
+        """Caminho do arquivo de um campo do segmento"""
+        return os.path.join(self.index_dir, f'{name}.{field}.npy')
+    
+    @property
+    def generation(self) -> int:
+        """Contador incrementado a cada alteração do índice"""
+        return self._manifest['generation']
+    
+    @property
+    def catalog_version(self) -> int:
+        """Contador incrementado apenas quando músicas entram ou saem do índice (mesclagens não o alteram)"""
+        return self._manifest.get('catalog_version', 0)
+    
+    @property
+    def song_count(self) -> int:
+        """Músicas no índice (segmentos antigos sem contagem são contados uma vez)
+        
+        deleted_songs só contém ids presentes em algum segmento (ver remove_song).
+        """
+        segment_songs = self._manifest.setdefault('segment_songs', {})
+        for name, segment in self._segments.items():
+            if name not in segment_songs:
+                segment_songs[name] = int(np.unique(np.asarray(segment['song_ids'])).size)
+        return max(0, sum(segment_songs[name] for name in self._segments) - len(self._manifest['deleted_songs']))
+    
+    def stop_df_threshold(self) -> Optional[int]:
+        """Frequência de documento acima da qual um hash é ignorado (None se desligado)"""
+        if not self.max_df_ratio:
+            return None
+        return max(self.min_stop_df, int(np.ceil(self.max_df_ratio * self.song_count)))
+    
+    def document_frequency(self, hashes: np.ndarray) -> np.ndarray:
+        """Em quantas músicas do índice aparece cada hash"""
+        hashes = np.asarray(hashes, dtype=np.int64)
+        df = np.zeros(len(hashes), dtype=np.int64)
+        for segment in self._segments.values():
+            seg_hashes, seg_df = self._segment_df(segment)
+            if len(seg_hashes) == 0:
+                continue
+            idx = np.minimum(np.searchsorted(seg_hashes, hashes), len(seg_hashes) - 1)
+            found = seg_hashes[idx] == hashes
+            df[found] += seg_df[idx[found]]
+        return df
+    
+    def is_stop_hash(self, hashes: np.ndarray) -> np.ndarray:
+        """Máscara dos hashes que estão na lista de hashes comuns podados"""
+        hashes = np.asarray(hashes, dtype=np.int64)
+        if self._stop_hashes.size == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        idx = np.minimum(np.searchsorted(self._stop_hashes, hashes), self._stop_hashes.size - 1)
+        return self._stop_hashes[idx] == hashes
+    
+    def lookup(self, query_hashes: np.ndarray,
+               song_filter: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Busca os postings de todos os hashes da consulta
+        
+        Retorna arrays (posição na consulta, song_id, offset) com uma linha por
+        par (ocorrência na consulta, posting no índice). Com song_filter (ids
+        ordenados) só os postings dessas músicas são lidos.
+        """
+        self.refresh()
+        
+        query_hashes = np.asarray(query_hashes, dtype=np.int64)
+        query_order = np.argsort(query_hashes, kind='stable')
+        sorted_query = query_hashes[query_order]
+        unique_hashes, query_start, query_count = np.unique(
+            sorted_query, return_index=True, return_counts=True
+        )
+        
+        # Intervalos de postings de cada hash em cada segmento
+        bounds = [
+            (segment, np.searchsorted(segment['hashes'], unique_hashes, side='left'),
+             np.searchsorted(segment['hashes'], unique_hashes, side='right'))
+            for segment in self._segments.values()
+        ]
+        
+        # Hashes comuns (podados ou acima do limite de frequência) trazem muitas linhas e pouca evidência
+        keep = ~self.is_stop_hash(unique_hashes)
+        threshold = self.stop_df_threshold()
+        if threshold is not None and bounds:
+            postings = sum(right - left for _, left, right in bounds)
+            # A frequência de documento nunca passa da quantidade de postings
+            suspect = np.flatnonzero(keep & (postings > threshold))
+            if suspect.size:
+                keep[suspect[self.document_frequency(unique_hashes[suspect]) > threshold]] = False
+        
+        if not keep.all():
+            skipped = ~keep
+            self.lookup_stats['skipped_query_hashes'] += int(query_count[skipped].sum())
+            self.lookup_stats['skipped_postings'] += int(sum((right - left)[skipped].sum() for _, left, right in bounds))
+        
+        positions, song_ids, offsets = [], [], []
+        for segment, left, right in bounds:
+            found = self._lookup_segment(segment, left, right, keep, query_start, query_count, query_order,
+                                         song_filter)
+            if found is not None:
+                positions.append(found[0])
+                song_ids.append(found[1])
+                offsets.append(found[2])
+        
+        if not positions:
+            return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32))
+        
+        positions = np.concatenate(positions)
+        song_ids = np.concatenate(song_ids)
+        offsets = np.concatenate(offsets)
+        
+        # Descartar músicas removidas que ainda não saíram dos segmentos
+        if self._deleted_songs.size:
+            alive = ~np.isin(song_ids, self._deleted_songs)
+            positions, song_ids, offsets = positions[alive], song_ids[alive], offsets[alive]
+        
+        return positions, song_ids, offsets
+    
+    def _lookup_segment(self, segment: Dict[str, np.ndarray], left: np.ndarray, right: np.ndarray,
+                        keep: np.ndarray, query_start: np.ndarray, query_count: np.ndarray,
+                        query_order: np.ndarray, song_filter: np.ndarray = None):
+        """Expande os postings dos hashes únicos da consulta encontrados em um segmento"""
+        posting_count = right - left
+        
+        hit = (posting_count > 0) & keep
+        if not hit.any():
+            return None
+        
+        left, posting_count = left[hit], posting_count[hit]
+        query_start, query_count = query_start[hit], query_count[hit]
+        
+        # Produto cartesiano (ocorrências na consulta x postings) de cada hash
+        pair_count = query_count * posting_count
+        total = int(pair_count.sum())
+        pair_start = np.cumsum(pair_count) - pair_count
+        group = np.repeat(np.arange(len(pair_count)), pair_count)
+        within = np.arange(total) - pair_start[group]
+        
+        query_pos = query_order[query_start[group] + within // posting_count[group]]
+        posting_idx = left[group] + within % posting_count[group]
+        song_ids = np.asarray(segment['song_ids'][posting_idx], dtype=np.int32)
+        
+        if song_filter is not None:
+            if len(song_filter) == 0:
+                return None
+            idx = np.minimum(np.searchsorted(song_filter, song_ids), len(song_filter) - 1)
+            wanted = song_filter[idx] == song_ids
+            query_pos, posting_idx, song_ids = query_pos[wanted], posting_idx[wanted], song_ids[wanted]
+        
+        return (
+            query_pos,
+            song_ids,
+            np.asarray(segment['offsets'][posting_idx], dtype=np.int32)
+        )
+    
+    def get_stats(self) -> Dict:
+        """Retorna estatísticas do índice"""
+        self.refresh()
+        
+        total_postings = sum(len(seg['hashes']) for seg in self._segments.values())
+        size_bytes = sum(
+            seg['hashes'].nbytes + seg['song_ids'].nbytes + seg['offsets'].nbytes
+            for seg in self._segments.values()
+        )
+        
+        return {
+            'total_postings': total_postings,
+            'songs': self.song_count,
+            'base_segments': len(self._manifest['base_segments']),
+            'write_segments': len(self._manifest['write_segments']),
+            'deleted_songs': len(self._manifest['deleted_songs']),
+            'size_mb': size_bytes / (1024 * 1024),
+            'generation': self.generation,
+            'catalog_version': self.catalog_version,
+            'stop_hashes': int(self._stop_hashes.size),
+            'stop_df_threshold': self.stop_df_threshold(),
+            'skipped_query_hashes': self.lookup_stats['skipped_query_hashes'],
+            'skipped_postings': self.lookup_stats['skipped_postings']
+        }
+    
+    def get_hash_stats(self, top: int = 20) -> Dict:
+        """Distribuição da frequência de documento dos hashes e os hashes mais comuns"""
+        self.refresh()
+        hashes, df = self._global_df()
+        songs = self.song_count
+        threshold = self.stop_df_threshold()
+        
+        if len(hashes) == 0:
+            return {'unique_hashes': 0, 'songs': songs, 'stop_df_threshold': threshold}
+        
+        # Postings por hash, para estimar quanto uma poda removeria
+        postings = self._posting_counts(hashes)
+        
+        common = df > threshold if threshold is not None else np.zeros(len(hashes), dtype=bool)
+        order = np.argsort(-df, kind='stable')[:top]
+        return {
+            'unique_hashes': int(len(hashes)),
+            'songs': songs,
+            'df_mean': float(df.mean()),
+            'df_p50': float(np.percentile(df, 50)),
+            'df_p99': float(np.percentile(df, 99)),
+            'df_max': int(df.max()),
+            'stop_df_threshold': threshold,
+            'common_hashes': int(common.sum()),
+            'common_postings': int(postings[common].sum()),
+            'total_postings': int(postings.sum()),
+            'top_hashes': [
+                {'hash': int(hashes[i]), 'songs': int(df[i]), 'postings': int(postings[i])}
+                for i in order
+            ]
+        }
+    
+    def _global_df(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Frequência de documento de todos os hashes do índice (soma dos segmentos)"""
+        tables = [self._segment_df(segment) for segment in self._segments.values()]
+        if not tables:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        
+        hashes = np.concatenate([np.asarray(table[0]) for table in tables])
+        counts = np.concatenate([np.asarray(table[1]) for table in tables])
+        unique, inverse = np.unique(hashes, return_inverse=True)
+        return unique, np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64)
+    
+    @contextmanager
+    def _write_lock(self):
+        """Lock exclusivo entre processos para alterar o manifesto"""
+        with open(self.lock_path, 'a+') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Garantir que alterações feitas por outro processo sejam vistas
+                self.refresh()
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def add_song(self, song_id: int, hashes: np.ndarray, offsets: np.ndarray) -> int:
+        """Adiciona os fingerprints de uma música em um novo segmento de escrita
+        
+        Retorna quantos postings foram gravados.
+        """
+        return self.add_songs([(song_id, hashes, offsets)]).get(int(song_id), 0)
+    
+    def add_songs(self, songs: Iterable[Tuple[int, np.ndarray, np.ndarray]]) -> Dict[int, int]:
+        """Adiciona fingerprints de várias músicas em um único segmento de escrita
+        
+        Todos os postings são gravados, exceto os de hashes que uma poda explícita
+        (prune_common_hashes) já colocou na lista de hashes podados; hashes comuns
+        novos só são ignorados na consulta. Retorna {song_id: postings gravados}.
+        """
+        hashes, song_ids, offsets = [], [], []
+        for song_id, song_hashes, song_offsets in songs:
+            hashes.append(np.asarray(song_hashes, dtype=np.int64))
+            offsets.append(np.asarray(song_offsets, dtype=np.int32))
+            song_ids.append(np.full(len(song_hashes), song_id, dtype=np.int32))
+        
+        counts = {int(ids[0]): 0 for ids in song_ids if len(ids)}
+        if not counts:
+            return counts
+        
+        with self._write_lock():
+            hashes, song_ids, offsets = np.concatenate(hashes), np.concatenate(song_ids), np.concatenate(offsets)
+            
+            # Hashes já podados como comuns não voltam ao índice
+            stop = self.is_stop_hash(hashes)
+            if stop.any():
+                hashes, song_ids, offsets = hashes[~stop], song_ids[~stop], offsets[~stop]
+            if len(hashes) == 0:
+                return counts
+            
+            hashes, song_ids, offsets = unique_postings(hashes, song_ids, offsets)
+            written_ids, written = np.unique(song_ids, return_counts=True)
+            counts.update(zip(written_ids.tolist(), written.tolist()))
+            
+            manifest = dict(self._manifest)
+            name = self._write_segment(manifest, hashes, song_ids, offsets)
+            manifest['write_segments'] = manifest['write_segments'] + [name]
+            manifest['generation'] += 1
+            manifest['catalog_version'] = manifest.get('catalog_version', 0) + 1
+            self._save_manifest(manifest)
+            
+            if len(manifest['write_segments']) > self.max_write_segments:
+                self._merge_locked()
+        
+        return counts
+    
+    def _posting_counts(self, hashes: np.ndarray) -> np.ndarray:
+        """Postings de cada hash (ordenados) somando todos os segmentos"""
+        counts = np.zeros(len(hashes), dtype=np.int64)
+        for segment in self._segments.values():
+            seg_hashes = segment['hashes']
+            counts += np.searchsorted(seg_hashes, hashes, side='right') - np.searchsorted(seg_hashes, hashes)
+        return counts
+    
+    def _add_stop_hashes(self, manifest: Dict, new_stop: np.ndarray) -> Optional[str]:
+        """Grava a lista de hashes podados acrescida de new_stop; retorna a lista anterior"""
+        stop_hashes = np.union1d(self._stop_hashes, new_stop).astype(np.int64)
+        stop_name = f"stop_{manifest['next_segment']:08d}"
+        manifest['next_segment'] += 1
+        self._save_array(self._segment_file(stop_name, 'stop'), stop_hashes)
+        
+        old_stop = manifest.get('stop_hashes')
+        manifest['stop_hashes'] = stop_name
+        return old_stop
+    
+    def remove_song(self, song_id: int):
+        """Marca uma música como removida (os postings saem na próxima mesclagem)
+        
+        Ids que não estão em nenhum segmento (desconhecidos ou já removidos por uma
+        mesclagem) são ignorados, para não descontá-los de song_count.
+        """
+        with self._write_lock():
+            if not any((np.asarray(segment['song_ids']) == song_id).any() for segment in self._segments.values()):
+                return
+            
+            manifest = dict(self._manifest)
+            manifest['deleted_songs'] = sorted(set(manifest['deleted_songs']) | {int(song_id)})
+            manifest['generation'] += 1
+            manifest['catalog_version'] = manifest.get('catalog_version', 0) + 1
+            self._save_manifest(manifest)
+    
+    def merge(self):
+        """Mescla todos os segmentos em um único segmento base"""
+        with self._write_lock():
+            self._merge_locked()
+    
+    def prune_common_hashes(self, max_df_ratio: float = None, min_df: int = None) -> Dict:
+        """Remove do índice os postings de hashes comuns e os registra como hashes podados
+        
+        Um hash é comum se aparece em mais que max_df_ratio das músicas e em mais que
+        min_df músicas (padrões: self.max_df_ratio e self.min_stop_df).
+        """
+        max_df_ratio = self.max_df_ratio if max_df_ratio is None else max_df_ratio
+        min_df = self.min_stop_df if min_df is None else min_df
+        if not max_df_ratio or max_df_ratio <= 0:
+            raise ValueError('max_df_ratio deve ser maior que zero')
+        
+        with self._write_lock():
+            before = sum(len(seg['hashes']) for seg in self._segments.values())
+            stop_before = int(self._stop_hashes.size)
+            self._merge_locked(max_df_ratio=max_df_ratio, min_df=min_df)
+            after = sum(len(seg['hashes']) for seg in self._segments.values())
+        
+        return {
+            'songs': self.song_count,
+            'threshold': max(min_df, int(np.ceil(max_df_ratio * self.song_count))),
+            'new_stop_hashes': int(self._stop_hashes.size) - stop_before,
+            'stop_hashes': int(self._stop_hashes.size),
+            'postings_before': before,
+            'postings_after': after
+        }
+    
+    def _merge_locked(self, max_df_ratio: float = None, min_df: int = None):
+        """Mesclagem propriamente dita (chamador já possui o lock); com max_df_ratio também poda hashes comuns"""
+        manifest = dict(self._manifest)
+        old_names = manifest['base_segments'] + manifest['write_segments']
+        if not old_names:
+            return
+        
+        segments = [self._segments[name] for name in old_names]
+        hashes = np.concatenate([np.asarray(seg['hashes']) for seg in segments])
+        song_ids = np.concatenate([np.asarray(seg['song_ids']) for seg in segments])
+        offsets = np.concatenate([np.asarray(seg['offsets']) for seg in segments])
+        
+        if self._deleted_songs.size:
+            alive = ~np.isin(song_ids, self._deleted_songs)
+            hashes, song_ids, offsets = hashes[alive], song_ids[alive], offsets[alive]
+        
+        old_stop = None
+        if max_df_ratio:
+            order = np.lexsort((song_ids, hashes))
+            unique_hashes, df = document_frequency(hashes[order], song_ids[order])
+            threshold = max(min_df, int(np.ceil(max_df_ratio * np.unique(song_ids).size)))
+            new_stop = unique_hashes[df > threshold]
+            
+            if new_stop.size:
+                old_stop = self._add_stop_hashes(manifest, new_stop)
+                keep = ~np.isin(hashes, new_stop)
+                hashes, song_ids, offsets = hashes[keep], song_ids[keep], offsets[keep]
+        
+        name = self._write_segment(manifest, hashes, song_ids, offsets)
+        manifest['base_segments'] = [name]
+        manifest['write_segments'] = []
+        manifest['deleted_songs'] = []
+        manifest['segment_songs'] = {name: manifest['segment_songs'][name]}
+        manifest['generation'] += 1
+        self._save_manifest(manifest)
+        
+        # Leitores que ainda mapeiam os arquivos antigos continuam válidos até recarregar
+        old_files = [self._segment_file(old_name, field)
+                     for old_name in old_names for field in ('hashes', 'songs', 'offsets', 'df')]
+        if old_stop:
+            old_files.append(self._segment_file(old_stop, 'stop'))
+        self._remove_files(old_files)
+    
+    def _remove_files(self, paths: List[str]):
+        """Remove arquivos que o manifesto atual não usa mais"""
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def _write_segment(self, manifest: Dict, hashes: np.ndarray, song_ids: np.ndarray,
+                       offsets: np.ndarray) -> str:
+        """Grava um segmento imutável ordenado por (hash, song_id, offset)"""
+        hashes, song_ids, offsets = unique_postings(hashes, song_ids, offsets)
+        
+        name = f"seg_{manifest['next_segment']:08d}"
+        manifest['next_segment'] += 1
+        
+        df = document_frequency(hashes, song_ids)
+        for field, values in (('hashes', hashes), ('songs', song_ids), ('offsets', offsets), ('df', df)):
+            self._save_array(self._segment_file(name, field), values)
+        
+        manifest['segment_songs'] = dict(manifest.get('segment_songs') or {})
+        manifest['segment_songs'][name] = int(np.unique(song_ids).size)
+        return name
+    
+    def _save_array(self, path: str, values: np.ndarray):
+        """Grava um array de forma atômica"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, values)
+        os.replace(tmp_path, path)
+    
+    def _save_manifest(self, manifest: Dict):
+        """Publica o manifesto de forma atômica e recarrega os segmentos"""
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        
+        self._apply_manifest(manifest)
+        stat = os.stat(self.manifest_path)
+        self._manifest_stamp = (stat.st_mtime_ns, stat.st_size)
+
+def unique_postings(hashes: np.ndarray, song_ids: np.ndarray,
+                    offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Postings ordenados por (hash, song_id, offset), sem repetições (não acrescentam evidência)"""
+    order = np.lexsort((offsets, song_ids, hashes))
+    hashes, song_ids, offsets = hashes[order], song_ids[order], offsets[order]
+    
+    unique = np.ones(len(hashes), dtype=bool)
+    unique[1:] = ((hashes[1:] != hashes[:-1]) | (song_ids[1:] != song_ids[:-1]) |
+                  (offsets[1:] != offsets[:-1]))
+    return hashes[unique], song_ids[unique], offsets[unique]
+
+def document_frequency(hashes: np.ndarray, song_ids: np.ndarray) -> np.ndarray:
+    """Array (2, n): hashes únicos e em quantas músicas cada um aparece
+    
+    Os postings devem estar ordenados por (hash, song_id).
+    """
+    if len(hashes) == 0:
+        return np.empty((2, 0), dtype=np.int64)
+    
+    hash_start = np.ones(len(hashes), dtype=bool)
+    hash_start[1:] = hashes[1:] != hashes[:-1]
+    new_song = hash_start.copy()
+    new_song[1:] |= song_ids[1:] != song_ids[:-1]
+    
+    starts = np.flatnonzero(hash_start)
+    df = np.add.reduceat(new_song.astype(np.int64), starts)
+    return np.stack([np.asarray(hashes[starts], dtype=np.int64), df])
@@ -0,0 +1,220 @@
+"""
+Pipeline de ingestão de músicas
+Decodifica cada arquivo uma única vez e reaproveita o mesmo sinal para
+fingerprint, duração e análise de características
+"""
+import os
+import json
+import numpy as np
+from typing import Dict, List, Optional
+from services.db_connection import get_connection_manager
+
+class IngestionPipeline:
+    def __init__(self, fingerprint_system, audio_analyzer, music_db_path: str, timbre_index=None):
+        self.fingerprint_system = fingerprint_system
+        self.audio_analyzer = audio_analyzer
+        self.music_db_path = music_db_path
+        # Processos de trabalho só processam arquivos e não recebem o banco de músicas
+        self.music_db = get_connection_manager(music_db_path) if music_db_path else None
+        self.timbre_index = timbre_index
+        self.sample_rate = fingerprint_system.sample_rate
+    
+    def decode(self, file_path: str) -> np.ndarray:
+        """Decodifica o arquivo para mono float32 em self.sample_rate"""
+        return self.fingerprint_system.load_audio(file_path)
+    
+    def process(self, file_path: str, analyze: bool = True) -> Optional[Dict]:
+        """Processa um arquivo: fingerprint, duração e (opcionalmente) análise"""
+        if not analyze:
+            # Sem análise o sinal inteiro não é necessário (arquivos longos vão em streaming)
+            hashes, offsets, duration = self.fingerprint_system.fingerprint_file(file_path)
+            return {
+                'file_path': file_path,
+                'file_size': os.path.getsize(file_path),
+                'duration': duration,
+                'hashes': hashes,
+                'offsets': offsets,
+                'analysis': None
+            }
+        
+        y = self.decode(file_path)
+        if len(y) == 0:
+            return None
+        
+        hashes, offsets = self.fingerprint_system.fingerprint_signal(y)
+        
+        analysis = None
+        if analyze:
+            analysis = self.audio_analyzer.analyze_signal(y, self.sample_rate)
+            if not analysis:
+                return None
+        
+        return {
+            'file_path': file_path,
+            'file_size': os.path.getsize(file_path),
+            'duration': len(y) / self.sample_rate,
+            'hashes': hashes,
+            'offsets': offsets,
+            'analysis': analysis
+        }
+    
+    def ingest(self, file_path: str, title: str, artist: str, album: str = None,
+               genre: str = None, year: int = None) -> Optional[int]:
+        """Processa e grava uma música nos bancos de fingerprints e de músicas"""
+        processed = self.process(file_path)
+        if not processed:
+            print(f"❌ Erro ao analisar música: {file_path}")
+            return None
+        
+        return self.write(processed, title, artist, album, genre, year)
+    
+    def write(self, processed: Dict, title: str, artist: str, album: str = None,
+              genre: str = None, year: int = None) -> Optional[int]:
+        """Grava o resultado de process() nos dois bancos
+        
+        Os bancos são separados: se a gravação no banco de músicas falhar, a música
+        recém-criada no banco de fingerprints é removida. Uma música que já tem
+        fingerprints (gravação anterior interrompida) é reaproveitada.
+        """
+        fingerprint_id = self.fingerprint_system.get_song_ids_by_path([processed['file_path']]).get(
+            processed['file_path']
+        )
+        created = fingerprint_id is None
+        
+        if created:
+            fingerprint_id = self.fingerprint_system.add_fingerprinted_song(
+                title, artist, processed['file_path'], processed['duration'],
+                processed['hashes'], processed['offsets'], album
+            )
+        
+        if not fingerprint_id:
+            print(f"❌ Erro ao gerar fingerprint para: {title}")
+            return None
+        
+        try:
+            # connection() desfaz a transação em caso de exceção
+            with self.music_db.connection() as conn:
+                cursor = conn.cursor()
+                song_id = self.insert_song(cursor, processed, title, artist, album, genre, year, fingerprint_id)
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Erro ao gravar música no banco: {str(e)}")
+            if created:
+                self.fingerprint_system.remove_song(fingerprint_id)
+            return None
+        
+        self._index_timbre([(song_id, processed['analysis'])])
+        return song_id
+    
+    def write_batch(self, items: List[Dict]) -> List[int]:
+        """Grava um lote de resultados de process() em transações únicas nos dois bancos
+        
+        Cada item contém 'processed' e os metadados title, artist, album, genre e year.
+        Arquivos que já têm fingerprints (lote anterior interrompido entre os dois
+        commits) reaproveitam a música existente em vez de gravar os hashes de novo;
+        se a transação do banco de músicas falhar, as músicas criadas no banco de
+        fingerprints por este lote são removidas.
+        """
+        if not items:
+            return []
+        
+        existing = self.fingerprint_system.get_song_ids_by_path([item['processed']['file_path'] for item in items])
+        new_items = [item for item in items if item['processed']['file_path'] not in existing]
+        
+        created_ids = self.fingerprint_system.add_fingerprinted_songs([
+            dict(item['processed'], title=item['title'], artist=item['artist'], album=item.get('album'))
+            for item in new_items
+        ])
+        fingerprint_ids = dict(existing)
+        fingerprint_ids.update(
+            (item['processed']['file_path'], fingerprint_id) for item, fingerprint_id in zip(new_items, created_ids)
+        )
+        
+        try:
+            with self.music_db.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                song_ids = self._insert_batch(cursor, items, fingerprint_ids)
+                conn.commit()
+        except Exception:
+            for fingerprint_id in created_ids:
+                self.fingerprint_system.remove_song(fingerprint_id)
+            raise
+        
+        self._index_timbre([(song_id, item['processed']['analysis']) for song_id, item in zip(song_ids, items)])
+        return song_ids
+    
+    def _insert_batch(self, cursor, items: List[Dict], fingerprint_ids: Dict[str, int]) -> List[int]:
+        """Insere músicas e características de um lote no banco de músicas (sem commit)"""
+        cursor.execute('''
+            SELECT MAX(
+                COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'songs'), 0),
+                COALESCE((SELECT MAX(id) FROM songs), 0)
+            ) + 1
+        ''')
+        first_id = cursor.fetchone()[0]
+        song_ids = list(range(first_id, first_id + len(items)))
+        
+        cursor.executemany('''
+            INSERT INTO songs (id, title, artist, album, genre, year, duration, file_path, file_size, fingerprint_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (song_id, item['title'], item['artist'], item.get('album'), item.get('genre'), item.get('year'),
+             item['processed']['duration'], item['processed']['file_path'], item['processed']['file_size'],
+             fingerprint_ids[item['processed']['file_path']])
+            for song_id, item in zip(song_ids, items)
+        ])
+        
+        cursor.executemany('''
+            INSERT INTO audio_features (song_id, tempo, key, mode, energy, valence, danceability, features_json)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            self._feature_row(song_id, item['processed']['analysis'])
+            for song_id, item in zip(song_ids, items)
+            if item['processed']['analysis']
+        ])
+        
+        return song_ids
+    
+    def insert_song(self, cursor, processed: Dict, title: str, artist: str, album: str,
+                    genre: str, year: int, fingerprint_id: int) -> int:
+        """Insere música e características no banco de músicas (sem commit)"""
+        cursor.execute('''
+            INSERT INTO songs (title, artist, album, genre, year, duration, file_path, file_size, fingerprint_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (title, artist, album, genre, year, processed['duration'], processed['file_path'],
+              processed['file_size'], fingerprint_id))
+        
+        song_id = cursor.lastrowid
+        
+        if processed['analysis']:
+            cursor.execute('''
+                INSERT INTO audio_features (song_id, tempo, key, mode, energy, valence, danceability, features_json)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', self._feature_row(song_id, processed['analysis']))
+        
+        return song_id
+    
+    def _index_timbre(self, analyses: List[tuple]):
+        """Grava os embeddings de timbre de (song_id, análise) no índice de timbre"""
+        if self.timbre_index is None:
+            return
+        
+        self.timbre_index.add_many(
+            (song_id, (analysis.get('spectral_features') or {}).get('timbre_embedding'))
+            for song_id, analysis in analyses
+            if analysis
+        )
+    
+    def _feature_row(self, song_id: int, analysis: Dict) -> tuple:
+        """Linha da tabela audio_features para uma análise"""
+        return (
+            song_id,
+            analysis.get('tempo', 0),
+            analysis.get('key', ''),
+            analysis.get('mode', ''),
+            analysis.get('energy', 0),
+            analysis.get('valence', 0),
+            analysis.get('danceability', 0),
+            json.dumps(analysis, ensure_ascii=False)
+        )
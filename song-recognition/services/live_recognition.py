@@ -0,0 +1,176 @@
+"""
+Reconhecimento incremental em tempo real
+Gera fingerprints do áudio à medida que ele chega e consulta o índice a cada
+intervalo, acumulando evidência até que a melhor candidata seja confiável
+"""
+import time
+import threading
+import numpy as np
+from typing import Dict, List, Optional
+from services.streaming_fingerprint import StreamingFingerprinter
+
+try:
+    import soxr
+except ImportError:
+    soxr = None
+
+class LiveRecognizer:
+    def __init__(self, fingerprint_system, input_sample_rate: int = 44100):
+        self.fingerprint_system = fingerprint_system
+        self.input_sample_rate = input_sample_rate
+        self.streamer = StreamingFingerprinter(fingerprint_system)
+        
+        # Critérios de parada
+        self.query_interval = 1.0  # segundos de áudio entre consultas ao índice
+        self.min_seconds = 2.0  # áudio mínimo antes de aceitar uma resposta
+        self.max_seconds = 15.0  # desiste após esse tempo de áudio
+        self.min_confidence = 0.3
+        self.min_matches = 8  # hashes alinhados na melhor candidata
+        self.margin = 2.0  # melhor candidata precisa ter `margin` vezes os matches da segunda
+        
+        self._resampler = None
+        if input_sample_rate != fingerprint_system.sample_rate:
+            if soxr is None:
+                raise RuntimeError('soxr é necessário para reamostrar o áudio ao vivo')
+            self._resampler = soxr.ResampleStream(input_sample_rate, fingerprint_system.sample_rate,
+                                                  1, dtype='float32')
+        
+        # Evidência acumulada: (song_id, delta) de todos os hashes encontrados
+        self._song_ids: List[np.ndarray] = []
+        self._deltas: List[np.ndarray] = []
+        
+        self._lock = threading.Lock()
+        self._input_samples = 0
+        self._next_query = self.query_interval
+        self.started_at = time.time()
+        self.state = 'listening'
+        self.candidates: List[Dict] = []
+        self.result: Optional[Dict] = None
+    
+    @property
+    def seconds_received(self) -> float:
+        """Segundos de áudio recebidos até agora"""
+        return self._input_samples / self.input_sample_rate
+    
+    @property
+    def done(self) -> bool:
+        """Indica se o reconhecimento já terminou"""
+        return self.state != 'listening'
+    
+    def push_pcm(self, data) -> bool:
+        """Recebe um bloco PCM int16 (bytes ou array) e retorna True quando terminar"""
+        samples = np.frombuffer(data, dtype=np.int16) if isinstance(data, (bytes, bytearray)) else data
+        samples = np.asarray(samples)
+        if samples.dtype == np.int16:
+            samples = samples.astype(np.float32) / 32768.0
+        return self.push(samples.astype(np.float32))
+    
+    def push(self, samples: np.ndarray) -> bool:
+        """Recebe amostras float32 mono em input_sample_rate e retorna True quando terminar"""
+        with self._lock:
+            if self.done:
+                return True
+            
+            self._input_samples += len(samples)
+            if self._resampler is not None:
+                samples = self._resampler.resample_chunk(samples, last=False)
+            
+            hashes, offsets = self.streamer.push(samples)
+            self._add_evidence(hashes, offsets)
+            
+            if self.seconds_received >= self._next_query:
+                self._next_query += self.query_interval
+                self._evaluate(final=self.seconds_received >= self.max_seconds)
+            
+            return self.done
+    
+    def finish(self) -> Optional[Dict]:
+        """Encerra o stream (fim da gravação) e retorna o resultado final"""
+        with self._lock:
+            if not self.done:
+                hashes, offsets = self.streamer.flush()
+                self._add_evidence(hashes, offsets)
+                self._evaluate(final=True)
+            return self.result
+    
+    def _add_evidence(self, hashes: np.ndarray, offsets: np.ndarray):
+        """Consulta o índice apenas com os hashes novos"""
+        if len(hashes) == 0:
+            return
+        
+        song_ids, deltas = self.fingerprint_system._find_hash_matches(hashes, offsets)
+        self._song_ids.append(song_ids)
+        self._deltas.append(deltas)
+    
+    def _evaluate(self, final: bool):
+        """Recalcula as candidatas e decide se já é possível responder"""
+        if self._song_ids:
+            song_ids = np.concatenate(self._song_ids)
+            deltas = np.concatenate(self._deltas)
+            self._song_ids, self._deltas = [song_ids], [deltas]
+            self.candidates = self.fingerprint_system._calculate_match_scores(song_ids, deltas, 2)
+        
+        if self._is_confident():
+            self.state = 'matched'
+        elif final:
+            self.state = 'matched' if self._is_acceptable() else 'no_match'
+        else:
+            return
+        
+        self.result = self._build_result()
+    
+    def _is_acceptable(self) -> bool:
+        """Melhor candidata passa nos limites mínimos"""
+        if not self.candidates:
+            return False
+        best = self.candidates[0]
+        return best['score'] >= self.min_confidence and best['matches'] >= self.min_matches
+    
+    def _is_confident(self) -> bool:
+        """Melhor candidata é aceitável e se destaca da segunda"""
+        if self.seconds_received < self.min_seconds or not self._is_acceptable():
+            return False
+        if len(self.candidates) < 2:
+            return True
+        return self.candidates[0]['matches'] >= self.margin * self.candidates[1]['matches']
+    
+    def _build_result(self) -> Dict:
+        """Resultado no mesmo formato de RecognitionService.recognize"""
+        if self.state != 'matched':
+            return {
+                'success': False,
+                'service_used': 'Fingerprinting ao Vivo',
+                'song_info': None,
+                'confidence': 0,
+                'seconds_listened': self.seconds_received,
+                'message': 'Música não encontrada no banco local'
+            }
+        
+        best = self.candidates[0]
+        match = self.fingerprint_system._get_song_info(best['song_id']) or {}
+        return {
+            'success': True,
+            'service_used': 'Fingerprinting ao Vivo',
+            'song_info': {
+                'title': match.get('title', ''),
+                'artist': match.get('artist', ''),
+                'album': match.get('album', ''),
+                'duration': match.get('duration', 0),
+                'created_at': match.get('created_at', '')
+            },
+            'confidence': best['score'],
+            'offset_seconds': best['offset_seconds'],
+            'seconds_listened': self.seconds_received,
+            'message': 'Música reconhecida pelo banco local!'
+        }
+    
+    def get_status(self) -> Dict:
+        """Estado atual para consulta (polling)"""
+        with self._lock:
+            return {
+                'state': self.state,
+                'seconds_listened': self.seconds_received,
+                'elapsed': time.time() - self.started_at,
+                'best_candidate': self.candidates[0] if self.candidates else None,
+                'result': self.result
+            }
@@ -0,0 +1,197 @@
+"""
+Métricas de latência por etapa
+Cada requisição abre um trace (contextvars) em que as etapas do pipeline
+(decodificação, STFT, picos, hashes, busca, pontuação, fallback...) somam seus
+tempos; ao final, os tempos vão para histogramas com janela deslizante e, se a
+requisição passar do limite, para o log de requisições lentas
+"""
+import os
+import json
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List
+
+# Limites superiores (ms) dos buckets dos histogramas
+BUCKET_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('metrics_trace', default=None)
+
+class RollingHistogram:
+    """Histograma de latências das últimas `window_seconds`, em fatias de tempo"""
+    
+    def __init__(self, window_seconds: float = 300.0, slots: int = 10):
+        self.slot_seconds = window_seconds / slots
+        self._slots = [self._empty_slot(-1) for _ in range(slots)]
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _empty_slot(epoch: int) -> Dict:
+        return {'epoch': epoch, 'counts': [0] * (len(BUCKET_BOUNDS_MS) + 1), 'count': 0, 'sum': 0.0, 'max': 0.0}
+    
+    def observe(self, milliseconds: float):
+        """Registra uma medida"""
+        epoch = int(time.time() / self.slot_seconds)
+        with self._lock:
+            slot = self._slots[epoch % len(self._slots)]
+            if slot['epoch'] != epoch:
+                slot = self._slots[epoch % len(self._slots)] = self._empty_slot(epoch)
+            slot['counts'][bisect.bisect_left(BUCKET_BOUNDS_MS, milliseconds)] += 1
+            slot['count'] += 1
+            slot['sum'] += milliseconds
+            slot['max'] = max(slot['max'], milliseconds)
+    
+    def snapshot(self) -> Dict:
+        """Contagem, média, máximo e percentis (estimados pelos buckets) da janela atual"""
+        oldest = int(time.time() / self.slot_seconds) - len(self._slots) + 1
+        counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        count, total, maximum = 0, 0.0, 0.0
+        
+        with self._lock:
+            for slot in self._slots:
+                if slot['epoch'] < oldest:
+                    continue
+                counts = [a + b for a, b in zip(counts, slot['counts'])]
+                count += slot['count']
+                total += slot['sum']
+                maximum = max(maximum, slot['max'])
+        
+        if count == 0:
+            return {'count': 0}
+        
+        return {
+            'count': count,
+            'mean_ms': total / count,
+            'max_ms': maximum,
+            'p50_ms': self._percentile(counts, count, 0.50, maximum),
+            'p90_ms': self._percentile(counts, count, 0.90, maximum),
+            'p99_ms': self._percentile(counts, count, 0.99, maximum),
+            'buckets': {
+                (f'le_{bound:g}' if i < len(BUCKET_BOUNDS_MS) else 'inf'): counts[i]
+                for i, bound in enumerate(BUCKET_BOUNDS_MS + (float('inf'),))
+                if counts[i]
+            }
+        }
+    
+    @staticmethod
+    def _percentile(counts: List[int], count: int, quantile: float, maximum: float) -> float:
+        """Limite superior do bucket que contém o quantil (limitado ao máximo observado)"""
+        target = quantile * count
+        cumulative = 0
+        for i, bucket_count in enumerate(counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return min(BUCKET_BOUNDS_MS[i], maximum) if i < len(BUCKET_BOUNDS_MS) else maximum
+        return maximum
+
+class MetricsRegistry:
+    def __init__(self):
+        self.window_seconds = 300.0
+        
+        # Log de requisições lentas (desligado com 0)
+        self.slow_request_ms = float(os.getenv('SLOW_REQUEST_MS', 0))
+        self.slow_log_path = os.getenv('SLOW_REQUEST_LOG', 'data/slow_requests.log')
+        
+        self._histograms: Dict[str, RollingHistogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def _histogram(self, name: str) -> RollingHistogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, RollingHistogram(self.window_seconds))
+        return histogram
+    
+    def observe(self, name: str, seconds: float):
+        """Registra uma latência (em segundos) no histograma `name`"""
+        self._histogram(name).observe(seconds * 1000)
+    
+    def increment(self, name: str, value: int = 1):
+        """Incrementa um contador"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+    
+    def record_trace(self, name: str, timings: Dict[str, float]):
+        """Registra o total e as etapas de uma requisição (também usado para traces de outros processos)"""
+        total = timings.get('total', 0.0)
+        self.observe(name, total)
+        for stage_name, seconds in timings.items():
+            if stage_name != 'total':
+                self.observe(f'{name}.{stage_name}', seconds)
+        
+        if self.slow_request_ms > 0 and total * 1000 > self.slow_request_ms:
+            self._log_slow_request(name, timings)
+    
+    def _log_slow_request(self, name: str, timings: Dict[str, float]):
+        """Anota a requisição lenta e a etapa que mais consumiu o orçamento"""
+        stages = {stage: seconds * 1000 for stage, seconds in timings.items() if stage != 'total'}
+        slowest = max(stages, key=stages.get) if stages else None
+        entry = {
+            'timestamp': datetime.now().isoformat(),
+            'trace': name,
+            'total_ms': timings.get('total', 0.0) * 1000,
+            'budget_ms': self.slow_request_ms,
+            'slowest_stage': slowest,
+            'stages_ms': stages
+        }
+        
+        self.increment(f'{name}.slow')
+        print(f"🐢 Requisição lenta ({name}): {entry['total_ms']:.0f} ms, etapa mais lenta: {slowest}")
+        
+        if self.slow_log_path:
+            try:
+                os.makedirs(os.path.dirname(self.slow_log_path) or '.', exist_ok=True)
+                with self._lock, open(self.slow_log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            except OSError as e:
+                print(f"Erro ao gravar log de requisições lentas: {str(e)}")
+    
+    def snapshot(self) -> Dict:
+        """Histogramas e contadores atuais"""
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+        
+        return {
+            'window_seconds': self.window_seconds,
+            'latency': {name: histograms[name].snapshot() for name in sorted(histograms)},
+            'counters': counters
+        }
+
+metrics = MetricsRegistry()
+
+@contextmanager
+def trace(name: str, record: bool = True) -> Iterator[Dict[str, float]]:
+    """Abre um trace de requisição; produz o dicionário {etapa: segundos} preenchido pelas etapas
+    
+    Com record=False os tempos não vão para o registro (ex.: processos do pool,
+    que devolvem os tempos para o processo principal registrar).
+    """
+    timings: Dict[str, float] = {}
+    token = _current_trace.set(timings)
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings['total'] = time.perf_counter() - start
+        _current_trace.reset(token)
+        if record:
+            metrics.record_trace(name, timings)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Mede uma etapa e soma seu tempo ao trace atual (sem trace ativo não registra nada)"""
+    timings = _current_trace.get()
+    if timings is None:
+        yield
+        return
+    
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
@@ -3,25 +3,45 @@ Sistema de gerenciamento de banco de músicas local
 Permite adicionar, remover e gerenciar músicas no banco de dados
 """
 import os
-import sqlite3
+import re
 import json
+import base64
+import sqlite3
+import numpy as np
 from typing import List, Dict, Optional
 from datetime import datetime
 from services.audio_fingerprint import AudioFingerprint
 from services.audio_analyzer import AudioAnalyzer
+from services.ingestion_pipeline import IngestionPipeline
+from services.similarity_index import SimilarityIndex
+from services.timbre_index import TimbreIndex, timbre_embedding
+from services.feature_context import FeatureContext
+from services.db_connection import get_connection_manager
+from services.audio_decoder import decode_audio
+
+# Colunas da tabela songs na ordem esperada pelos métodos de leitura
+SONG_COLUMNS = ('s.id, s.title, s.artist, s.album, s.genre, s.year, s.duration, s.file_path, '
+                's.file_size, s.created_at, s.updated_at')
+
+MAX_PAGE_SIZE = 200  # músicas por página, no máximo
 
 class MusicDatabase:
     def __init__(self, db_path='data/music_database.db'):
         self.db_path = db_path
+        self.db = get_connection_manager(db_path)
         self.fingerprint_system = AudioFingerprint()
         self.audio_analyzer = AudioAnalyzer()
+        self.timbre_index = TimbreIndex(os.path.join(os.path.dirname(self.db_path), 'timbre_index'))
+        self.pipeline = IngestionPipeline(self.fingerprint_system, self.audio_analyzer, self.db_path,
+                                          self.timbre_index)
         self._init_database()
+        self.similarity_index = SimilarityIndex(self.db_path)
     
     def _init_database(self):
         """Inicializa banco de dados"""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self.db.connection() as conn:
             cursor = conn.cursor()
             
             # Tabela de músicas
@@ -37,10 +57,16 @@ class MusicDatabase:
                     file_path TEXT UNIQUE,
                     file_size INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    fingerprint_id INTEGER
                 )
             ''')
             
+            # ID da música no banco de fingerprints (bancos antigos não têm a coluna)
+            cursor.execute('PRAGMA table_info(songs)')
+            if 'fingerprint_id' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute('ALTER TABLE songs ADD COLUMN fingerprint_id INTEGER')
+            
             # Tabela de características musicais
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS audio_features (
@@ -85,9 +111,57 @@ class MusicDatabase:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_songs_genre ON songs (genre)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_songs_year ON songs (year)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_features_tempo ON audio_features (tempo)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_songs_created_at ON songs (created_at)')
+            
+            # Índice de texto completo sobre title/artist/album/genre
+            self.fts_enabled = self._init_fts(cursor)
             
             conn.commit()
     
+    def _init_fts(self, cursor) -> bool:
+        """Cria a tabela FTS5 (conteúdo externo em songs) e os triggers que a mantêm sincronizada"""
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'songs_fts'")
+        exists = cursor.fetchone()[0] > 0
+        
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+                    title, artist, album, genre,
+                    content='songs', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                )
+            ''')
+        except sqlite3.OperationalError:
+            print("⚠️  SQLite sem suporte a FTS5: a busca usará LIKE")
+            return False
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS songs_fts_insert AFTER INSERT ON songs BEGIN
+                INSERT INTO songs_fts (rowid, title, artist, album, genre)
+                VALUES (new.id, new.title, new.artist, new.album, new.genre);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS songs_fts_delete AFTER DELETE ON songs BEGIN
+                INSERT INTO songs_fts (songs_fts, rowid, title, artist, album, genre)
+                VALUES ('delete', old.id, old.title, old.artist, old.album, old.genre);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS songs_fts_update AFTER UPDATE OF title, artist, album, genre ON songs BEGIN
+                INSERT INTO songs_fts (songs_fts, rowid, title, artist, album, genre)
+                VALUES ('delete', old.id, old.title, old.artist, old.album, old.genre);
+                INSERT INTO songs_fts (rowid, title, artist, album, genre)
+                VALUES (new.id, new.title, new.artist, new.album, new.genre);
+            END
+        ''')
+        
+        # Bancos existentes: indexar as músicas já cadastradas
+        if not exists:
+            cursor.execute("INSERT INTO songs_fts (songs_fts) VALUES ('rebuild')")
+        
+        return True
+    
     def add_song(self, file_path: str, title: str, artist: str, 
                  album: str = None, genre: str = None, year: int = None) -> Optional[int]:
         """Adiciona uma música ao banco de dados"""
@@ -102,55 +176,14 @@ class MusicDatabase:
                 print(f"⚠️  Música já existe no banco: {title} - {artist}")
                 return existing['id']
             
-            # Analisar arquivo de áudio
+            # Decodificar uma vez e gerar análise + fingerprint do mesmo sinal
             print(f"🔄 Analisando música: {title} - {artist}")
+            song_id = self.pipeline.ingest(file_path, title, artist, album, genre, year)
             
-            # Extrair características
-            analysis = self.audio_analyzer.analyze_audio(file_path)
-            if not analysis:
-                print(f"❌ Erro ao analisar música: {file_path}")
+            if not song_id:
                 return None
             
-            # Gerar fingerprint
-            print("🔄 Gerando fingerprint...")
-            fingerprint_id = self.fingerprint_system.add_song_to_database(
-                title, artist, file_path, album
-            )
-            
-            if not fingerprint_id:
-                print(f"❌ Erro ao gerar fingerprint para: {title}")
-                return None
-            
-            # Salvar no banco principal
-            file_size = os.path.getsize(file_path)
-            
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Inserir música
-                cursor.execute('''
-                    INSERT INTO songs (title, artist, album, genre, year, duration, file_path, file_size)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (title, artist, album, genre, year, analysis['duration'], file_path, file_size))
-                
-                song_id = cursor.lastrowid
-                
-                # Inserir características
-                cursor.execute('''
-                    INSERT INTO audio_features (song_id, tempo, key, mode, energy, valence, danceability, features_json)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    song_id,
-                    analysis.get('tempo', 0),
-                    analysis.get('key', ''),
-                    analysis.get('mode', ''),
-                    analysis.get('energy', 0),
-                    analysis.get('valence', 0),
-                    analysis.get('danceability', 0),
-                    json.dumps(analysis, ensure_ascii=False)
-                ))
-                
-                conn.commit()
+            self.similarity_index.add(song_id)
             
             print(f"✅ Música adicionada com sucesso! ID: {song_id}")
             return song_id
@@ -162,37 +195,17 @@ class MusicDatabase:
     def get_song_by_id(self, song_id: int) -> Optional[Dict]:
         """Obtém música por ID"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.db.connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT s.*, af.tempo, af.key, af.mode, af.energy, af.valence, af.danceability
+                cursor.execute(f'''
+                    SELECT {SONG_COLUMNS}, af.tempo, af.key, af.mode, af.energy, af.valence, af.danceability
                     FROM songs s
                     LEFT JOIN audio_features af ON s.id = af.song_id
                     WHERE s.id = ?
                 ''', (song_id,))
                 
                 result = cursor.fetchone()
-                if result:
-                    return {
-                        'id': result[0],
-                        'title': result[1],
-                        'artist': result[2],
-                        'album': result[3],
-                        'genre': result[4],
-                        'year': result[5],
-                        'duration': result[6],
-                        'file_path': result[7],
-                        'file_size': result[8],
-                        'created_at': result[9],
-                        'updated_at': result[10],
-                        'tempo': result[11],
-                        'key': result[12],
-                        'mode': result[13],
-                        'energy': result[14],
-                        'valence': result[15],
-                        'danceability': result[16]
-                    }
-                return None
+                return self._song_from_row(result) if result else None
         except Exception as e:
             print(f"Erro ao obter música: {str(e)}")
             return None
@@ -200,26 +213,11 @@ class MusicDatabase:
     def get_song_by_path(self, file_path: str) -> Optional[Dict]:
         """Obtém música por caminho do arquivo"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.db.connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM songs WHERE file_path = ?', (file_path,))
+                cursor.execute(f'SELECT {SONG_COLUMNS} FROM songs s WHERE file_path = ?', (file_path,))
                 result = cursor.fetchone()
-                
-                if result:
-                    return {
-                        'id': result[0],
-                        'title': result[1],
-                        'artist': result[2],
-                        'album': result[3],
-                        'genre': result[4],
-                        'year': result[5],
-                        'duration': result[6],
-                        'file_path': result[7],
-                        'file_size': result[8],
-                        'created_at': result[9],
-                        'updated_at': result[10]
-                    }
-                return None
+                return self._song_from_row(result) if result else None
         except Exception as e:
             print(f"Erro ao obter música por caminho: {str(e)}")
             return None
@@ -227,134 +225,302 @@ class MusicDatabase:
     def search_songs(self, query: str = None, artist: str = None, genre: str = None, 
                     year: int = None, limit: int = 50) -> List[Dict]:
         """Busca músicas no banco"""
+        return self.search_songs_page(query, artist, genre, year, limit)['songs']
+    
+    def search_songs_page(self, query: str = None, artist: str = None, genre: str = None,
+                          year: int = None, limit: int = 50, cursor: str = None) -> Dict:
+        """Busca paginada: por relevância (bm25) quando há texto, senão as mais recentes primeiro
+        
+        Retorna {'songs': [...], 'next_cursor': ...}; passar next_cursor na chamada
+        seguinte continua a partir da última música da página (paginação por keyset).
+        O limite é ajustado para [1, MAX_PAGE_SIZE] e um cursor inválido gera ValueError.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        match = self._fts_match_expression(query, artist, genre) if self.fts_enabled else None
+        after = self._decode_cursor(cursor, 'rank' if match else 'recent')
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Construir query dinâmica
-                conditions = []
-                params = []
-                
-                if query:
-                    conditions.append("(title LIKE ? OR artist LIKE ? OR album LIKE ?)")
-                    params.extend([f"%{query}%", f"%{query}%", f"%{query}%"])
-                
-                if artist:
-                    conditions.append("artist LIKE ?")
-                    params.append(f"%{artist}%")
-                
-                if genre:
-                    conditions.append("genre LIKE ?")
-                    params.append(f"%{genre}%")
-                
-                if year:
-                    conditions.append("year = ?")
-                    params.append(year)
-                
-                where_clause = " AND ".join(conditions) if conditions else "1=1"
-                
-                cursor.execute(f'''
-                    SELECT s.*, af.tempo, af.key, af.mode, af.energy, af.valence, af.danceability
-                    FROM songs s
-                    LEFT JOIN audio_features af ON s.id = af.song_id
-                    WHERE {where_clause}
-                    ORDER BY s.created_at DESC
-                    LIMIT ?
-                ''', params + [limit])
-                
-                results = cursor.fetchall()
-                songs = []
-                
-                for result in results:
-                    songs.append({
-                        'id': result[0],
-                        'title': result[1],
-                        'artist': result[2],
-                        'album': result[3],
-                        'genre': result[4],
-                        'year': result[5],
-                        'duration': result[6],
-                        'file_path': result[7],
-                        'file_size': result[8],
-                        'created_at': result[9],
-                        'updated_at': result[10],
-                        'tempo': result[11],
-                        'key': result[12],
-                        'mode': result[13],
-                        'energy': result[14],
-                        'valence': result[15],
-                        'danceability': result[16]
-                    })
-                
-                return songs
+            with self.db.connection() as conn:
+                if match:
+                    results = self._search_fts(conn, match, year, limit, after)
+                else:
+                    results = self._search_recent(conn, query, artist, genre, year, limit, after)
+            
+            page = results[:limit]
+            next_cursor = None
+            if len(results) > limit:
+                next_cursor = self._encode_cursor('rank' if match else 'recent', page[-1][1])
+            
+            return {'songs': [song for song, _ in page], 'next_cursor': next_cursor}
         except Exception as e:
             print(f"Erro na busca: {str(e)}")
-            return []
+            return {'songs': [], 'next_cursor': None}
+    
+    @staticmethod
+    def _fts_match_expression(query: str = None, artist: str = None, genre: str = None) -> Optional[str]:
+        """Expressão MATCH do FTS5: cada palavra vira um prefixo entre aspas (sem sintaxe do usuário)"""
+        def terms(text, column=None):
+            prefix = f'{column} : ' if column else ''
+            return [prefix + '"' + term.replace('"', '""') + '"*' for term in re.findall(r'\w+', text or '')]
+        
+        expression = terms(query) + terms(artist, 'artist') + terms(genre, 'genre')
+        return ' AND '.join(expression) if expression else None
+    
+    @staticmethod
+    def _encode_cursor(mode: str, key: list) -> str:
+        """Cursor opaco a partir da chave de ordenação da última música da página"""
+        return base64.urlsafe_b64encode(json.dumps([mode] + list(key)).encode()).decode()
+    
+    @staticmethod
+    def _decode_cursor(cursor: Optional[str], mode: str) -> Optional[list]:
+        """Chave de ordenação guardada no cursor (None para a primeira página)"""
+        if not cursor:
+            return None
+        try:
+            decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError):
+            raise ValueError('Cursor de paginação inválido')
+        if not isinstance(decoded, list) or len(decoded) != 3 or decoded[0] != mode:
+            raise ValueError('Cursor de paginação inválido')
+        return decoded[1:]
+    
+    def _search_fts(self, conn, match: str, year: int, limit: int, after: Optional[list]) -> List[tuple]:
+        """Busca no índice FTS5 ordenada por bm25 (título pesa mais que artista, álbum e gênero)"""
+        conditions, params = [], [match]
+        
+        if year:
+            conditions.append("s.year = ?")
+            params.append(year)
+        
+        if after:
+            conditions.append("(m.rank > ? OR (m.rank = ? AND s.id > ?))")
+            params.extend([after[0], after[0], after[1]])
+        
+        where_clause = " AND ".join(conditions) if conditions else "1=1"
+        
+        rows = conn.execute(f'''
+            SELECT {SONG_COLUMNS}, af.tempo, af.key, af.mode, af.energy, af.valence, af.danceability, m.rank
+            FROM (
+                SELECT rowid, bm25(songs_fts, 10.0, 5.0, 2.0, 1.0) AS rank
+                FROM songs_fts WHERE songs_fts MATCH ?
+            ) m
+            JOIN songs s ON s.id = m.rowid
+            LEFT JOIN audio_features af ON s.id = af.song_id
+            WHERE {where_clause}
+            ORDER BY m.rank, s.id
+            LIMIT ?
+        ''', params + [limit + 1]).fetchall()
+        
+        return [(self._song_from_row(row), [row[17], row[0]]) for row in rows]
+    
+    def _search_recent(self, conn, query: str, artist: str, genre: str, year: int, limit: int,
+                       after: Optional[list]) -> List[tuple]:
+        """Músicas mais recentes primeiro (LIKE apenas quando o SQLite não tem FTS5)"""
+        conditions, params = [], []
+        
+        if query:
+            conditions.append("(s.title LIKE ? OR s.artist LIKE ? OR s.album LIKE ?)")
+            params.extend([f"%{query}%", f"%{query}%", f"%{query}%"])
+        
+        if artist:
+            conditions.append("s.artist LIKE ?")
+            params.append(f"%{artist}%")
+        
+        if genre:
+            conditions.append("s.genre LIKE ?")
+            params.append(f"%{genre}%")
+        
+        if year:
+            conditions.append("s.year = ?")
+            params.append(year)
+        
+        if after:
+            conditions.append("(s.created_at < ? OR (s.created_at = ? AND s.id < ?))")
+            params.extend([after[0], after[0], after[1]])
+        
+        where_clause = " AND ".join(conditions) if conditions else "1=1"
+        
+        rows = conn.execute(f'''
+            SELECT {SONG_COLUMNS}, af.tempo, af.key, af.mode, af.energy, af.valence, af.danceability
+            FROM songs s
+            LEFT JOIN audio_features af ON s.id = af.song_id
+            WHERE {where_clause}
+            ORDER BY s.created_at DESC, s.id DESC
+            LIMIT ?
+        ''', params + [limit + 1]).fetchall()
+        
+        return [(self._song_from_row(row), [row[9], row[0]]) for row in rows]
+    
+    @staticmethod
+    def _song_from_row(result: tuple) -> Dict:
+        """Converte uma linha (SONG_COLUMNS, opcionalmente seguidas das características) em dicionário"""
+        song = {
+            'id': result[0],
+            'title': result[1],
+            'artist': result[2],
+            'album': result[3],
+            'genre': result[4],
+            'year': result[5],
+            'duration': result[6],
+            'file_path': result[7],
+            'file_size': result[8],
+            'created_at': result[9],
+            'updated_at': result[10]
+        }
+        
+        if len(result) > 11:
+            song.update({
+                'tempo': result[11],
+                'key': result[12],
+                'mode': result[13],
+                'energy': result[14],
+                'valence': result[15],
+                'danceability': result[16]
+            })
+        return song
     
     def get_similar_songs(self, song_id: int, limit: int = 10) -> List[Dict]:
         """Encontra músicas similares baseadas em características"""
         try:
-            # Obter características da música de referência
-            reference_song = self.get_song_by_id(song_id)
-            if not reference_song:
+            # Vizinhos mais próximos no espaço normalizado de características
+            neighbors = self.similarity_index.query(song_id, limit)
+            if not neighbors:
                 return []
             
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Buscar músicas com características similares
-                cursor.execute('''
-                    SELECT s.*, af.tempo, af.key, af.mode, af.energy, af.valence, af.danceability,
-                           ABS(af.tempo - ?) as tempo_diff,
-                           ABS(af.energy - ?) as energy_diff,
-                           ABS(af.valence - ?) as valence_diff
-                    FROM songs s
-                    LEFT JOIN audio_features af ON s.id = af.song_id
-                    WHERE s.id != ?
-                    ORDER BY (tempo_diff + energy_diff + valence_diff) ASC
-                    LIMIT ?
-                ''', (
-                    reference_song.get('tempo', 0),
-                    reference_song.get('energy', 0),
-                    reference_song.get('valence', 0),
-                    song_id,
-                    limit
-                ))
-                
-                results = cursor.fetchall()
-                similar_songs = []
-                
-                for result in results:
-                    similar_songs.append({
-                        'id': result[0],
-                        'title': result[1],
-                        'artist': result[2],
-                        'album': result[3],
-                        'genre': result[4],
-                        'year': result[5],
-                        'duration': result[6],
-                        'file_path': result[7],
-                        'file_size': result[8],
-                        'created_at': result[9],
-                        'updated_at': result[10],
-                        'tempo': result[11],
-                        'key': result[12],
-                        'mode': result[13],
-                        'energy': result[14],
-                        'valence': result[15],
-                        'danceability': result[16],
-                        'similarity_score': 1.0 / (1.0 + result[17] + result[18] + result[19])
-                    })
-                
-                return similar_songs
+            songs = self._get_songs_by_ids([neighbor_id for neighbor_id, _ in neighbors])
+            
+            similar_songs = []
+            for neighbor_id, distance in neighbors:
+                song = songs.get(neighbor_id)
+                if song is None:
+                    continue
+                song['similarity_score'] = 1.0 / (1.0 + distance)
+                similar_songs.append(song)
+            
+            return similar_songs
         except Exception as e:
             print(f"Erro ao buscar músicas similares: {str(e)}")
             return []
     
+    def _get_songs_by_ids(self, song_ids: List[int]) -> Dict[int, Dict]:
+        """Obtém várias músicas (com características) em uma única consulta"""
+        if not song_ids:
+            return {}
+        
+        placeholders = ', '.join('?' * len(song_ids))
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {SONG_COLUMNS}, af.tempo, af.key, af.mode, af.energy, af.valence, af.danceability
+                FROM songs s
+                LEFT JOIN audio_features af ON s.id = af.song_id
+                WHERE s.id IN ({placeholders})
+            ''', song_ids)
+            
+            songs = {}
+            for result in cursor.fetchall():
+                songs[result[0]] = self._song_from_row(result)
+            
+            return songs
+    
+    def get_songs_like(self, song_id: int, limit: int = 10) -> List[Dict]:
+        """Encontra músicas com timbre parecido (similaridade de cosseno dos embeddings)"""
+        try:
+            embedding = self.timbre_index.get_embedding(song_id)
+            if embedding is None:
+                return []
+            
+            neighbors = self.timbre_index.search(embedding, limit, exclude=[song_id])[0]
+            songs = self._get_songs_by_ids([neighbor_id for neighbor_id, _ in neighbors])
+            
+            similar_songs = []
+            for neighbor_id, similarity in neighbors:
+                song = songs.get(neighbor_id)
+                if song is None:
+                    continue
+                song['timbre_similarity'] = similarity
+                similar_songs.append(song)
+            
+            return similar_songs
+        except Exception as e:
+            print(f"Erro ao buscar músicas com timbre parecido: {str(e)}")
+            return []
+    
+    def create_playlist_from_seeds(self, name: str, seed_song_ids: List[int], size: int = 20,
+                                   description: str = None) -> Optional[Dict]:
+        """Cria playlist com as músicas semente e as de timbre mais próximo ao delas"""
+        try:
+            seeds = [song_id for song_id in seed_song_ids if self.timbre_index.get_embedding(song_id) is not None]
+            if not seeds:
+                print("❌ Nenhuma música semente possui embedding de timbre")
+                return None
+            
+            # Centro das sementes no espaço de timbre
+            query = np.mean([self.timbre_index.get_embedding(song_id) for song_id in seeds], axis=0)
+            neighbors = self.timbre_index.search(query, max(0, size - len(seeds)), exclude=seeds)[0]
+            song_ids = seeds + [neighbor_id for neighbor_id, _ in neighbors]
+            
+            playlist_id = self.create_playlist(name, description)
+            if not playlist_id:
+                return None
+            
+            with self.db.connection() as conn:
+                conn.executemany('''
+                    INSERT OR IGNORE INTO playlist_songs (playlist_id, song_id, position)
+                    VALUES (?, ?, ?)
+                ''', [(playlist_id, song_id, position) for position, song_id in enumerate(song_ids, start=1)])
+                conn.commit()
+            
+            return {'playlist_id': playlist_id, 'song_ids': song_ids}
+        except Exception as e:
+            print(f"❌ Erro ao criar playlist a partir de sementes: {str(e)}")
+            return None
+    
+    def rebuild_timbre_index(self) -> Dict:
+        """Gera embeddings de timbre das músicas que ainda não estão no índice"""
+        with self.db.connection() as conn:
+            rows = conn.execute('''
+                SELECT s.id, s.file_path, af.features_json
+                FROM songs s
+                LEFT JOIN audio_features af ON s.id = af.song_id
+            ''').fetchall()
+        
+        added, failed = 0, []
+        batch = []
+        for song_id, file_path, features_json in rows:
+            if self.timbre_index.get_embedding(song_id) is not None:
+                continue
+            
+            try:
+                analysis = json.loads(features_json) if features_json else {}
+                embedding = (analysis.get('spectral_features') or {}).get('timbre_embedding')
+                
+                # Análises antigas não guardavam o embedding: recalcular a partir do arquivo
+                if embedding is None:
+                    y, sr = decode_audio(file_path, sr=self.audio_analyzer.sample_rate)
+                    embedding = timbre_embedding(FeatureContext(y, sr).mfcc)
+                
+                batch.append((song_id, embedding))
+                added += 1
+            except Exception as e:
+                failed.append({'id': song_id, 'file_path': file_path, 'error': str(e)})
+            
+            if len(batch) >= 1000:
+                self.timbre_index.add_many(batch)
+                batch = []
+        
+        self.timbre_index.add_many(batch)
+        
+        # Catálogos grandes usam o quantizador grosso
+        if len(self.timbre_index) >= self.timbre_index.ivf_min_rows:
+            self.timbre_index.train_ivf()
+        
+        return {'added': added, 'failed': failed, 'total': len(self.timbre_index)}
+    
     def get_statistics(self) -> Dict:
         """Retorna estatísticas do banco de dados"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.db.connection() as conn:
                 cursor = conn.cursor()
                 
                 # Estatísticas gerais
@@ -397,7 +563,9 @@ class MusicDatabase:
                     'total_genres': total_genres,
                     'total_duration_hours': total_duration / 3600,
                     'top_genres': [{'genre': g[0], 'count': g[1]} for g in top_genres],
-                    'top_artists': [{'artist': a[0], 'count': a[1]} for a in top_artists]
+                    'top_artists': [{'artist': a[0], 'count': a[1]} for a in top_artists],
+                    'analysis_cache': self.audio_analyzer.cache.get_stats(),
+                    'timbre_index': self.timbre_index.get_stats()
                 }
         except Exception as e:
             print(f"Erro ao obter estatísticas: {str(e)}")
@@ -406,9 +574,13 @@ class MusicDatabase:
     def remove_song(self, song_id: int) -> bool:
         """Remove música do banco"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.db.connection() as conn:
                 cursor = conn.cursor()
                 
+                cursor.execute('SELECT fingerprint_id FROM songs WHERE id = ?', (song_id,))
+                row = cursor.fetchone()
+                fingerprint_id = row[0] if row else None
+                
                 # Remover características
                 cursor.execute('DELETE FROM audio_features WHERE song_id = ?', (song_id,))
                 
@@ -419,9 +591,16 @@ class MusicDatabase:
                 cursor.execute('DELETE FROM songs WHERE id = ?', (song_id,))
                 
                 conn.commit()
-                
-                print(f"✅ Música {song_id} removida com sucesso")
-                return True
+            
+            # Remover fingerprints para que a música deixe de ser reconhecida
+            if fingerprint_id:
+                self.fingerprint_system.remove_song(fingerprint_id)
+            
+            self.similarity_index.remove(song_id)
+            self.timbre_index.remove(song_id)
+            
+            print(f"✅ Música {song_id} removida com sucesso")
+            return True
         except Exception as e:
             print(f"❌ Erro ao remover música: {str(e)}")
             return False
@@ -429,7 +608,7 @@ class MusicDatabase:
     def create_playlist(self, name: str, description: str = None) -> Optional[int]:
         """Cria nova playlist"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.db.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO playlists (name, description)
@@ -448,7 +627,7 @@ class MusicDatabase:
     def add_song_to_playlist(self, playlist_id: int, song_id: int) -> bool:
         """Adiciona música à playlist"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.db.connection() as conn:
                 cursor = conn.cursor()
                 
                 # Verificar se já existe
@@ -0,0 +1,181 @@
+"""
+Cache de resultados de reconhecimento
+Trechos reenviados (retentativas, vários aparelhos captando a mesma transmissão)
+são respondidos sem rodar o pipeline completo. A chave exata é o hash do PCM
+normalizado; capturas quase idênticas são encontradas por uma assinatura MinHash
+dos hashes do fingerprint, indexada por LSH. O sinal e os hashes usados na chave
+são os mesmos que vão para a busca no índice em caso de falta. O cache é um LRU
+com TTL e é esvaziado quando músicas entram ou saem do índice de fingerprints
+"""
+import copy
+import time
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+class RecognitionCache:
+    def __init__(self, fingerprint_system, max_entries: int = 1024, ttl_seconds: float = 600.0,
+                 num_perm: int = 128, bands: int = 32, min_similarity: float = 0.6):
+        self.fingerprint_system = fingerprint_system
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        
+        # MinHash: num_perm permutações em `bands` faixas de num_perm/bands linhas; com 32 faixas de 4
+        # linhas, pares com Jaccard >= 0.6 quase sempre colidem e abaixo de ~0.3 raramente
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.min_similarity = min_similarity
+        
+        rng = np.random.default_rng(0x5EED)
+        self._perm_a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._perm_b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._catalog_version = None
+        self._lock = threading.Lock()
+        self.stats = {'exact_hits': 0, 'similar_hits': 0, 'misses': 0, 'stores': 0,
+                      'evictions': 0, 'expirations': 0, 'invalidations': 0}
+    
+    def signature(self, y: np.ndarray, hashes: np.ndarray) -> Tuple[str, Optional[np.ndarray]]:
+        """Calcula (hash do PCM normalizado, assinatura MinHash) de um trecho já decodificado e com fingerprint"""
+        # Normalizar o pico e quantizar em 16 bits: o mesmo trecho com outro ganho ou codificação PCM coincide
+        peak = float(np.max(np.abs(y))) if len(y) else 0.0
+        pcm = np.round(y / peak * 32767).astype(np.int16) if peak > 0 else np.zeros(len(y), dtype=np.int16)
+        exact_key = hashlib.sha1(pcm.tobytes()).hexdigest()
+        return exact_key, self._minhash(hashes)
+    
+    def _minhash(self, hashes: np.ndarray) -> Optional[np.ndarray]:
+        """Assinatura MinHash do conjunto de hashes do fingerprint"""
+        unique = np.unique(np.asarray(hashes, dtype=np.int64)).view(np.uint64)
+        if unique.size == 0:
+            return None
+        
+        # Hash universal (a*x + b mod 2^64) para cada permutação; overflow é intencional
+        with np.errstate(over='ignore'):
+            values = unique[np.newaxis, :] * self._perm_a[:, np.newaxis] + self._perm_b[:, np.newaxis]
+        return values.min(axis=1)
+    
+    def _band_keys(self, minhash: np.ndarray):
+        return [(band, minhash[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+    
+    def get(self, signature: Tuple[str, Optional[np.ndarray]]) -> Optional[Dict]:
+        """Resultado em cache para o trecho (exato ou de uma captura quase idêntica)"""
+        exact_key, minhash = signature
+        now = time.time()
+        
+        with self._lock:
+            self._check_catalog()
+            
+            entry = self._entries.get(exact_key)
+            if entry is not None and self._alive(exact_key, entry, now):
+                self._entries.move_to_end(exact_key)
+                self.stats['exact_hits'] += 1
+                return dict(copy.deepcopy(entry['result']), cache_hit='exact')
+            
+            if minhash is not None:
+                key, similarity = self._find_similar(minhash, now)
+                if key is not None:
+                    self._entries.move_to_end(key)
+                    self.stats['similar_hits'] += 1
+                    result = copy.deepcopy(self._entries[key]['result'])
+                    # A posição na música é a do trecho guardado, não a deste
+                    result.pop('offset_seconds', None)
+                    return dict(result, cache_hit='similar', cache_similarity=similarity)
+            
+            self.stats['misses'] += 1
+            return None
+    
+    def _find_similar(self, minhash: np.ndarray, now: float) -> Tuple[Optional[str], float]:
+        """Candidatos por LSH, confirmados pela similaridade de Jaccard estimada"""
+        candidates = set()
+        for band_key in self._band_keys(minhash):
+            candidates.update(self._buckets.get(band_key, ()))
+        
+        best_key, best_similarity = None, 0.0
+        for key in candidates:
+            entry = self._entries.get(key)
+            # Só reaproveitar matches do fingerprint: análises de características dependem do trecho exato
+            if entry is None or not entry['shareable'] or not self._alive(key, entry, now):
+                continue
+            similarity = float(np.mean(entry['minhash'] == minhash))
+            if similarity >= self.min_similarity and similarity > best_similarity:
+                best_key, best_similarity = key, similarity
+        return best_key, best_similarity
+    
+    def put(self, signature: Tuple[str, Optional[np.ndarray]], result: Dict):
+        """Guarda um resultado bem-sucedido"""
+        if not result.get('success'):
+            return
+        
+        exact_key, minhash = signature
+        with self._lock:
+            self._check_catalog()
+            if exact_key in self._entries:
+                self._remove(exact_key)
+            
+            entry = {
+                'result': copy.deepcopy(result),
+                'minhash': minhash,
+                'shareable': minhash is not None and result.get('service_used') == 'Fingerprinting Local',
+                'expires_at': time.time() + self.ttl_seconds
+            }
+            self._entries[exact_key] = entry
+            if entry['shareable']:
+                for band_key in self._band_keys(minhash):
+                    self._buckets.setdefault(band_key, set()).add(exact_key)
+            self.stats['stores'] += 1
+            
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+    
+    def _alive(self, key: str, entry: Dict, now: float) -> bool:
+        """Remove a entrada se o TTL expirou"""
+        if entry['expires_at'] > now:
+            return True
+        self._remove(key)
+        self.stats['expirations'] += 1
+        return False
+    
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry['shareable']:
+            for band_key in self._band_keys(entry['minhash']):
+                bucket = self._buckets.get(band_key)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band_key]
+    
+    def _check_catalog(self):
+        """Esvazia o cache se músicas foram adicionadas ou removidas do índice (mesclagens não contam)"""
+        index = self.fingerprint_system.index
+        index.refresh()
+        if index.catalog_version != self._catalog_version:
+            if self._entries:
+                self.stats['invalidations'] += 1
+            self._entries.clear()
+            self._buckets.clear()
+            self._catalog_version = index.catalog_version
+    
+    def clear(self):
+        """Esvazia o cache"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+    
+    def get_stats(self) -> Dict:
+        """Contadores de acertos e ocupação"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self._entries)
+        
+        lookups = stats['exact_hits'] + stats['similar_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['exact_hits'] + stats['similar_hits']) / lookups if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['ttl_seconds'] = self.ttl_seconds
+        return stats
@@ -0,0 +1,331 @@
+"""
+Fila de reconhecimentos assíncronos
+Cada job roda em um pool limitado de processos (decodificação, fingerprint,
+busca e fallback de análise), liberando a thread da requisição; a fila tem
+profundidade máxima e rejeita novos jobs quando está cheia. O estado e o
+resultado dos jobs ficam em um banco SQLite, visível para todos os processos
+do servidor web
+"""
+import os
+import json
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+from services.metrics import metrics, trace, stage
+from services.db_connection import get_connection_manager
+
+# Serviços de cada processo do pool (criados uma vez por processo)
+_worker_services = None
+
+class QueueFullError(Exception):
+    """A fila de reconhecimento atingiu a profundidade máxima"""
+
+def _init_worker():
+    """Carrega os serviços de reconhecimento no processo do pool"""
+    global _worker_services
+    from services.audio_service import AudioService
+    from services.recognition_service import RecognitionService
+    _worker_services = (AudioService(), RecognitionService())
+
+def _run_recognition(audio_path: str, job_id: str, db_path: str,
+                     fingerprint: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Dict:
+    """Executa o reconhecimento completo de um arquivo (no processo do pool)
+    
+    `fingerprint` já calculado no processo que enfileirou (chave do cache) evita gerá-lo de novo.
+    Retorna o resultado, os tempos por etapa e o horário de início (para medir a espera na fila).
+    """
+    audio_service, recognition_service = _worker_services
+    started_at = time.time()
+    try:
+        with get_connection_manager(db_path).connection() as conn:
+            conn.execute('''
+                UPDATE recognition_jobs SET status = 'running', started_at = ?
+                WHERE id = ? AND status = 'queued'
+            ''', (started_at, job_id))
+        
+        with trace('recognize_job', record=False) as timings:
+            with stage('feature_extraction'):
+                audio_features = audio_service.extract_features(audio_path)
+            result = recognition_service.recognize(audio_features, audio_path, fingerprint)
+        return {'result': result, 'timings': timings, 'started_at': started_at}
+    finally:
+        audio_service.cleanup_temp_file(audio_path)
+
+def _fingerprint_clip(audio_path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Gera o fingerprint de um trecho (no processo do pool); falhas viram fingerprint vazio"""
+    fingerprint_system = _worker_services[1].fingerprint_system
+    try:
+        return fingerprint_system.generate_fingerprint(audio_path)
+    except Exception as e:
+        print(f"Erro ao gerar fingerprint de {audio_path}: {str(e)}")
+        return fingerprint_system._empty_hashes()
+
+def _json_default(value):
+    """Converte escalares numpy ao gravar resultados"""
+    return value.item() if hasattr(value, 'item') else str(value)
+
+class RecognitionJobQueue:
+    def __init__(self, max_workers: int = None, max_queue: int = 32, on_result: Callable[[Dict], None] = None,
+                 db_path: str = 'data/recognition_jobs.db'):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue  # jobs aguardando ou em execução, somando todos os processos
+        self.on_result = on_result  # chamado no processo que enfileirou o job, com cada resultado
+        
+        self.job_ttl = 600.0  # segundos que um job concluído fica disponível para consulta
+        self.job_timeout = 600.0  # jobs pendentes há mais tempo (processo reiniciado) são dados como falhos
+        self.max_wait = 30.0  # espera máxima de uma consulta (long-poll)
+        self.poll_interval = 0.25  # consulta ao banco no long-poll de jobs enfileirados por outro processo
+        
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self.db = get_connection_manager(self.db_path)
+        self._init_database()
+        
+        self._executor = None
+        self._events: Dict[str, threading.Event] = {}  # jobs deste processo ainda em execução
+        self._callbacks: Dict[str, Callable[[Dict], None]] = {}  # on_result de cada job, além do da fila
+        self._lock = threading.Lock()
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+    
+    def _init_database(self):
+        """Cria a tabela de jobs"""
+        with self.db.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS recognition_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    size INTEGER NOT NULL DEFAULT 1,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    result_json TEXT,
+                    error TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_recognition_jobs_status ON recognition_jobs(status)')
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Pool criado sob demanda ('spawn': o servidor web é multithread)"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+        return self._executor
+    
+    @property
+    def pending(self) -> int:
+        """Trechos aguardando ou em execução em todos os processos (jobs e lotes)"""
+        with self.db.connection() as conn:
+            return self._count_pending(conn)
+    
+    def _count_pending(self, conn) -> int:
+        return conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM recognition_jobs WHERE status IN ('queued', 'running')"
+        ).fetchone()[0]
+    
+    def _reserve(self, job_id: str, status: str, size: int, created_at: float):
+        """Registra `size` trechos na fila ou gera QueueFullError (chamador já possui o lock)"""
+        # Transação exclusiva: contagem e inserção não se intercalam entre processos
+        with self.db.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._purge_expired(conn)
+            if self._count_pending(conn) + size > self.max_queue:
+                self.stats['rejected'] += 1
+                raise QueueFullError('Fila de reconhecimento cheia, tente novamente em instantes')
+            conn.execute(
+                'INSERT INTO recognition_jobs (id, status, size, created_at) VALUES (?, ?, ?, ?)',
+                (job_id, status, size, created_at)
+            )
+    
+    def submit(self, audio_path: str, fingerprint: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+               on_result: Callable[[Dict], None] = None) -> str:
+        """Enfileira o reconhecimento de um arquivo e retorna o id do job
+        
+        O arquivo é removido ao final do job; `on_result` é chamado com o resultado deste job.
+        Gera QueueFullError se a fila estiver cheia.
+        """
+        job_id = uuid.uuid4().hex
+        created_at = time.time()
+        args = (_run_recognition, audio_path, job_id, self.db_path, fingerprint)
+        
+        with self._lock:
+            self._reserve(job_id, 'queued', 1, created_at)
+            
+            try:
+                try:
+                    future = self._get_executor().submit(*args)
+                except BrokenProcessPool:
+                    # Um processo do pool morreu: recriar o pool
+                    self._executor = None
+                    future = self._get_executor().submit(*args)
+            except Exception:
+                with self.db.connection() as conn:
+                    conn.execute('DELETE FROM recognition_jobs WHERE id = ?', (job_id,))
+                raise
+            
+            self._events[job_id] = threading.Event()
+            if on_result is not None:
+                self._callbacks[job_id] = on_result
+            self.stats['submitted'] += 1
+        
+        future.add_done_callback(lambda done: self._finish(job_id, created_at, done))
+        return job_id
+    
+    def submit_result(self, result: Dict) -> str:
+        """Registra como concluído um job cujo resultado já é conhecido (ex.: cache) e retorna o id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        
+        with self.db.connection() as conn:
+            self._purge_expired(conn)
+            conn.execute('''
+                INSERT INTO recognition_jobs (id, status, created_at, started_at, finished_at, result_json)
+                VALUES (?, 'done', ?, ?, ?, ?)
+            ''', (job_id, now, now, now, json.dumps(result, default=_json_default)))
+        
+        with self._lock:
+            self.stats['submitted'] += 1
+            self.stats['completed'] += 1
+        return job_id
+    
+    def fingerprint_batch(self, audio_paths: List[str]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Fingerprints de vários trechos em paralelo no pool, na ordem recebida
+        
+        Cada trecho ocupa uma posição da fila enquanto o lote roda. Gera ValueError se
+        o lote for maior que a fila e QueueFullError se não houver espaço para ele.
+        """
+        if len(audio_paths) > self.max_queue:
+            raise ValueError(f'Lote com {len(audio_paths)} trechos excede o limite de {self.max_queue}')
+        
+        batch_id = uuid.uuid4().hex
+        with self._lock:
+            self._reserve(batch_id, 'running', len(audio_paths), time.time())
+            executor = self._get_executor()
+        
+        # Lotes por processo amortizam a comunicação entre processos
+        chunksize = max(1, len(audio_paths) // (self.max_workers * 4))
+        try:
+            return list(executor.map(_fingerprint_clip, audio_paths, chunksize=chunksize))
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+        finally:
+            with self.db.connection() as conn:
+                conn.execute('DELETE FROM recognition_jobs WHERE id = ?', (batch_id,))
+    
+    def _finish(self, job_id: str, created_at: float, future: Future):
+        """Grava o resultado de um job concluído"""
+        result, error = None, None
+        try:
+            outcome = future.result()
+            result = outcome['result']
+            
+            # Tempos medidos no processo do pool, mais a espera na fila (total de ponta a ponta)
+            timings = dict(outcome['timings'], queue_wait=max(0.0, outcome['started_at'] - created_at))
+            timings['total'] = time.time() - created_at
+            metrics.record_trace('recognize_job', timings)
+        except Exception as e:
+            error = f'Erro no reconhecimento: {str(e)}'
+        
+        try:
+            with self.db.connection() as conn:
+                conn.execute('''
+                    UPDATE recognition_jobs SET status = ?, finished_at = ?, result_json = ?, error = ?
+                    WHERE id = ?
+                ''', ('failed' if error else 'done', time.time(),
+                      json.dumps(result, default=_json_default) if result is not None else None,
+                      error, job_id))
+        except Exception as e:
+            print(f"Erro ao gravar resultado do job {job_id}: {str(e)}")
+        
+        with self._lock:
+            self.stats['failed' if error else 'completed'] += 1
+            event = self._events.pop(job_id, None)
+            callback = self._callbacks.pop(job_id, None)
+        
+        if result is not None:
+            for on_result in (callback, self.on_result):
+                if on_result is None:
+                    continue
+                try:
+                    on_result(result)
+                except Exception as e:
+                    print(f"Erro ao registrar resultado do job {job_id}: {str(e)}")
+        
+        if event is not None:
+            event.set()
+    
+    def _purge_expired(self, conn):
+        """Descarta jobs concluídos há mais de job_ttl segundos e encerra os pendentes há mais de job_timeout"""
+        now = time.time()
+        conn.execute('''
+            UPDATE recognition_jobs SET status = 'failed', finished_at = ?, error = 'Job interrompido'
+            WHERE status IN ('queued', 'running') AND created_at < ?
+        ''', (now, now - self.job_timeout))
+        conn.execute('DELETE FROM recognition_jobs WHERE finished_at < ?', (now - self.job_ttl,))
+    
+    def _load_job(self, job_id: str) -> Optional[Dict]:
+        """Lê o estado de um job no banco (None se não existir)"""
+        with self.db.connection() as conn:
+            row = conn.execute('''
+                SELECT id, status, created_at, started_at, finished_at, result_json, error
+                FROM recognition_jobs WHERE id = ?
+            ''', (job_id,)).fetchone()
+        
+        if row is None:
+            return None
+        
+        return {
+            'job_id': row[0],
+            'status': row[1],
+            'created_at': row[2],
+            'started_at': row[3],
+            'finished_at': row[4],
+            'result': json.loads(row[5]) if row[5] else None,
+            'error': row[6]
+        }
+    
+    def get_status(self, job_id: str, wait: float = 0) -> Optional[Dict]:
+        """Estado de um job; com `wait`, aguarda até esse tempo pela conclusão (long-poll)
+        
+        Jobs enfileirados por outro processo são relidos do banco a cada poll_interval.
+        """
+        job = self._load_job(job_id)
+        if job is None or wait <= 0:
+            return job
+        
+        deadline = time.monotonic() + min(wait, self.max_wait)
+        while job is not None and job['status'] in ('queued', 'running'):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            
+            event = self._events.get(job_id)
+            if event is not None:
+                event.wait(remaining)
+            else:
+                time.sleep(min(self.poll_interval, remaining))
+            job = self._load_job(job_id)
+        
+        return job
+    
+    def get_stats(self) -> Dict:
+        """Retorna contadores da fila (pending soma todos os processos)"""
+        with self._lock:
+            stats = dict(self.stats)
+        return dict(stats, pending=self.pending, max_queue=self.max_queue, workers=self.max_workers)
+    
+    def shutdown(self):
+        """Encerra o pool de processos"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
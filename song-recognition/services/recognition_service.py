@@ -3,17 +3,23 @@ Serviço para reconhecimento de músicas usando sistema local
 """
 import os
 import json
-from typing import Dict, Optional
+import numpy as np
+from typing import Dict, Optional, Tuple
 from services.audio_fingerprint import AudioFingerprint
 from services.audio_analyzer import AudioAnalyzer
+from services.metrics import stage
 
 class RecognitionService:
     def __init__(self):
         self.fingerprint_system = AudioFingerprint()
         self.audio_analyzer = AudioAnalyzer()
     
-    def recognize(self, audio_features: Dict, audio_path: str) -> Dict:
-        """Reconhece música usando sistema local de fingerprinting"""
+    def recognize(self, audio_features: Dict, audio_path: str,
+                  fingerprint: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Dict:
+        """Reconhece música usando sistema local de fingerprinting
+        
+        `fingerprint` (hashes, offsets) já calculado do trecho evita gerá-lo de novo.
+        """
         result = {
             'success': False,
             'service_used': 'Sistema Local',
@@ -24,54 +30,60 @@ class RecognitionService:
         
         try:
             # Tentar reconhecimento por fingerprinting
-            fingerprint_result = self._recognize_by_fingerprint(audio_path)
+            fingerprint_result = self._recognize_by_fingerprint(audio_path, fingerprint)
             if fingerprint_result.get('success'):
                 return fingerprint_result
             
             # Fallback: análise de características
-            analysis_result = self._analyze_characteristics(audio_features, audio_path)
+            with stage('fallback_analysis'):
+                analysis_result = self._analyze_characteristics(audio_features, audio_path)
             if analysis_result.get('success'):
                 return analysis_result
             
             # Último recurso: análise básica
-            basic_result = self._basic_analysis(audio_features)
+            with stage('basic_analysis'):
+                basic_result = self._basic_analysis(audio_features)
             return basic_result
             
         except Exception as e:
             result['message'] = f'Erro no reconhecimento: {str(e)}'
             return result
     
-    def _recognize_by_fingerprint(self, audio_path: str) -> Dict:
+    def _recognize_by_fingerprint(self, audio_path: str, fingerprint=None) -> Dict:
         """Reconhece música usando sistema de fingerprinting local"""
         try:
-            match = self.fingerprint_system.find_matching_song(audio_path)
-            
-            if match:
-                return {
-                    'success': True,
-                    'service_used': 'Fingerprinting Local',
-                    'song_info': {
-                        'title': match['title'],
-                        'artist': match['artist'],
-                        'album': match.get('album', ''),
-                        'duration': match.get('duration', 0),
-                        'created_at': match.get('created_at', '')
-                    },
-                    'confidence': match['confidence'],
-                    'message': 'Música reconhecida pelo banco local!'
-                }
-            
-            return {'success': False, 'message': 'Música não encontrada no banco local'}
-            
+            match = self.fingerprint_system.find_matching_song(audio_path, fingerprint=fingerprint)
+            return self.fingerprint_result(match)
         except Exception as e:
             print(f"Erro no fingerprinting: {str(e)}")
             return {'success': False, 'message': f'Erro no fingerprinting: {str(e)}'}
     
+    @staticmethod
+    def fingerprint_result(match: Optional[Dict]) -> Dict:
+        """Resultado do reconhecimento a partir da melhor candidata do fingerprinting (ou None)"""
+        if not match:
+            return {'success': False, 'message': 'Música não encontrada no banco local'}
+        
+        return {
+            'success': True,
+            'service_used': 'Fingerprinting Local',
+            'song_info': {
+                'title': match['title'],
+                'artist': match['artist'],
+                'album': match.get('album', ''),
+                'duration': match.get('duration', 0),
+                'created_at': match.get('created_at', '')
+            },
+            'confidence': match['confidence'],
+            'offset_seconds': match.get('offset_seconds', 0),
+            'message': 'Música reconhecida pelo banco local!'
+        }
+    
     def _analyze_characteristics(self, audio_features: Dict, audio_path: str) -> Dict:
         """Analisa características do áudio para reconhecimento"""
         try:
-            # Análise avançada de características
-            analysis = self.audio_analyzer.analyze_audio(audio_path)
+            # Análise avançada de características (o trecho é um arquivo temporário)
+            analysis = self.audio_analyzer.analyze_audio(audio_path, remember_path=False)
             
             if analysis:
                 return {
@@ -112,8 +124,8 @@ class RecognitionService:
             tempo_category = self._classify_tempo(tempo)
             
             # Análise de energia espectral
-            mfcc = audio_features.get('mfcc', [])
-            spectral_centroid = audio_features.get('spectral_centroid', [])
+            mfcc = audio_features.get('mfcc_mean', [])
+            spectral_centroid = audio_features.get('spectral_centroid_mean', 0)
             
             genre_guess = self._guess_genre_by_features(tempo, mfcc, spectral_centroid)
             
@@ -152,7 +164,7 @@ class RecognitionService:
         else:
             return "Muito rápido"
     
-    def _guess_genre_by_features(self, tempo: float, mfcc: list, spectral_centroid: list) -> str:
+    def _guess_genre_by_features(self, tempo: float, mfcc: list, spectral_centroid: float) -> str:
         """Tenta adivinhar o gênero baseado nas características"""
         try:
             # Análise muito básica
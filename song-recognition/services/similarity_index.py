@@ -0,0 +1,301 @@
+"""
+Índice de similaridade entre músicas
+Mantém em memória uma matriz normalizada de características (tempo, energia,
+valência, dançabilidade e médias de MFCC) em uma KD-tree, com atualização
+incremental para inclusões e remoções. Alterações feitas por outros processos
+chegam por um log de alterações de audio_features mantido por triggers
+"""
+import json
+import time
+import threading
+import numpy as np
+from scipy.spatial import cKDTree
+from typing import Dict, List, Optional, Tuple
+from services.db_connection import get_connection_manager
+
+SCALAR_FEATURES = ('tempo', 'energy', 'valence', 'danceability')
+N_MFCC = 13
+
+class SimilarityIndex:
+    def __init__(self, db_path='data/music_database.db'):
+        self.db_path = db_path
+        self.db = get_connection_manager(db_path)
+        
+        # Peso do bloco de MFCC em relação a uma característica escalar
+        self.mfcc_weight = 2.0
+        
+        # Inclusões ficam em um buffer (busca exaustiva) até a próxima reconstrução
+        self.rebuild_threshold = 1024
+        self.max_deleted = 256  # pontos removidos tolerados na árvore antes de reconstruí-la
+        self.refresh_interval = 5.0  # segundos entre verificações de alterações feitas por outros processos
+        self.change_log_size = 10000  # alterações mantidas no log; quem ficar mais atrás reconstrói
+        
+        # Busca aproximada: cada vizinho retornado está a no máximo (1 + eps) vezes a distância exata
+        self.search_eps = 0.5
+        
+        self._lock = threading.Lock()
+        self._built = False
+        self._last_check = 0.0
+        self._last_change = 0
+        
+        self._tree = None
+        self._tree_ids = np.empty(0, dtype=np.int64)
+        self._mean = np.zeros(len(SCALAR_FEATURES) + N_MFCC)
+        self._scale = np.ones(len(SCALAR_FEATURES) + N_MFCC)
+        
+        self._vectors: Dict[int, np.ndarray] = {}  # vetor bruto de cada música
+        self._buffer: Dict[int, np.ndarray] = {}  # normalizados, ainda fora da árvore
+        self._deleted = set()  # ainda na árvore, mas removidos ou atualizados
+        
+        self._init_change_log()
+    
+    def _init_change_log(self):
+        """Cria o log de alterações de audio_features (preenchido por triggers, com tamanho limitado)"""
+        with self.db.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS audio_features_changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    song_id INTEGER NOT NULL
+                )
+            ''')
+            for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS audio_features_log_{event.lower()}
+                    AFTER {event} ON audio_features
+                    BEGIN
+                        INSERT INTO audio_features_changes (song_id) VALUES ({row}.song_id);
+                    END
+                ''')
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS audio_features_changes_trim
+                AFTER INSERT ON audio_features_changes
+                BEGIN
+                    DELETE FROM audio_features_changes WHERE seq <= NEW.seq - {int(self.change_log_size)};
+                END
+            ''')
+    
+    @staticmethod
+    def feature_vector(analysis: Dict) -> Optional[np.ndarray]:
+        """Vetor bruto de características a partir de uma análise"""
+        if not analysis:
+            return None
+        
+        mfcc_mean = (analysis.get('spectral_features') or {}).get('mfcc_mean') or []
+        values = [analysis.get(name) or 0.0 for name in SCALAR_FEATURES] + list(mfcc_mean[:N_MFCC])
+        values += [0.0] * (len(SCALAR_FEATURES) + N_MFCC - len(values))
+        return np.asarray(values, dtype=np.float64)
+    
+    def _load_rows(self) -> Tuple[int, List[Tuple[int, int, np.ndarray]]]:
+        """Lê (última alteração do log, [(id da linha, song_id, vetor)]) de audio_features"""
+        with self.db.connection() as conn:
+            # Mesma transação: o log e as linhas lidas correspondem ao mesmo estado
+            conn.execute('BEGIN')
+            last_change = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM audio_features_changes').fetchone()[0]
+            rows = conn.execute('SELECT id, song_id, features_json FROM audio_features ORDER BY id').fetchall()
+        return last_change, self._parse_rows(rows)
+    
+    def _load_song(self, song_id: int) -> List[Tuple[int, int, np.ndarray]]:
+        """Linhas de audio_features de uma música"""
+        with self.db.connection() as conn:
+            rows = conn.execute('''
+                SELECT id, song_id, features_json FROM audio_features
+                WHERE song_id = ? ORDER BY id
+            ''', (song_id,)).fetchall()
+        return self._parse_rows(rows)
+    
+    def _parse_rows(self, rows: List[tuple]) -> List[Tuple[int, int, np.ndarray]]:
+        """Converte linhas (id, song_id, features_json) em vetores"""
+        loaded = []
+        for row_id, song_id, features_json in rows:
+            try:
+                vector = self.feature_vector(json.loads(features_json) if features_json else None)
+            except ValueError:
+                vector = None
+            if vector is not None:
+                loaded.append((row_id, song_id, vector))
+        return loaded
+    
+    def _load_changes(self) -> Optional[List[Tuple[int, int]]]:
+        """[(seq, song_id)] do log após a última alteração aplicada (None se o log já as descartou)"""
+        with self.db.connection() as conn:
+            first = conn.execute('SELECT MIN(seq) FROM audio_features_changes').fetchone()[0]
+            if first is not None and first > self._last_change + 1:
+                return None
+            return conn.execute('''
+                SELECT seq, song_id FROM audio_features_changes WHERE seq > ? ORDER BY seq
+            ''', (self._last_change,)).fetchall()
+    
+    def rebuild(self):
+        """Reconstrói a matriz normalizada e a árvore a partir do banco"""
+        with self._lock:
+            self._rebuild_locked()
+    
+    def _rebuild_locked(self):
+        """Reconstrução propriamente dita (chamador já possui o lock)"""
+        self._last_change, rows = self._load_rows()
+        self._vectors = {song_id: vector for _, song_id, vector in rows}
+        self._build_tree()
+        self._built = True
+        self._last_check = time.monotonic()
+    
+    def _build_tree(self):
+        """Normaliza todos os vetores conhecidos e monta a KD-tree"""
+        self._buffer = {}
+        self._deleted = set()
+        
+        if not self._vectors:
+            self._tree = None
+            self._tree_ids = np.empty(0, dtype=np.int64)
+            return
+        
+        ids = np.fromiter(self._vectors.keys(), dtype=np.int64, count=len(self._vectors))
+        matrix = np.vstack(list(self._vectors.values()))
+        
+        # Padronização por coluna; o bloco de MFCC pesa como `mfcc_weight` características
+        self._mean = matrix.mean(axis=0)
+        std = matrix.std(axis=0)
+        std[std == 0] = 1.0
+        weights = np.ones(matrix.shape[1])
+        weights[len(SCALAR_FEATURES):] = np.sqrt(self.mfcc_weight / N_MFCC)
+        self._scale = std / weights
+        
+        self._tree = cKDTree(self._normalize(matrix))
+        self._tree_ids = ids
+    
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        """Aplica a padronização calculada na última construção"""
+        return (vectors - self._mean) / self._scale
+    
+    def _ensure_current(self):
+        """Constrói o índice na primeira consulta e incorpora alterações de outros processos
+        
+        A verificação lê só as entradas novas do log (busca pela chave primária); cada
+        música alterada é relida e incluída ou removida incrementalmente.
+        """
+        if not self._built:
+            self._rebuild_locked()
+            return
+        
+        now = time.monotonic()
+        if now - self._last_check < self.refresh_interval:
+            return
+        self._last_check = now
+        
+        changes = self._load_changes()
+        if changes is None:
+            # Processo ficou mais atrás do que o log guarda
+            self._rebuild_locked()
+            return
+        
+        for song_id in dict.fromkeys(song_id for _, song_id in changes):
+            rows = self._load_song(song_id)
+            if rows:
+                self._add_locked(song_id, rows[-1][2])
+            else:
+                self._remove_locked(song_id)
+        if changes:
+            self._last_change = changes[-1][0]
+    
+    def add(self, song_id: int, analysis: Dict = None):
+        """Inclui (ou atualiza) uma música sem reconstruir a árvore
+        
+        Sem `analysis`, as características são lidas de audio_features.
+        """
+        with self._lock:
+            if not self._built:
+                return  # será lida do banco na primeira consulta
+            
+            if analysis is None:
+                rows = self._load_song(song_id)
+                if not rows:
+                    return
+                vector = rows[-1][2]
+            else:
+                vector = self.feature_vector(analysis)
+                if vector is None:
+                    return
+            
+            self._add_locked(song_id, vector)
+    
+    def _add_locked(self, song_id: int, vector: np.ndarray):
+        """Inclui no buffer (chamador já possui o lock)"""
+        if song_id in self._vectors:
+            if np.array_equal(self._vectors[song_id], vector):
+                return
+            self._deleted.add(song_id)
+        
+        self._vectors[song_id] = vector
+        self._buffer[song_id] = self._normalize(vector)
+        
+        if len(self._buffer) > self.rebuild_threshold:
+            self._build_tree()
+    
+    def remove(self, song_id: int):
+        """Remove uma música (a árvore ignora o ponto até a próxima reconstrução)"""
+        with self._lock:
+            if self._built:
+                self._remove_locked(song_id)
+    
+    def _remove_locked(self, song_id: int):
+        """Remove do índice (chamador já possui o lock)"""
+        if song_id not in self._vectors:
+            return
+        
+        del self._vectors[song_id]
+        self._buffer.pop(song_id, None)
+        self._deleted.add(song_id)
+        
+        # Removidos acumulados na árvore tornam as consultas mais caras (ver query)
+        if len(self._deleted) > min(self.max_deleted, max(1, len(self._tree_ids) // 10)):
+            self._build_tree()
+    
+    def query(self, song_id: int, limit: int = 10) -> List[Tuple[int, float]]:
+        """Retorna [(song_id, distância)] das músicas mais próximas"""
+        with self._lock:
+            self._ensure_current()
+            
+            vector = self._vectors.get(song_id)
+            if vector is None:
+                return []
+            point = self._normalize(vector)
+            
+            candidates = {}
+            
+            if self._tree is not None:
+                candidates.update(self._query_tree(song_id, point, limit))
+            
+            # Inclusões recentes: busca exaustiva no buffer
+            if self._buffer:
+                buffered = np.vstack(list(self._buffer.values()))
+                distances = np.linalg.norm(buffered - point, axis=1)
+                candidates.update(zip(self._buffer.keys(), distances.tolist()))
+            
+            candidates.pop(song_id, None)
+            return sorted(candidates.items(), key=lambda item: item[1])[:limit]
+    
+    def _query_tree(self, song_id: int, point: np.ndarray, limit: int) -> Dict[int, float]:
+        """Vizinhos vivos na árvore: começa com limit + 1 e dobra k enquanto faltarem resultados"""
+        k = limit + 1
+        while True:
+            k = min(k, len(self._tree_ids))
+            distances, positions = self._tree.query(point, k=k, eps=self.search_eps)
+            found = {}
+            for distance, position in zip(np.atleast_1d(distances), np.atleast_1d(positions)):
+                candidate = int(self._tree_ids[position])
+                if candidate not in self._deleted and candidate != song_id:
+                    found[candidate] = float(distance)
+            
+            if len(found) >= limit or k >= len(self._tree_ids):
+                return found
+            k *= 2
+    
+    def get_stats(self) -> Dict:
+        """Retorna estatísticas do índice"""
+        with self._lock:
+            return {
+                'built': self._built,
+                'songs': len(self._vectors),
+                'tree_size': len(self._tree_ids),
+                'buffered': len(self._buffer),
+                'deleted': len(self._deleted)
+            }
@@ -0,0 +1,189 @@
+"""
+Fingerprinting em streaming com memória limitada
+Processa o áudio em blocos: STFT, picos e hashes são calculados bloco a bloco,
+com offsets absolutos em frames, sem manter o sinal inteiro em memória
+"""
+import numpy as np
+import librosa
+import soundfile as sf
+from typing import Iterator, Tuple
+from scipy.ndimage import maximum_filter
+from services.audio_decoder import SOXR_QUALITIES, DEFAULT_RESAMPLER
+
+try:
+    import soxr
+except ImportError:
+    soxr = None
+
+class StreamingFingerprinter:
+    """Gera hashes incrementalmente a partir de amostras em AudioFingerprint.sample_rate"""
+    
+    def __init__(self, fingerprint_system):
+        self.fp = fingerprint_system
+        self.n_fft = fingerprint_system.window_size
+        self.hop = fingerprint_system.hop_length
+        
+        # Meia vizinhança temporal do seletor de picos
+        self.time_margin = fingerprint_system.peak_neighborhood[1] // 2
+        
+        # Mesmo enquadramento de librosa.stft(center=True): n_fft/2 zeros no início
+        self._samples = np.zeros(self.n_fft // 2, dtype=np.float32)
+        self._next_frame = 0
+        
+        self._preemphasis_state = None
+        
+        # Espectrograma ainda necessário para a seleção de picos
+        self._magnitude = np.empty((self.n_fft // 2 + 1, 0), dtype=np.float32)
+        self._magnitude_start = 0
+        self._peaks_done = 0
+        
+        # Picos que ainda podem ser âncora ou alvo
+        self._peaks = self.fp._empty_peaks()
+        
+        self.total_samples = 0
+    
+    @property
+    def frames_done(self) -> int:
+        """Frames cujos picos já foram definidos"""
+        return self._peaks_done
+    
+    def push(self, samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Adiciona amostras e retorna os hashes que já podem ser emitidos"""
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.size == 0:
+            return self.fp._empty_hashes()
+        
+        self.total_samples += samples.size
+        self._append_samples(self._preprocess(samples))
+        self._compute_frames()
+        self._pick_peaks(final=False)
+        return self._emit_hashes(final=False)
+    
+    def flush(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Finaliza o stream e retorna os hashes restantes"""
+        # Mesmo preenchimento final de librosa.stft(center=True)
+        self._append_samples(np.zeros(self.n_fft // 2, dtype=np.float32))
+        self._compute_frames()
+        self._pick_peaks(final=True)
+        return self._emit_hashes(final=True)
+    
+    def _preprocess(self, samples: np.ndarray) -> np.ndarray:
+        """Pré-ênfase contínua entre blocos (mesmo pré-processamento de AudioFingerprint)"""
+        if self._preemphasis_state is None:
+            y, self._preemphasis_state = librosa.effects.preemphasis(samples, return_zf=True)
+        else:
+            y, self._preemphasis_state = librosa.effects.preemphasis(
+                samples, zi=self._preemphasis_state, return_zf=True
+            )
+        return y.astype(np.float32)
+    
+    def _append_samples(self, samples: np.ndarray):
+        self._samples = np.concatenate([self._samples, samples])
+    
+    def _compute_frames(self):
+        """Calcula a STFT de todos os frames completos disponíveis"""
+        if len(self._samples) < self.n_fft:
+            return
+        
+        n_frames = 1 + (len(self._samples) - self.n_fft) // self.hop
+        used = (n_frames - 1) * self.hop + self.n_fft
+        
+        stft = librosa.stft(self._samples[:used], n_fft=self.n_fft, hop_length=self.hop, center=False)
+        magnitude = self.fp._apply_frequency_filter(np.abs(stft))
+        
+        self._magnitude = np.concatenate([self._magnitude, magnitude.astype(np.float32)], axis=1)
+        self._samples = self._samples[n_frames * self.hop:]
+        self._next_frame += n_frames
+    
+    def _pick_peaks(self, final: bool):
+        """Seleciona picos nos frames cuja vizinhança já está completa"""
+        available_end = self._magnitude_start + self._magnitude.shape[1]
+        
+        if final:
+            region_end = available_end
+        else:
+            # Fechar apenas segundos completos para respeitar o limite de picos por segundo
+            region_end = available_end - self.time_margin
+            region_end -= region_end % self.fp.peak_bucket_frames
+        
+        if region_end <= self._peaks_done:
+            return
+        
+        window_start = max(self._magnitude_start, self._peaks_done - self.time_margin)
+        window_end = min(available_end, region_end + self.time_margin)
+        window = self._magnitude[:, window_start - self._magnitude_start:window_end - self._magnitude_start]
+        
+        freq_idx, frame_idx, amplitudes = self._find_block_peaks(window, window_start)
+        keep = (frame_idx >= self._peaks_done) & (frame_idx < region_end)
+        
+        self._peaks = tuple(
+            np.concatenate([old, new[keep]])
+            for old, new in zip(self._peaks, (freq_idx, frame_idx, amplitudes))
+        )
+        self._peaks_done = region_end
+        
+        # Manter apenas o contexto necessário para o próximo bloco
+        drop = max(0, region_end - self.time_margin - self._magnitude_start)
+        self._magnitude = self._magnitude[:, drop:]
+        self._magnitude_start += drop
+    
+    def _find_block_peaks(self, magnitude: np.ndarray, first_frame: int):
+        """Seletor de picos do AudioFingerprint aplicado a um bloco com frames absolutos"""
+        if self.fp.peak_picker == 'legacy':
+            freq_idx, frame_idx, amplitudes = self.fp._find_spectral_peaks_legacy(magnitude)
+            return freq_idx, frame_idx + first_frame, amplitudes
+        
+        local_max = maximum_filter(magnitude, size=self.fp.peak_neighborhood, mode='constant', cval=0.0)
+        # Só os segundos completos da janela são usados, e seus limiares coincidem com os do sinal inteiro
+        thresholds = self.fp._band_thresholds(magnitude, first_frame)
+        is_peak = (magnitude == local_max) & (magnitude > thresholds)
+        
+        freq_idx, frame_idx = np.nonzero(is_peak)
+        frame_idx = frame_idx + first_frame
+        amplitudes = magnitude[freq_idx, frame_idx - first_frame]
+        
+        keep = self.fp._limit_peaks_per_second(frame_idx, amplitudes)
+        return (freq_idx[keep].astype(np.int32), frame_idx[keep].astype(np.int32),
+                amplitudes[keep].astype(np.float32))
+    
+    def _emit_hashes(self, final: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """Gera hashes das âncoras cuja zona alvo já está completa"""
+        if final:
+            anchor_limit = self._peaks_done + 1
+        else:
+            anchor_limit = self._peaks_done - self.fp.target_zone_size
+            if anchor_limit <= 0:
+                return self.fp._empty_hashes()
+        
+        hashes, offsets = self.fp._generate_hashes(self._peaks, max_anchor_frame=anchor_limit)
+        
+        # Picos que já serviram de âncora não são alvo de âncoras futuras
+        remaining = self._peaks[1] >= anchor_limit
+        self._peaks = tuple(values[remaining] for values in self._peaks)
+        
+        return hashes, offsets
+
+def iter_audio_blocks(audio_path: str, target_sr: int, block_seconds: float = 30.0) -> Iterator[np.ndarray]:
+    """Lê um arquivo em blocos mono float32 já reamostrados para target_sr"""
+    info = sf.info(audio_path)
+    block_frames = max(1, int(block_seconds * info.samplerate))
+    
+    resampler = None
+    if info.samplerate != target_sr:
+        if soxr is None:
+            raise RuntimeError('soxr é necessário para reamostrar em streaming')
+        quality = SOXR_QUALITIES.get(DEFAULT_RESAMPLER, 'HQ')
+        resampler = soxr.ResampleStream(info.samplerate, target_sr, 1, dtype='float32', quality=quality)
+    
+    blocks = sf.blocks(audio_path, blocksize=block_frames, dtype='float32', always_2d=True)
+    for block in blocks:
+        mono = block.mean(axis=1)
+        if resampler is not None:
+            mono = resampler.resample_chunk(mono, last=False)
+        if mono.size:
+            yield mono
+    
+    if resampler is not None:
+        tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+        if tail.size:
+            yield tail
@@ -0,0 +1,336 @@
+"""
+Índice de embeddings de timbre
+Cada música é representada por um vetor float32 de tamanho fixo derivado dos
+MFCCs (médias, desvios e correlações), normalizado para busca por cosseno.
+Os vetores ficam em um arquivo contíguo mapeado em memória; a busca é um
+produto de matrizes em lote, com quantizador grosso opcional (IVF)
+"""
+import os
+import json
+import threading
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+# Coeficientes usados no embedding (c0 mede apenas volume e fica de fora)
+TIMBRE_COEFFICIENTS = 12
+TIMBRE_DIM = 2 * TIMBRE_COEFFICIENTS + TIMBRE_COEFFICIENTS * (TIMBRE_COEFFICIENTS - 1) // 2
+
+def timbre_embedding(mfcc: np.ndarray) -> np.ndarray:
+    """Embedding de timbre a partir de uma matriz de MFCC (coeficientes x frames)"""
+    coeffs = np.asarray(mfcc, dtype=np.float64)[1:TIMBRE_COEFFICIENTS + 1]
+    if coeffs.shape[0] < TIMBRE_COEFFICIENTS or coeffs.shape[1] < 2:
+        return np.zeros(TIMBRE_DIM, dtype=np.float32)
+    
+    mean = coeffs.mean(axis=1)
+    std = coeffs.std(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.nan_to_num(np.corrcoef(coeffs))
+    corr = corr[np.triu_indices(TIMBRE_COEFFICIENTS, k=1)]
+    
+    # Cada bloco com norma unitária para que nenhum domine o cosseno
+    blocks = []
+    for block in (mean, std, corr):
+        norm = np.linalg.norm(block)
+        blocks.append(block / norm if norm > 0 else block)
+    
+    embedding = np.concatenate(blocks)
+    norm = np.linalg.norm(embedding)
+    return (embedding / norm if norm > 0 else embedding).astype(np.float32)
+
+class TimbreIndex:
+    def __init__(self, index_dir='data/timbre_index'):
+        self.index_dir = index_dir
+        self.dim = TIMBRE_DIM
+        self.embeddings_path = os.path.join(index_dir, 'embeddings.f32')
+        self.ids_path = os.path.join(index_dir, 'ids.i64')
+        self.lists_path = os.path.join(index_dir, 'lists.i32')
+        self.centroids_path = os.path.join(index_dir, 'centroids.npy')
+        self.state_path = os.path.join(index_dir, 'state.json')
+        self.lock_path = os.path.join(index_dir, '.lock')
+        
+        # Parâmetros do IVF
+        self.ivf_min_rows = 50000  # abaixo disso a busca exaustiva já é rápida
+        self.nprobe = 8  # listas visitadas por consulta
+        
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._embeddings = np.empty((0, self.dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._lists = np.empty(0, dtype=np.int32)
+        self._centroids = None
+        self._deleted_rows = np.empty(0, dtype=np.int64)
+        self._row_of_song: Dict[int, int] = {}
+        self._alive = np.empty(0, dtype=bool)
+        self._list_rows: List[np.ndarray] = []
+        
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.refresh()
+    
+    def _file_stamp(self) -> Tuple:
+        """Tamanho/mtime dos arquivos, para detectar alterações de outros processos"""
+        stamp = []
+        for path in (self.ids_path, self.lists_path, self.state_path, self.centroids_path):
+            try:
+                stat = os.stat(path)
+                stamp.append((stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+    
+    def refresh(self):
+        """Recarrega (via mmap) os arquivos se o índice foi alterado"""
+        with self._lock:
+            stamp = self._file_stamp()
+            if stamp == self._stamp:
+                return
+            self._load()
+            self._stamp = stamp
+    
+    def _load(self):
+        """Mapeia os arquivos em memória (chamador já possui o lock)"""
+        n_rows = os.path.getsize(self.ids_path) // 8 if os.path.exists(self.ids_path) else 0
+        if n_rows:
+            self._ids = np.memmap(self.ids_path, dtype=np.int64, mode='r', shape=(n_rows,))
+            self._embeddings = np.memmap(self.embeddings_path, dtype=np.float32, mode='r',
+                                         shape=(n_rows, self.dim))
+            self._lists = np.memmap(self.lists_path, dtype=np.int32, mode='r', shape=(n_rows,))
+        else:
+            self._ids = np.empty(0, dtype=np.int64)
+            self._embeddings = np.empty((0, self.dim), dtype=np.float32)
+            self._lists = np.empty(0, dtype=np.int32)
+        
+        state = self._read_state()
+        self._deleted_rows = np.asarray(sorted(state['deleted_rows']), dtype=np.int64)
+        self._centroids = np.load(self.centroids_path) if state['ivf_trained'] else None
+        
+        # Linha mais recente de cada música que não foi removida
+        not_deleted = np.ones(n_rows, dtype=bool)
+        not_deleted[self._deleted_rows[self._deleted_rows < n_rows]] = False
+        candidate_rows = np.flatnonzero(not_deleted)
+        self._row_of_song = dict(zip(np.asarray(self._ids)[candidate_rows].tolist(), candidate_rows.tolist()))
+        
+        alive_rows = np.sort(np.fromiter(self._row_of_song.values(), dtype=np.int64, count=len(self._row_of_song)))
+        self._alive = np.zeros(n_rows, dtype=bool)
+        self._alive[alive_rows] = True
+        
+        # Linhas de cada lista do IVF (-1 = ainda sem lista)
+        if self._centroids is not None:
+            lists = np.asarray(self._lists)[alive_rows]
+            order = np.argsort(lists, kind='stable')
+            bounds = np.searchsorted(lists[order], np.arange(-1, len(self._centroids) + 1))
+            self._list_rows = [alive_rows[order[bounds[i]:bounds[i + 1]]] for i in range(len(bounds) - 1)]
+        else:
+            self._list_rows = []
+    
+    def _read_state(self) -> Dict:
+        """Lê o estado (remoções e IVF)"""
+        if not os.path.exists(self.state_path):
+            return {'deleted_rows': [], 'ivf_trained': False}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _write_state(self, state: Dict):
+        """Grava o estado de forma atômica"""
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+    
+    @contextmanager
+    def _write_lock(self):
+        """Lock exclusivo entre processos para alterar o índice"""
+        with open(self.lock_path, 'a+') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def __len__(self) -> int:
+        """Quantidade de músicas com embedding"""
+        self.refresh()
+        return len(self._row_of_song)
+    
+    def add(self, song_id: int, embedding: np.ndarray):
+        """Adiciona (ou substitui) o embedding de uma música"""
+        self.add_many([(song_id, embedding)])
+    
+    def add_many(self, items: Iterable[Tuple[int, np.ndarray]]):
+        """Acrescenta vários embeddings ao final dos arquivos"""
+        items = [(int(song_id), np.asarray(embedding, dtype=np.float32)) for song_id, embedding in items
+                 if embedding is not None and len(embedding) == self.dim]
+        if not items:
+            return
+        
+        with self._write_lock():
+            ids = np.asarray([song_id for song_id, _ in items], dtype=np.int64)
+            embeddings = np.vstack([embedding for _, embedding in items]).astype(np.float32)
+            
+            # Novas linhas entram direto na lista do centróide mais próximo
+            if self._centroids is not None:
+                lists = np.argmax(embeddings @ self._centroids.T, axis=1).astype(np.int32)
+            else:
+                lists = np.full(len(items), -1, dtype=np.int32)
+            
+            # Linhas antigas das mesmas músicas deixam de valer
+            state = self._read_state()
+            replaced = [self._row_of_song[song_id] for song_id in ids.tolist() if song_id in self._row_of_song]
+            if replaced:
+                state['deleted_rows'] = sorted(set(state['deleted_rows']) | set(replaced))
+            
+            # Embeddings antes dos ids: leitores só enxergam linhas com id gravado
+            with open(self.embeddings_path, 'ab') as f:
+                f.write(embeddings.tobytes())
+            with open(self.lists_path, 'ab') as f:
+                f.write(lists.tobytes())
+            with open(self.ids_path, 'ab') as f:
+                f.write(ids.tobytes())
+            
+            self._write_state(state)
+    
+    def remove(self, song_id: int):
+        """Marca o embedding de uma música como removido"""
+        with self._write_lock():
+            row = self._row_of_song.get(int(song_id))
+            if row is None:
+                return
+            state = self._read_state()
+            state['deleted_rows'] = sorted(set(state['deleted_rows']) | {row})
+            self._write_state(state)
+    
+    def get_embedding(self, song_id: int) -> Optional[np.ndarray]:
+        """Embedding atual de uma música"""
+        self.refresh()
+        row = self._row_of_song.get(int(song_id))
+        return None if row is None else np.array(self._embeddings[row])
+    
+    def search(self, queries: np.ndarray, k: int = 10, exclude: Iterable[int] = ()) -> List[List[Tuple[int, float]]]:
+        """Top-K por similaridade de cosseno para um lote de consultas
+        
+        Retorna, para cada consulta, [(song_id, similaridade)] em ordem decrescente.
+        """
+        self.refresh()
+        
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1)
+        exclude = set(int(song_id) for song_id in exclude)
+        
+        with self._lock:
+            if not self._row_of_song:
+                return [[] for _ in range(len(queries))]
+            
+            use_ivf = self._centroids is not None and len(self._row_of_song) >= self.ivf_min_rows
+            if use_ivf:
+                return [self._search_ivf(query, k, exclude) for query in queries]
+            
+            # Produto com a matriz inteira; linhas removidas ou substituídas ficam com -inf
+            scores = queries @ self._embeddings.T
+            if not self._alive.all():
+                scores[:, ~self._alive] = -np.inf
+            rows = np.arange(len(self._ids))
+            return [self._top_k(rows, row_scores, k, exclude) for row_scores in scores]
+    
+    def _search_ivf(self, query: np.ndarray, k: int, exclude: set) -> List[Tuple[int, float]]:
+        """Busca apenas nas `nprobe` listas mais próximas (e nas linhas sem lista)"""
+        nprobe = min(self.nprobe, len(self._centroids))
+        probes = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        
+        # _list_rows[0] guarda as linhas ainda sem lista (-1)
+        rows = np.concatenate([self._list_rows[0]] + [self._list_rows[probe + 1] for probe in probes])
+        if rows.size == 0:
+            return []
+        
+        scores = np.asarray(self._embeddings[rows]) @ query
+        return self._top_k(rows, scores, k, exclude)
+    
+    def _top_k(self, rows: np.ndarray, scores: np.ndarray, k: int, exclude: set) -> List[Tuple[int, float]]:
+        """Seleciona as K maiores similaridades, ignorando músicas excluídas"""
+        want = min(len(rows), k + len(exclude))
+        if want == 0:
+            return []
+        top = np.argpartition(-scores, want - 1)[:want]
+        top = top[np.argsort(-scores[top])]
+        
+        results = []
+        for position in top:
+            if not np.isfinite(scores[position]):
+                break
+            song_id = int(self._ids[rows[position]])
+            if song_id in exclude:
+                continue
+            results.append((song_id, float(scores[position])))
+            if len(results) == k:
+                break
+        return results
+    
+    def train_ivf(self, n_lists: int = None):
+        """Treina o quantizador grosso (k-means nos embeddings) e reatribui as listas"""
+        from sklearn.cluster import MiniBatchKMeans
+        
+        with self._write_lock():
+            rows = np.flatnonzero(self._alive)
+            if rows.size == 0:
+                return
+            
+            n_lists = min(n_lists or max(1, int(np.sqrt(rows.size))), rows.size)
+            sample = np.asarray(self._embeddings[rows])
+            
+            kmeans = MiniBatchKMeans(n_clusters=n_lists, batch_size=4096, n_init=3, random_state=0)
+            kmeans.fit(sample)
+            centroids = kmeans.cluster_centers_.astype(np.float32)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+            
+            # Reatribuir todas as linhas em blocos para limitar a memória
+            lists = np.empty(len(self._ids), dtype=np.int32)
+            for start in range(0, len(self._ids), 65536):
+                block = np.asarray(self._embeddings[start:start + 65536])
+                lists[start:start + 65536] = np.argmax(block @ centroids.T, axis=1)
+            
+            np.save(self.centroids_path, centroids)
+            tmp_path = self.lists_path + '.tmp'
+            lists.tofile(tmp_path)
+            os.replace(tmp_path, self.lists_path)
+            
+            state = self._read_state()
+            state['ivf_trained'] = True
+            self._write_state(state)
+    
+    def compact(self):
+        """Reescreve os arquivos sem as linhas removidas"""
+        with self._write_lock():
+            rows = np.flatnonzero(self._alive)
+            ids = np.asarray(self._ids[rows])
+            embeddings = np.asarray(self._embeddings[rows])
+            lists = np.asarray(self._lists[rows])
+            
+            for path, values in ((self.embeddings_path, embeddings), (self.lists_path, lists),
+                                 (self.ids_path, ids)):
+                tmp_path = path + '.tmp'
+                values.tofile(tmp_path)
+                os.replace(tmp_path, path)
+            
+            state = self._read_state()
+            state['deleted_rows'] = []
+            self._write_state(state)
+    
+    def get_stats(self) -> Dict:
+        """Retorna estatísticas do índice"""
+        self.refresh()
+        return {
+            'songs': len(self._row_of_song),
+            'rows': len(self._ids),
+            'deleted_rows': len(self._deleted_rows),
+            'dim': self.dim,
+            'ivf_lists': 0 if self._centroids is None else len(self._centroids),
+            'size_mb': len(self._ids) * (self.dim * 4 + 12) / (1024 * 1024)
+        }
@@ -0,0 +1,56 @@
+"""
+Configuração comum dos testes
+Os testes rodam a partir da raiz do projeto e usam músicas sintéticas geradas
+em diretórios temporários (nenhum arquivo de áudio real é necessário)
+"""
+import os
+import sys
+import numpy as np
+import pytest
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SAMPLE_RATE = 22050
+
+def synth_song(seed: int, seconds: float = 20.0, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """Sequência de notas com harmônicos e um pouco de ruído, diferente para cada seed"""
+    rng = np.random.default_rng(seed)
+    note_length = int(0.25 * sr)
+    t = np.arange(note_length) / sr
+    envelope = np.exp(-3.0 * t)
+    
+    notes = []
+    for _ in range(int(seconds / 0.25)):
+        freqs = rng.uniform(110, 3000, size=3)
+        note = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate(freqs))
+        notes.append(note * envelope)
+    
+    y = np.concatenate(notes) + 0.01 * rng.standard_normal(len(notes) * note_length)
+    return (0.8 * y / np.max(np.abs(y))).astype(np.float32)
+
+@pytest.fixture
+def write_song(tmp_path):
+    """Grava uma música sintética (ou um trecho dela) em WAV e retorna o caminho"""
+    def write(seed: int, seconds: float = 20.0, start: float = 0.0, duration: float = None,
+              sr: int = SAMPLE_RATE) -> str:
+        y = synth_song(seed, seconds, sr)
+        first = int(start * sr)
+        last = len(y) if duration is None else first + int(duration * sr)
+        path = os.path.join(str(tmp_path), f'song_{seed}_{start}_{duration}_{sr}.wav')
+        sf.write(path, y[first:last], sr)
+        return path
+    return write
+
+@pytest.fixture
+def music_db(tmp_path, monkeypatch):
+    """MusicDatabase com todos os bancos em data/ dentro de um diretório temporário"""
+    monkeypatch.chdir(tmp_path)
+    from services.music_database import MusicDatabase
+    return MusicDatabase()
+
+@pytest.fixture
+def fingerprint_system(tmp_path):
+    """AudioFingerprint com banco e índice em um diretório temporário"""
+    from services.audio_fingerprint import AudioFingerprint
+    return AudioFingerprint(db_path=os.path.join(str(tmp_path), 'data', 'audio_fingerprints.db'))
@@ -0,0 +1,90 @@
+"""
+Testes do cache persistente de análises: limites do LRU em disco
+"""
+import os
+from services.analysis_cache import AnalysisCache
+
+def make_cache(tmp_path, **options) -> AnalysisCache:
+    return AnalysisCache(db_path=os.path.join(str(tmp_path), 'cache.db'), max_memory_items=0, **options)
+
+def disk_keys(cache):
+    with cache.db.connection() as conn:
+        return {row[0] for row in conn.execute('SELECT cache_key FROM analysis_cache')}
+
+def test_round_trip_from_disk(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('analysis:1:abc', {'tempo': 120.0, 'key': 'C'})
+    
+    assert make_cache(tmp_path).get('analysis:1:abc') == {'tempo': 120.0, 'key': 'C'}
+    assert cache.get('analysis:1:missing') is None
+
+def test_evicts_least_recently_used_rows(tmp_path):
+    cache = make_cache(tmp_path, max_rows=3)
+    for i in range(4):
+        cache.put(f'k{i}', {'i': i})
+    
+    # Leitura renova k0: o menos usado passa a ser k1
+    assert cache.get('k0') == {'i': 0}
+    cache.put('k4', {'i': 4})
+    removed = cache.evict()
+    
+    assert removed == 2
+    assert disk_keys(cache) == {'k0', 'k3', 'k4'}
+    assert cache.get_stats()['disk_items'] == 3
+
+def test_evicts_by_bytes(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=250)
+    for i in range(5):
+        cache.put(f'k{i}', {'payload': 'x' * 90})
+    
+    cache.evict()
+    
+    assert disk_keys(cache) == {'k3', 'k4'}
+    assert cache.get_stats()['disk_bytes'] <= 250
+
+def test_evicts_during_writes(tmp_path):
+    cache = make_cache(tmp_path, max_rows=10)
+    cache.evict_interval = 5
+    for i in range(40):
+        cache.put(f'k{i}', {'i': i})
+    
+    assert len(disk_keys(cache)) <= 10 + cache.evict_interval
+
+def test_file_hashes_bounded(tmp_path):
+    cache = make_cache(tmp_path, max_rows=2)
+    paths = []
+    for i in range(4):
+        paths.append(os.path.join(str(tmp_path), f'{i}.wav'))
+        with open(paths[-1], 'wb') as f:
+            f.write(b'x' * i)
+        cache.set_file_hash(paths[-1], f'hash{i}')
+    
+    cache.evict()
+    
+    assert [cache.get_file_hash(path) for path in paths] == [None, None, 'hash2', 'hash3']
+
+def test_temp_clip_path_not_recorded(tmp_path, write_song):
+    from services.audio_analyzer import AudioAnalyzer
+    cache = make_cache(tmp_path)
+    path = write_song(5, seconds=3.0)
+    
+    assert AudioAnalyzer(cache).analyze_audio(path, remember_path=False)
+    assert cache.get_file_hash(path) is None
+    
+    with cache.db.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM file_hashes').fetchone()[0] == 0
+
+def test_reads_buffer_access_times_until_eviction(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('k0', {'i': 0})
+    
+    def last_access():
+        with cache.db.connection() as conn:
+            return conn.execute("SELECT last_access FROM analysis_cache WHERE cache_key = 'k0'").fetchone()[0]
+    
+    written = last_access()
+    assert cache.get('k0') == {'i': 0}
+    assert last_access() == written
+    
+    cache.evict()
+    assert last_access() > written
@@ -0,0 +1,43 @@
+"""
+Testes das rotas da API (cliente de testes do Flask, dados em diretório temporário)
+"""
+import importlib
+import pytest
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    # A aplicação cria seus bancos relativos ao diretório atual ao ser importada
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(tmp_path_factory.mktemp('app'))
+        app_module = importlib.import_module('app')
+        yield app_module.app.test_client()
+
+def test_history_rejects_non_integer_limit(client):
+    response = client.get('/history?limit=abc')
+    assert response.status_code == 400
+    assert 'limit' in response.get_json()['error']
+
+def test_history_accepts_out_of_range_limit(client):
+    for limit in ('0', '-5', '100000'):
+        response = client.get(f'/history?limit={limit}')
+        assert response.status_code == 200
+        assert response.get_json() == {'recognitions': [], 'next_cursor': None}
+
+def test_songs_limit_validated(client):
+    assert client.get('/api/songs?limit=1.5').status_code == 400
+    assert client.get('/api/songs?limit=0').get_json() == {'songs': [], 'next_cursor': None}
+
+def test_batch_rejects_invalid_paths(client):
+    for body in ({'paths': 'clip.wav'}, {'paths': []}, {'paths': ['clip.wav', 3]}, {'paths': [None]}):
+        response = client.post('/recognize/batch', json=body)
+        assert response.status_code == 400
+        assert 'paths' in response.get_json()['error']
+
+def test_metrics_route(client):
+    client.get('/health')
+    snapshot = client.get('/metrics').get_json()
+    
+    assert snapshot['latency']['http.health_check']['count'] >= 1
+    assert snapshot['counters']['http.health_check.200'] >= 1
+    assert 'recognition_cache' in snapshot and 'fingerprint_lookup' in snapshot
+    assert 'recognition_jobs' not in snapshot
@@ -0,0 +1,97 @@
+"""
+Testes da decodificação: trecho pedido (offset/duration), reamostradores e fallbacks
+"""
+import numpy as np
+import pytest
+import soundfile as sf
+from services import audio_decoder
+from services.audio_decoder import decode_audio, RESAMPLERS
+
+NATIVE_SR = 44100
+TONE_HZ = 440.0
+
+@pytest.fixture
+def tone_wav(tmp_path):
+    """WAV estéreo de 3 s a 44,1 kHz: senoide de 440 Hz nos dois canais"""
+    t = np.arange(3 * NATIVE_SR) / NATIVE_SR
+    tone = 0.5 * np.sin(2 * np.pi * TONE_HZ * t)
+    path = str(tmp_path / 'tone.wav')
+    sf.write(path, np.column_stack([tone, tone]), NATIVE_SR, subtype='FLOAT')
+    return path
+
+def expected_tone(offset, n, sr):
+    return 0.5 * np.sin(2 * np.pi * TONE_HZ * (offset + np.arange(n) / sr))
+
+def assert_tone(y, offset, sr):
+    # Ignora as bordas, onde o filtro do reamostrador ainda não tem contexto
+    edge = sr // 100
+    expected = expected_tone(offset, len(y), sr)
+    assert np.max(np.abs(y[edge:-edge] - expected[edge:-edge])) < 0.01
+
+def test_native_rate_keeps_requested_range(tone_wav):
+    y, sr = decode_audio(tone_wav, offset=0.5, duration=1.0)
+    
+    assert sr == NATIVE_SR and y.dtype == np.float32
+    assert len(y) == NATIVE_SR
+    assert np.allclose(y, expected_tone(0.5, len(y), NATIVE_SR), atol=1e-5)
+
+@pytest.mark.parametrize('resampler', RESAMPLERS)
+def test_resamplers_return_requested_range_and_rate(tone_wav, resampler):
+    y, sr = decode_audio(tone_wav, sr=22050, offset=0.5, duration=1.0, resampler=resampler)
+    
+    assert sr == 22050 and y.dtype == np.float32
+    assert len(y) == 22050
+    assert_tone(y, 0.5, sr)
+
+def test_polyphase_used_without_soxr(tone_wav, monkeypatch):
+    expected, _ = decode_audio(tone_wav, sr=16000, duration=1.0, resampler='polyphase')
+    monkeypatch.setattr(audio_decoder, 'soxr', None)
+    
+    y, sr = decode_audio(tone_wav, sr=16000, duration=1.0, resampler='soxr_hq')
+    assert sr == 16000 and len(y) == 16000
+    assert np.array_equal(y, expected)
+
+def test_range_past_end_is_truncated(tone_wav):
+    y, _ = decode_audio(tone_wav, offset=2.5, duration=2.0)
+    assert len(y) == NATIVE_SR // 2
+    
+    y, _ = decode_audio(tone_wav, offset=5.0)
+    assert len(y) == 0
+
+def test_unknown_resampler_rejected(tone_wav):
+    with pytest.raises(ValueError):
+        decode_audio(tone_wav, sr=22050, resampler='linear')
+
+def test_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        decode_audio(str(tmp_path / 'missing.wav'))
+
+def test_unsupported_format_goes_to_ffmpeg(tone_wav, monkeypatch):
+    calls = []
+    
+    def unsupported(audio_path, offset, duration):
+        raise RuntimeError('formato não suportado')
+    
+    def fake_ffmpeg(audio_path, sr, offset, duration):
+        calls.append((sr, offset, duration))
+        return np.zeros(int(duration * sr), dtype=np.float32), sr
+    
+    monkeypatch.setattr(audio_decoder, '_decode_soundfile', unsupported)
+    monkeypatch.setattr(audio_decoder, '_decode_ffmpeg', fake_ffmpeg)
+    monkeypatch.setattr(audio_decoder, 'FFMPEG', '/usr/bin/ffmpeg')
+    
+    # O ffmpeg entrega direto na taxa pedida (sem reamostrar de novo)
+    y, sr = decode_audio(tone_wav, sr=22050, offset=0.5, duration=1.0)
+    assert calls == [(22050, 0.5, 1.0)]
+    assert sr == 22050 and len(y) == 22050
+
+def test_librosa_fallback_without_ffmpeg(tone_wav, monkeypatch):
+    def unsupported(audio_path, offset, duration):
+        raise RuntimeError('formato não suportado')
+    
+    monkeypatch.setattr(audio_decoder, '_decode_soundfile', unsupported)
+    monkeypatch.setattr(audio_decoder, 'FFMPEG', None)
+    
+    y, sr = decode_audio(tone_wav, sr=22050, offset=0.5, duration=1.0)
+    assert sr == 22050 and len(y) == 22050
+    assert_tone(y, 0.5, sr)
@@ -0,0 +1,117 @@
+"""
+Testes do formato de hash e do reconhecimento com um índice sintético pequeno
+"""
+import numpy as np
+import pytest
+from services.audio_fingerprint import AudioFingerprint, HASH_FIELD_BITS
+
+def test_pack_unpack_round_trip():
+    rng = np.random.default_rng(1)
+    limit = 1 << (HASH_FIELD_BITS - 1)
+    freq = rng.integers(0, 1 << HASH_FIELD_BITS, 1000)
+    freq_diff = rng.integers(-limit, limit, 1000)
+    time_diff = rng.integers(-limit, limit, 1000)
+    
+    hashes = AudioFingerprint._pack_hashes(freq, freq_diff, time_diff)
+    unpacked = AudioFingerprint._unpack_hashes(hashes)
+    
+    assert hashes.dtype == np.int64
+    assert (hashes >= 0).all() and (hashes < 1 << (3 * HASH_FIELD_BITS)).all()
+    np.testing.assert_array_equal(unpacked[0], freq)
+    np.testing.assert_array_equal(unpacked[1], freq_diff)
+    np.testing.assert_array_equal(unpacked[2], time_diff)
+
+def test_pack_keeps_fields_apart():
+    # Cada campo no limite não invade os bits do vizinho
+    limit = (1 << (HASH_FIELD_BITS - 1)) - 1
+    extremes = [(4095, limit, limit), (4095, -limit - 1, -limit - 1), (0, -1, 0), (0, 0, -1), (1, 0, 0)]
+    hashes = AudioFingerprint._pack_hashes(*map(np.array, zip(*extremes)))
+    
+    assert len(np.unique(hashes)) == len(extremes)
+    for (freq, freq_diff, time_diff), fields in zip(extremes, zip(*AudioFingerprint._unpack_hashes(hashes))):
+        assert fields == (freq, freq_diff, time_diff)
+
+def test_generated_hashes_within_field_bounds(fingerprint_system, write_song):
+    hashes, offsets = fingerprint_system.generate_fingerprint(write_song(1, seconds=8.0))
+    freq, freq_diff, time_diff = AudioFingerprint._unpack_hashes(hashes)
+    
+    assert len(hashes) > 0 and len(hashes) == len(offsets)
+    assert freq.min() >= 0 and freq.max() <= fingerprint_system.window_size // 2
+    assert np.abs(freq_diff).max() <= fingerprint_system.target_zone_freq
+    assert time_diff.min() >= fingerprint_system.target_zone_start
+    assert time_diff.max() <= fingerprint_system.target_zone_size
+
+def test_recognizes_known_clip(fingerprint_system, write_song):
+    song_ids = [fingerprint_system.add_song_to_database(f'Song {seed}', 'Artist', write_song(seed))
+                for seed in range(4)]
+    assert None not in song_ids
+    
+    matches = fingerprint_system.find_matching_songs(write_song(2, start=6.0, duration=6.0))
+    
+    assert matches[0]['id'] == song_ids[2]
+    assert matches[0]['matches'] > 10 * (matches[1]['matches'] if len(matches) > 1 else 0)
+    # Offset do trecho na música (em frames do STFT)
+    assert abs(matches[0]['offset_seconds'] - 6.0) < 0.2
+
+def test_unknown_clip_has_no_confident_match(fingerprint_system, write_song):
+    for seed in range(3):
+        fingerprint_system.add_song_to_database(f'Song {seed}', 'Artist', write_song(seed))
+    
+    assert fingerprint_system.find_matching_song(write_song(99, seconds=6.0)) is None
+
+def test_fingerprint_count_matches_stored_postings(fingerprint_system):
+    # Hashes podados e postings repetidos não contam
+    for path in ('a.wav', 'b.wav'):
+        fingerprint_system.add_fingerprinted_song('Common', 'Artist', path, 10.0, np.array([7]), np.array([0]))
+    assert fingerprint_system.index.prune_common_hashes(max_df_ratio=0.5, min_df=0)['new_stop_hashes'] == 1
+    
+    song_id = fingerprint_system.add_fingerprinted_song('Song', 'Artist', 'song.wav', 10.0,
+                                                        np.array([7, 10, 10, 20]), np.array([0, 1, 1, 2]))
+    (batch_id,) = fingerprint_system.add_fingerprinted_songs([
+        {'title': 'Other', 'artist': 'Artist', 'file_path': 'other.wav', 'duration': 10.0,
+         'hashes': np.array([7, 30]), 'offsets': np.array([0, 1])}
+    ])
+    
+    with fingerprint_system.db.connection() as conn:
+        counts = dict(conn.execute('SELECT id, fingerprint_count FROM songs WHERE id >= ?', (song_id,)).fetchall())
+    assert counts == {song_id: 2, batch_id: 1}
+
+def test_failed_batch_leaves_no_postings(fingerprint_system, write_song, monkeypatch):
+    hashes, offsets = fingerprint_system.generate_fingerprint(write_song(3, seconds=8.0))
+    add_songs = fingerprint_system.index.add_songs
+    
+    def add_then_fail(items):
+        add_songs(items)
+        raise RuntimeError('falha antes do commit')
+    
+    monkeypatch.setattr(fingerprint_system.index, 'add_songs', add_then_fail)
+    with pytest.raises(RuntimeError):
+        fingerprint_system.add_fingerprinted_songs([
+            {'title': 'Song', 'artist': 'Artist', 'file_path': 'song.wav', 'duration': 8.0,
+             'hashes': hashes, 'offsets': offsets}
+        ])
+    
+    with fingerprint_system.db.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM songs').fetchone()[0] == 0
+    assert fingerprint_system.index.song_count == 0
+
+def test_two_stage_matcher_agrees_with_exhaustive(fingerprint_system, write_song):
+    for seed in range(8):
+        fingerprint_system.add_song_to_database(f'Song {seed}', 'Artist', write_song(seed))
+    clips = [write_song(seed, start=4.0 + seed, duration=6.0) for seed in range(8)]
+    clips.append(write_song(99, seconds=6.0))
+    
+    exhaustive = [fingerprint_system.find_matching_song(clip) for clip in clips]
+    
+    fingerprint_system.matcher = 'two_stage'
+    fingerprint_system.shortlist_size = 3
+    fingerprint_system.recall_check_interval = 1
+    two_stage = [fingerprint_system.find_matching_song(clip) for clip in clips]
+    
+    assert [match and match['title'] for match in two_stage] == [match and match['title'] for match in exhaustive]
+    assert [match['title'] for match in two_stage[:8]] == [f'Song {seed}' for seed in range(8)]
+    
+    stats = fingerprint_system.get_lookup_stats()
+    assert stats['shortlist_queries'] == len(clips)
+    assert 8 <= stats['recall_checks'] <= len(clips)
+    assert stats['shortlist_recall'] == 1.0
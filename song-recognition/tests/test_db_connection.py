@@ -0,0 +1,49 @@
+"""
+Testes do gerenciador de conexões: transação única em blocos aninhados
+"""
+import sqlite3
+import pytest
+from services.db_connection import ConnectionManager
+
+@pytest.fixture
+def db(tmp_path):
+    manager = ConnectionManager(str(tmp_path / 'test.db'))
+    with manager.connection() as conn:
+        conn.execute('CREATE TABLE items (value INTEGER)')
+    yield manager
+    manager.close_all()
+
+def committed(db):
+    """Valores visíveis para outra conexão (apenas os já confirmados)"""
+    conn = sqlite3.connect(db.db_path)
+    try:
+        return [row[0] for row in conn.execute('SELECT value FROM items ORDER BY value')]
+    finally:
+        conn.close()
+
+def test_nested_block_does_not_commit_outer_transaction(db):
+    with db.connection() as outer:
+        outer.execute('INSERT INTO items VALUES (1)')
+        with db.connection() as inner:
+            assert inner is outer
+            inner.execute('INSERT INTO items VALUES (2)')
+        assert committed(db) == []
+    assert committed(db) == [1, 2]
+
+def test_nested_failure_rolls_back_only_at_outer_level(db):
+    with db.connection() as outer:
+        outer.execute('INSERT INTO items VALUES (1)')
+        with pytest.raises(ValueError):
+            with db.connection() as inner:
+                inner.execute('INSERT INTO items VALUES (2)')
+                raise ValueError('falha no bloco interno')
+        assert outer.in_transaction
+    assert committed(db) == [1, 2]
+    
+    with pytest.raises(ValueError):
+        with db.connection() as outer:
+            outer.execute('INSERT INTO items VALUES (3)')
+            with db.connection() as inner:
+                inner.execute('INSERT INTO items VALUES (4)')
+            raise ValueError('falha no bloco externo')
+    assert committed(db) == [1, 2]
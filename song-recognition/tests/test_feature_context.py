@@ -0,0 +1,94 @@
+"""
+Testes do contexto de características: primitivas calculadas uma vez e saída das
+análises igual à das chamadas diretas ao librosa
+"""
+import os
+import librosa
+import numpy as np
+import pytest
+import soundfile as sf
+from services.analysis_cache import AnalysisCache
+from services.audio_analyzer import AudioAnalyzer
+from services.audio_service import AudioService
+from services.feature_context import FeatureContext
+from conftest import SAMPLE_RATE, synth_song
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnalysisCache(db_path=os.path.join(str(tmp_path), 'cache.db'), max_memory_items=0)
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Conta as chamadas das primitivas espectrais do librosa"""
+    counts = {}
+    for module, name in ((librosa, 'stft'), (librosa.feature, 'melspectrogram'), (librosa.feature, 'chroma_stft'),
+                         (librosa.feature, 'mfcc'), (librosa.onset, 'onset_strength'), (librosa.beat, 'beat_track')):
+        original = getattr(module, name)
+        
+        def counted(*args, _original=original, _name=name, **kwargs):
+            counts[_name] = counts.get(_name, 0) + 1
+            return _original(*args, **kwargs)
+        
+        monkeypatch.setattr(module, name, counted)
+    return counts
+
+def test_primitives_are_computed_once(calls):
+    ctx = FeatureContext(synth_song(1, seconds=5.0), SAMPLE_RATE)
+    for _ in range(2):
+        ctx.tempo, ctx.beats, ctx.onset_frames, ctx.chroma, ctx.mfcc
+        ctx.spectral_centroid, ctx.spectral_rolloff, ctx.spectral_bandwidth, ctx.rms
+    
+    assert calls == {'stft': 1, 'melspectrogram': 1, 'chroma_stft': 1, 'mfcc': 1,
+                     'onset_strength': 1, 'beat_track': 1}
+
+def test_full_analysis_shares_one_stft(cache, calls):
+    analysis = AudioAnalyzer(cache).analyze_signal(synth_song(1, seconds=5.0), SAMPLE_RATE)
+    
+    assert analysis is not None
+    assert calls['stft'] == 1 and calls['beat_track'] == 1 and calls['chroma_stft'] == 1
+
+def test_analysis_matches_direct_librosa_calls(cache):
+    y = synth_song(2, seconds=6.0)
+    analysis = AudioAnalyzer(cache).analyze_signal(y, SAMPLE_RATE)
+    
+    assert set(analysis) == {'tempo', 'key', 'mode', 'energy', 'valence', 'danceability', 'genre',
+                             'instruments', 'structure', 'spectral_features', 'rhythmic_features', 'duration'}
+    assert analysis['duration'] == len(y) / SAMPLE_RATE
+    
+    # Mesmas chaves de antes, mais o embedding de timbre
+    spectral = analysis['spectral_features']
+    assert set(spectral) == {'mfcc_mean', 'mfcc_std', 'spectral_centroid_mean', 'spectral_centroid_std',
+                             'spectral_rolloff_mean', 'spectral_rolloff_std', 'zcr_mean', 'zcr_std',
+                             'timbre_embedding'}
+    mfcc = librosa.feature.mfcc(y=y, sr=SAMPLE_RATE, n_mfcc=13)
+    centroid = librosa.feature.spectral_centroid(y=y, sr=SAMPLE_RATE)[0]
+    assert np.allclose(spectral['mfcc_mean'], mfcc.mean(axis=1), rtol=1e-4, atol=1e-3)
+    assert spectral['spectral_centroid_mean'] == pytest.approx(float(centroid.mean()), rel=1e-4)
+    assert spectral['zcr_mean'] == pytest.approx(float(librosa.feature.zero_crossing_rate(y)[0].mean()))
+    
+    rhythmic = analysis['rhythmic_features']
+    assert set(rhythmic) == {'onset_strength_mean', 'onset_strength_std', 'rhythm_regularity', 'beat_count', 'tempo'}
+    tempo, beats = librosa.beat.beat_track(y=y, sr=SAMPLE_RATE)
+    assert rhythmic['tempo'] == pytest.approx(float(np.atleast_1d(tempo)[0]))
+    assert rhythmic['beat_count'] == len(beats)
+    assert analysis['tempo'] == rhythmic['tempo'] > 0
+
+def test_extract_features_keeps_only_means(cache, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    y = synth_song(3, seconds=5.0, sr=44100)
+    path = str(tmp_path / 'clip.wav')
+    sf.write(path, y, 44100)
+    
+    features = AudioService(cache).extract_features(path)
+    
+    # Séries por frame substituídas pelas médias (mfcc -> mfcc_mean, etc.)
+    assert set(features) == {'mfcc_mean', 'spectral_centroid_mean', 'spectral_rolloff_mean', 'zcr_mean',
+                             'chroma_mean', 'tempo', 'duration'}
+    assert len(features['mfcc_mean']) == 13 and len(features['chroma_mean']) == 12
+    assert features['duration'] == len(y) / 44100
+    
+    y, sr = librosa.load(path, sr=44100)
+    assert np.allclose(features['mfcc_mean'], librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13).mean(axis=1), rtol=1e-4, atol=1e-3)
+    assert np.allclose(features['chroma_mean'], librosa.feature.chroma_stft(y=y, sr=sr).mean(axis=1), atol=1e-5)
+    assert features['spectral_rolloff_mean'] == pytest.approx(
+        float(librosa.feature.spectral_rolloff(y=y, sr=sr)[0].mean()), rel=1e-4)
@@ -0,0 +1,131 @@
+"""
+Testes do índice de segmentos: escrita, mesclagem, remoção e recarga por outro processo
+"""
+import os
+import numpy as np
+from services.fingerprint_index import FingerprintIndex
+
+def postings(index, hashes):
+    """Conjunto de (hash, song_id, offset) encontrados para os hashes"""
+    hashes = np.asarray(hashes, dtype=np.int64)
+    positions, song_ids, offsets = index.lookup(hashes)
+    return set(zip(hashes[positions].tolist(), song_ids.tolist(), offsets.tolist()))
+
+def make_index(tmp_path, **options) -> FingerprintIndex:
+    index = FingerprintIndex(os.path.join(str(tmp_path), 'index'))
+    index.max_df_ratio = None
+    for name, value in options.items():
+        setattr(index, name, value)
+    return index
+
+def test_lookup_across_write_segments(tmp_path):
+    index = make_index(tmp_path)
+    index.add_song(1, np.array([10, 20, 30]), np.array([0, 1, 2]))
+    index.add_song(2, np.array([20, 40]), np.array([5, 6]))
+    
+    assert index.get_stats()['write_segments'] == 2
+    assert postings(index, [20, 40, 99]) == {(20, 1, 1), (20, 2, 5), (40, 2, 6)}
+
+def test_query_hash_repeated(tmp_path):
+    index = make_index(tmp_path)
+    index.add_song(1, np.array([7]), np.array([3]))
+    
+    positions, song_ids, offsets = index.lookup(np.array([7, 8, 7]))
+    assert sorted(positions.tolist()) == [0, 2]
+    assert song_ids.tolist() == [1, 1] and offsets.tolist() == [3, 3]
+
+def test_merge_keeps_postings_and_removes_files(tmp_path):
+    index = make_index(tmp_path)
+    index.add_song(1, np.array([10, 20]), np.array([0, 1]))
+    index.add_song(2, np.array([20, 30]), np.array([2, 3]))
+    old_names = index._manifest['write_segments']
+    generation = index.generation
+    
+    index.merge()
+    
+    stats = index.get_stats()
+    assert stats['base_segments'] == 1 and stats['write_segments'] == 0
+    assert stats['total_postings'] == 4 and stats['songs'] == 2
+    assert index.generation > generation
+    assert postings(index, [10, 20, 30]) == {(10, 1, 0), (20, 1, 1), (20, 2, 2), (30, 2, 3)}
+    assert not any(os.path.exists(index._segment_file(name, 'hashes')) for name in old_names)
+
+def test_write_segments_merge_automatically(tmp_path):
+    index = make_index(tmp_path, max_write_segments=2)
+    for song_id in range(1, 4):
+        index.add_song(song_id, np.array([song_id * 10]), np.array([0]))
+    
+    stats = index.get_stats()
+    assert stats['base_segments'] == 1 and stats['write_segments'] == 0
+    assert {song for _, song, _ in postings(index, [10, 20, 30])} == {1, 2, 3}
+
+def test_remove_song_hidden_before_and_after_merge(tmp_path):
+    index = make_index(tmp_path)
+    index.add_song(1, np.array([10, 20]), np.array([0, 1]))
+    index.add_song(2, np.array([20, 30]), np.array([2, 3]))
+    
+    index.remove_song(1)
+    assert postings(index, [10, 20, 30]) == {(20, 2, 2), (30, 2, 3)}
+    assert index.get_stats()['deleted_songs'] == 1
+    
+    index.merge()
+    stats = index.get_stats()
+    assert stats['deleted_songs'] == 0 and stats['total_postings'] == 2 and stats['songs'] == 1
+    assert postings(index, [10, 20, 30]) == {(20, 2, 2), (30, 2, 3)}
+
+def test_duplicate_postings_stored_once(tmp_path):
+    index = make_index(tmp_path)
+    index.add_song(1, np.array([10, 10, 10]), np.array([4, 4, 5]))
+    
+    assert index.get_stats()['total_postings'] == 2
+
+def test_other_instance_sees_changes(tmp_path):
+    writer = make_index(tmp_path)
+    reader = make_index(tmp_path)
+    
+    writer.add_song(1, np.array([10]), np.array([0]))
+    assert postings(reader, [10]) == {(10, 1, 0)}
+    
+    writer.remove_song(1)
+    writer.merge()
+    assert postings(reader, [10]) == set()
+
+def test_song_filter(tmp_path):
+    index = make_index(tmp_path)
+    index.add_songs([(1, np.array([10]), np.array([0])), (2, np.array([10]), np.array([1])),
+                     (3, np.array([10]), np.array([2]))])
+    
+    _, song_ids, _ = index.lookup(np.array([10]), song_filter=np.array([1, 3]))
+    assert sorted(song_ids.tolist()) == [1, 3]
+
+def test_remove_unknown_or_merged_song_keeps_count(tmp_path):
+    index = make_index(tmp_path)
+    index.add_song(1, np.array([10]), np.array([0]))
+    index.add_song(2, np.array([20]), np.array([1]))
+    
+    index.remove_song(99)
+    assert index.get_stats()['deleted_songs'] == 0 and index.song_count == 2
+    
+    index.remove_song(1)
+    index.remove_song(1)
+    index.merge()
+    index.remove_song(1)
+    assert index.get_stats()['deleted_songs'] == 0 and index.song_count == 1
+
+def test_common_hashes_skipped_at_query_and_pruned_explicitly(tmp_path):
+    index = make_index(tmp_path, max_df_ratio=0.5, min_stop_df=2)
+    assert index.add_song(1, np.array([7, 100]), np.array([0, 1])) == 2
+    index.add_song(2, np.array([7, 200]), np.array([0, 1]))
+    assert postings(index, [7]) == {(7, 1, 0), (7, 2, 0)}
+    
+    # Terceira música: o hash 7 passa a aparecer em mais da metade do catálogo (limite 2)
+    index.add_song(3, np.array([7, 300]), np.array([0, 1]))
+    stats = index.get_stats()
+    assert stats['stop_hashes'] == 0 and stats['total_postings'] == 6
+    assert postings(index, [7]) == set()
+    
+    # Só a poda explícita remove os postings e impede que o hash seja gravado de novo
+    assert index.prune_common_hashes()['new_stop_hashes'] == 1
+    assert index.get_stats()['total_postings'] == 3
+    assert index.add_song(4, np.array([7, 400]), np.array([0, 1])) == 1
+    assert postings(index, [100, 400]) == {(100, 1, 1), (400, 4, 1)}
@@ -0,0 +1,69 @@
+"""
+Testes da gravação nos dois bancos (fingerprints e músicas) pelo pipeline de ingestão
+"""
+import pytest
+
+FAIL_INSERTS = "CREATE TRIGGER fail_insert BEFORE INSERT ON songs BEGIN SELECT RAISE(ABORT, 'falha'); END"
+
+def fingerprint_songs(music_db):
+    with music_db.fingerprint_system.db.connection() as conn:
+        return conn.execute('SELECT id, file_path FROM songs ORDER BY id').fetchall()
+
+def catalog_songs(music_db):
+    with music_db.db.connection() as conn:
+        return conn.execute('SELECT file_path, fingerprint_id FROM songs ORDER BY id').fetchall()
+
+def batch_item(music_db, path, title):
+    return {'title': title, 'artist': 'Artist', 'processed': music_db.pipeline.process(path, analyze=False)}
+
+def test_write_links_catalog_to_fingerprints(music_db, write_song):
+    processed = music_db.pipeline.process(write_song(1, seconds=5.0), analyze=False)
+    
+    song_id = music_db.pipeline.write(processed, 'Song', 'Artist')
+    
+    assert song_id is not None
+    assert catalog_songs(music_db) == [(processed['file_path'], fingerprint_songs(music_db)[0][0])]
+
+def test_failed_catalog_insert_removes_fingerprint_song(music_db, write_song):
+    processed = music_db.pipeline.process(write_song(1, seconds=5.0), analyze=False)
+    with music_db.db.connection() as conn:
+        conn.execute(FAIL_INSERTS)
+    
+    assert music_db.pipeline.write(processed, 'Song', 'Artist') is None
+    
+    assert fingerprint_songs(music_db) == []
+    assert music_db.fingerprint_system.index.lookup(processed['hashes'])[0].size == 0
+
+def test_batch_resume_reuses_fingerprints(music_db, write_song):
+    items = [batch_item(music_db, write_song(seed, seconds=5.0), f'Song {seed}') for seed in range(3)]
+    
+    # Lote interrompido entre os dois commits: fingerprints gravados, catálogo não
+    music_db.fingerprint_system.add_fingerprinted_songs([
+        dict(item['processed'], title=item['title'], artist=item['artist']) for item in items[:2]
+    ])
+    orphans = fingerprint_songs(music_db)
+    postings = music_db.fingerprint_system.index.get_stats()['total_postings']
+    
+    song_ids = music_db.pipeline.write_batch(items)
+    
+    fingerprints = fingerprint_songs(music_db)
+    assert len(song_ids) == 3
+    assert len(fingerprints) == 3 and fingerprints[:2] == orphans
+    assert [fingerprint_id for _, fingerprint_id in catalog_songs(music_db)] == [song_id for song_id, _ in fingerprints]
+    
+    # Apenas a música nova acrescentou postings ao índice
+    new_postings = music_db.fingerprint_system.index.get_stats()['total_postings'] - postings
+    third = items[2]['processed']
+    assert new_postings == len(set(zip(third['hashes'].tolist(), third['offsets'].tolist())))
+
+def test_failed_batch_removes_new_fingerprint_songs(music_db, write_song):
+    items = [batch_item(music_db, write_song(seed, seconds=5.0), f'Song {seed}') for seed in range(2)]
+    with music_db.db.connection() as conn:
+        conn.execute(FAIL_INSERTS)
+    
+    with pytest.raises(Exception):
+        music_db.pipeline.write_batch(items)
+    
+    assert fingerprint_songs(music_db) == []
+    assert catalog_songs(music_db) == []
+    assert music_db.fingerprint_system.index.lookup(items[0]['processed']['hashes'])[0].size == 0
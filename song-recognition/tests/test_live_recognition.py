@@ -0,0 +1,136 @@
+"""
+Testes do reconhecimento ao vivo: intervalo de consulta, critérios de decisão e
+gravação pelo AudioController com blocos sintéticos entregues em on_chunk
+"""
+import time
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from services.live_recognition import LiveRecognizer
+from conftest import SAMPLE_RATE, synth_song
+
+def candidate(song_id, matches, score=0.9):
+    return {'song_id': song_id, 'matches': matches, 'score': score, 'offset_seconds': 0.0}
+
+@pytest.fixture
+def scripted(fingerprint_system, monkeypatch):
+    """Reconhecedor cujas candidatas são definidas pelo teste; registra cada avaliação"""
+    evaluations = []
+    script = {'candidates': []}
+    
+    def scores(song_ids, deltas, top_k):
+        evaluations.append(recognizer.seconds_received)
+        return script['candidates']
+    
+    monkeypatch.setattr(fingerprint_system, '_calculate_match_scores', scores)
+    recognizer = make_recognizer(fingerprint_system)
+    return recognizer, script, evaluations
+
+def make_recognizer(fingerprint_system):
+    # Um hash por bloco: sempre há evidência nova, sem a latência do fingerprint em streaming
+    recognizer = LiveRecognizer(fingerprint_system, input_sample_rate=SAMPLE_RATE)
+    recognizer.streamer = SimpleNamespace(push=lambda samples: (np.array([1]), np.array([0])),
+                                          flush=lambda: (np.array([1]), np.array([0])))
+    recognizer.max_seconds = 60.0
+    return recognizer
+
+def feed(recognizer, seconds, block=0.2):
+    """Entrega `seconds` de áudio em blocos; retorna True quando o reconhecedor terminar"""
+    samples = np.zeros(int(round(block * SAMPLE_RATE)), dtype=np.float32)
+    for _ in range(int(round(seconds / block))):
+        if recognizer.push(samples):
+            return True
+    return False
+
+def test_queries_once_per_interval(scripted):
+    recognizer, _, evaluations = scripted
+    assert recognizer.query_interval == 1.0
+    
+    # 30 blocos de 0,2 s, uma consulta por segundo de áudio
+    assert not feed(recognizer, 6.0)
+    assert evaluations == pytest.approx([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    assert recognizer.state == 'listening'
+
+def test_waits_for_min_seconds(scripted):
+    recognizer, script, evaluations = scripted
+    script['candidates'] = [candidate(1, 40)]
+    recognizer.min_seconds = 3.0
+    
+    assert not feed(recognizer, 2.8)
+    assert evaluations == pytest.approx([1.0, 2.0])
+    assert feed(recognizer, 1.0)
+    assert recognizer.state == 'matched'
+    assert recognizer.result['seconds_listened'] == pytest.approx(3.0)
+
+def test_margin_over_runner_up(scripted):
+    recognizer, script, _ = scripted
+    script['candidates'] = [candidate(1, 20), candidate(2, 15)]
+    
+    # Segunda candidata próxima demais: continua ouvindo até o fim do stream
+    assert not feed(recognizer, 4.0)
+    result = recognizer.finish()
+    assert recognizer.state == 'matched' and result['success']
+    assert result['seconds_listened'] == pytest.approx(4.0)
+    
+    # Abaixo dos limites mínimos no fim do stream: sem resultado
+    weak = make_recognizer(recognizer.fingerprint_system)
+    script['candidates'] = [candidate(1, 5), candidate(2, 1)]
+    assert not feed(weak, 3.0)
+    assert weak.finish()['success'] is False and weak.state == 'no_match'
+
+def test_margin_reached_decides_early(scripted):
+    recognizer, script, _ = scripted
+    script['candidates'] = [candidate(1, 20), candidate(2, 9)]
+    
+    assert feed(recognizer, 5.0)
+    assert recognizer.result['seconds_listened'] == pytest.approx(recognizer.min_seconds)
+
+@pytest.fixture
+def controller(fingerprint_system, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from controllers.audio_controller import AudioController
+    controller = AudioController()
+    controller.fingerprint_system = fingerprint_system
+    return controller
+
+def fake_recorder(controller, y, pause=0.0):
+    """Substitui a gravação: entrega `y` em blocos PCM int16 pelo on_chunk"""
+    rate = controller.audio_service.sample_rate
+    pcm = (np.clip(y, -1, 1) * 32767).astype(np.int16)
+    
+    def record_audio(duration=10, on_chunk=None):
+        for first in range(0, min(len(pcm), int(duration * rate)), 1024):
+            if on_chunk(pcm[first:first + 1024].tobytes()):
+                break
+            time.sleep(pause)
+    
+    controller.audio_service.record_audio = record_audio
+
+def test_controller_recognizes_live_chunks(controller, fingerprint_system, write_song):
+    for seed in range(3):
+        fingerprint_system.add_song_to_database(f'Song {seed}', 'Artist', write_song(seed))
+    
+    rate = controller.audio_service.sample_rate
+    fake_recorder(controller, synth_song(2, seconds=20.0, sr=rate)[5 * rate:])
+    
+    assert controller.start_live_recognition(max_seconds=10.0)['status'] == 'success'
+    controller.live_thread.join(timeout=30)
+    
+    status = controller.get_live_status()
+    assert status['state'] == 'matched'
+    assert status['result']['song_info']['title'] == 'Song 2'
+    assert status['seconds_listened'] < 10.0
+    assert not controller.is_recording
+
+def test_controller_stop_finishes_recognizer(controller):
+    rate = controller.audio_service.sample_rate
+    noise = 0.1 * np.random.default_rng(0).standard_normal(60 * rate)
+    fake_recorder(controller, noise, pause=0.01)
+    
+    controller.start_live_recognition(max_seconds=60.0)
+    time.sleep(0.2)
+    status = controller.stop_live_recognition()
+    
+    assert not controller.live_thread.is_alive()
+    assert status['state'] == 'no_match' and status['result']['success'] is False
+    assert status['seconds_listened'] < 60.0
@@ -0,0 +1,113 @@
+"""
+Testes das métricas: percentis dos histogramas, janela deslizante e traces por etapa
+"""
+import json
+import threading
+import pytest
+from services import metrics as metrics_module
+from services.metrics import MetricsRegistry, RollingHistogram, trace, stage
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Registro novo no lugar do global usado por trace()"""
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics_module, 'metrics', registry)
+    return registry
+
+def test_percentiles_use_bucket_upper_bounds():
+    histogram = RollingHistogram()
+    for milliseconds in [3.0] * 90 + [40.0] * 9 + [800.0]:
+        histogram.observe(milliseconds)
+    
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 100
+    assert snapshot['mean_ms'] == pytest.approx((270 + 360 + 800) / 100)
+    assert (snapshot['p50_ms'], snapshot['p90_ms'], snapshot['p99_ms']) == (5, 5, 50)
+    assert snapshot['max_ms'] == 800.0
+    assert snapshot['buckets'] == {'le_5': 90, 'le_50': 9, 'le_1000': 1}
+
+def test_percentiles_capped_at_maximum():
+    histogram = RollingHistogram()
+    histogram.observe(0.3)
+    histogram.observe(90000.0)
+    
+    snapshot = histogram.snapshot()
+    assert snapshot['p50_ms'] == 0.5
+    assert snapshot['p99_ms'] == 90000.0
+    assert snapshot['buckets'] == {'le_0.5': 1, 'inf': 1}
+    
+    single = RollingHistogram()
+    single.observe(0.3)
+    assert single.snapshot()['p99_ms'] == 0.3
+
+def test_old_slots_leave_the_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(metrics_module.time, 'time', lambda: now[0])
+    histogram = RollingHistogram(window_seconds=10.0, slots=5)
+    histogram.observe(1.0)
+    
+    now[0] += 8.0
+    histogram.observe(2.0)
+    assert histogram.snapshot()['count'] == 2
+    
+    now[0] += 4.0
+    assert histogram.snapshot()['count'] == 1
+    now[0] += 10.0
+    assert histogram.snapshot() == {'count': 0}
+
+def test_trace_sums_stages(registry):
+    with trace('recognize') as timings:
+        with stage('decode'):
+            pass
+        with stage('scoring'):
+            pass
+        with stage('decode'):
+            pass
+    
+    assert set(timings) == {'decode', 'scoring', 'total'}
+    assert timings['total'] >= timings['decode'] + timings['scoring']
+    
+    latency = registry.snapshot()['latency']
+    assert latency['recognize']['count'] == 1
+    assert latency['recognize.decode']['count'] == 1
+    assert latency['recognize.scoring']['count'] == 1
+
+def test_stage_without_trace_and_unrecorded_trace(registry):
+    with stage('decode'):
+        pass
+    with trace('worker', record=False) as timings:
+        with stage('decode'):
+            pass
+    
+    assert 'decode' in timings
+    assert registry.snapshot()['latency'] == {}
+
+def test_traces_are_isolated_per_thread(registry):
+    barrier = threading.Barrier(2)
+    results = {}
+    
+    def run(name):
+        with trace(name) as timings:
+            with stage(f'{name}_stage'):
+                barrier.wait(5)
+        results[name] = set(timings)
+    
+    threads = [threading.Thread(target=run, args=(name,)) for name in ('a', 'b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert results == {'a': {'a_stage', 'total'}, 'b': {'b_stage', 'total'}}
+
+def test_slow_requests_logged_with_slowest_stage(registry, tmp_path):
+    registry.slow_request_ms = 50
+    registry.slow_log_path = str(tmp_path / 'slow.log')
+    registry.record_trace('recognize', {'decode': 0.01, 'scoring': 0.08, 'total': 0.1})
+    registry.record_trace('recognize', {'decode': 0.01, 'total': 0.02})
+    
+    with open(registry.slow_log_path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+    assert len(entries) == 1
+    assert entries[0]['slowest_stage'] == 'scoring'
+    assert registry.snapshot()['counters'] == {'recognize.slow': 1}
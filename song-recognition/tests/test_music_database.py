@@ -0,0 +1,26 @@
+"""
+Testes das leituras de músicas do catálogo
+"""
+
+def test_getters_share_row_mapping(music_db):
+    with music_db.db.connection() as conn:
+        song_id = conn.execute('''
+            INSERT INTO songs (title, artist, album, genre, year, duration, file_path, file_size)
+            VALUES ('Song', 'Artist', 'Album', 'rock', 1999, 180.5, '/music/song.wav', 1234)
+        ''').lastrowid
+        conn.execute('''
+            INSERT INTO audio_features (song_id, tempo, key, mode, energy, valence, danceability)
+            VALUES (?, 120.0, 'C', 'major', 0.7, 0.5, 0.6)
+        ''', (song_id,))
+        conn.commit()
+    
+    by_id = music_db.get_song_by_id(song_id)
+    by_path = music_db.get_song_by_path('/music/song.wav')
+    
+    assert by_id['tempo'] == 120.0 and by_id['key'] == 'C' and by_id['danceability'] == 0.6
+    assert by_path == {key: value for key, value in by_id.items()
+                       if key not in ('tempo', 'key', 'mode', 'energy', 'valence', 'danceability')}
+    assert by_path['year'] == 1999 and by_path['file_size'] == 1234
+    assert music_db.search_songs(query='song')[0] == by_id
+    assert music_db.get_song_by_id(song_id + 1) is None
+    assert music_db.get_song_by_path('/music/other.wav') is None
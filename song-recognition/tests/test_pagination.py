@@ -0,0 +1,101 @@
+"""
+Testes da paginação por keyset (busca de músicas e histórico)
+"""
+import os
+import pytest
+from models import history_store
+from models.history_store import HistoryStore
+from services import music_database
+
+def collect_pages(fetch, limit):
+    """Percorre todas as páginas seguindo next_cursor"""
+    items, cursor, pages = [], None, 0
+    while True:
+        page_items, cursor = fetch(limit, cursor)
+        items.extend(page_items)
+        pages += 1
+        if cursor is None:
+            return items, pages
+
+@pytest.fixture
+def catalog(music_db):
+    # Mesmo created_at para todas: o desempate é pelo id
+    with music_db.db.connection() as conn:
+        conn.executemany('''
+            INSERT INTO songs (title, artist, genre, file_path, created_at)
+            VALUES (?, ?, ?, ?, '2024-01-01 00:00:00')
+        ''', [(f'Love Song {i}' if i % 2 else f'Other Tune {i}', f'Artist {i % 3}', 'rock', f'/music/{i}.wav')
+              for i in range(23)])
+        conn.commit()
+    return music_db
+
+def test_recent_pages_cover_every_song_once(catalog):
+    def fetch(limit, cursor):
+        page = catalog.search_songs_page(limit=limit, cursor=cursor)
+        return page['songs'], page['next_cursor']
+    
+    songs, pages = collect_pages(fetch, 5)
+    ids = [song['id'] for song in songs]
+    
+    assert pages == 5
+    assert ids == sorted(ids, reverse=True) and len(set(ids)) == 23
+
+def test_ranked_pages_cover_every_match_once(catalog):
+    if not catalog.fts_enabled:
+        pytest.skip('SQLite sem FTS5')
+    
+    def fetch(limit, cursor):
+        page = catalog.search_songs_page(query='love', limit=limit, cursor=cursor)
+        return page['songs'], page['next_cursor']
+    
+    songs, _ = collect_pages(fetch, 4)
+    titles = [song['title'] for song in songs]
+    
+    assert len(titles) == len(set(titles)) == 11
+    assert all(title.startswith('Love Song') for title in titles)
+
+def test_cursor_from_other_mode_rejected(catalog):
+    cursor = catalog.search_songs_page(limit=2)['next_cursor']
+    
+    if catalog.fts_enabled:
+        with pytest.raises(ValueError):
+            catalog.search_songs_page(query='love', cursor=cursor)
+    with pytest.raises(ValueError):
+        catalog.search_songs_page(cursor='not-a-cursor')
+
+def test_history_pages(tmp_path):
+    store = HistoryStore('recognitions', db_path=os.path.join(str(tmp_path), 'history.db'))
+    ids = [store.append({'success': i % 2 == 0, 'n': i}, 'rec') for i in range(7)]
+    
+    records, pages = collect_pages(lambda limit, cursor: store.page(limit, cursor), 3)
+    assert pages == 3
+    assert [record['id'] for record in records] == ids[::-1]
+    
+    successes, _ = collect_pages(lambda limit, cursor: store.page(limit, cursor, success=True), 2)
+    assert [record['n'] for record in successes] == [6, 4, 2, 0]
+    
+    with pytest.raises(ValueError):
+        store.page(cursor='abc')
+
+def test_history_page_limit_clamped(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_store, 'MAX_PAGE_SIZE', 4)
+    store = HistoryStore('recognitions', db_path=os.path.join(str(tmp_path), 'history.db'))
+    ids = [store.append({'n': i}, 'rec') for i in range(6)]
+    
+    for limit in (0, -3):
+        records, cursor = store.page(limit)
+        assert [record['id'] for record in records] == ids[-1:]
+        assert store.page(1, cursor)[0][0]['id'] == ids[-2]
+    
+    records, cursor = store.page(100)
+    assert len(records) == 4 and cursor is not None
+
+def test_song_page_limit_clamped(catalog, monkeypatch):
+    monkeypatch.setattr(music_database, 'MAX_PAGE_SIZE', 4)
+    
+    for limit in (0, -3):
+        page = catalog.search_songs_page(limit=limit)
+        assert len(page['songs']) == 1 and page['next_cursor'] is not None
+    
+    page = catalog.search_songs_page(limit=100)
+    assert len(page['songs']) == 4 and page['next_cursor'] is not None
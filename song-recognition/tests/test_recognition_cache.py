@@ -0,0 +1,68 @@
+"""
+Testes do cache de resultados: chave exata e capturas quase idênticas (MinHash/LSH)
+"""
+import numpy as np
+import pytest
+from services.recognition_cache import RecognitionCache
+from conftest import SAMPLE_RATE, synth_song
+
+RESULT = {'success': True, 'service_used': 'Fingerprinting Local', 'confidence': 0.9, 'offset_seconds': 5.0}
+
+@pytest.fixture
+def cache(fingerprint_system):
+    return RecognitionCache(fingerprint_system)
+
+@pytest.fixture
+def song():
+    return synth_song(3)
+
+def clip_signature(cache, y):
+    hashes, _ = cache.fingerprint_system.fingerprint_signal(y)
+    return cache.signature(y, hashes)
+
+def clip(song, start, seconds=8.0):
+    first = int(start * SAMPLE_RATE)
+    return song[first:first + int(seconds * SAMPLE_RATE)]
+
+def test_same_clip_with_other_gain_is_exact_hit(cache, song):
+    cache.put(clip_signature(cache, clip(song, 5.0)), RESULT)
+    
+    hit = cache.get(clip_signature(cache, clip(song, 5.0) * 0.5))
+    assert hit['cache_hit'] == 'exact'
+    assert hit['confidence'] == RESULT['confidence']
+    assert hit['offset_seconds'] == RESULT['offset_seconds']
+
+def test_near_identical_capture_is_similar_hit(cache, song):
+    cache.put(clip_signature(cache, clip(song, 5.0)), RESULT)
+    
+    noise = 0.0005 * np.random.default_rng(0).standard_normal(int(8.0 * SAMPLE_RATE))
+    hit = cache.get(clip_signature(cache, clip(song, 5.0) + noise.astype(np.float32)))
+    assert hit['cache_hit'] == 'similar'
+    assert hit['cache_similarity'] >= cache.min_similarity
+    assert 'offset_seconds' not in hit
+
+def test_other_part_of_same_song_is_miss(cache, song):
+    # Trechos deslocados compartilham parte dos hashes, mas o resultado (offset, confiança) é de outro trecho
+    cache.put(clip_signature(cache, clip(song, 5.0)), RESULT)
+    
+    for start in (5.5, 7.0, 9.0):
+        assert cache.get(clip_signature(cache, clip(song, start))) is None
+    assert cache.get_stats()['misses'] == 3
+
+def test_cleared_by_catalog_changes_not_by_merges(cache, song):
+    index = cache.fingerprint_system.index
+    signature = clip_signature(cache, clip(song, 5.0))
+    index.add_song(1, np.array([10, 20]), np.array([0, 1]))
+    index.add_song(2, np.array([30]), np.array([0]))
+    cache.put(signature, RESULT)
+    
+    index.merge()
+    assert cache.get(signature)['cache_hit'] == 'exact'
+    
+    index.remove_song(2)
+    assert cache.get(signature) is None
+    cache.put(signature, RESULT)
+    
+    index.add_song(3, np.array([40]), np.array([0]))
+    assert cache.get(signature) is None
+    assert cache.get_stats()['invalidations'] == 2
@@ -0,0 +1,79 @@
+"""
+Testes do controlador: caminhos locais e resultados de /recognize/batch, cache nos jobs
+"""
+import os
+from types import SimpleNamespace
+from controllers.recognition_controller import RecognitionController
+from services.recognition_service import RecognitionService
+from services.recognition_cache import RecognitionCache
+
+def resolve(root, path):
+    return RecognitionController.resolve_ingest_path(SimpleNamespace(ingest_root=root), path)
+
+def test_ingest_paths_stay_inside_root(tmp_path):
+    root = tmp_path / 'ingest'
+    (root / 'sub').mkdir(parents=True)
+    (tmp_path / 'secret.wav').write_bytes(b'')
+    os.symlink(tmp_path / 'secret.wav', root / 'link.wav')
+    
+    assert resolve(str(root), 'sub/clip.wav') == str(root / 'sub' / 'clip.wav')
+    assert resolve(str(root), str(root / 'clip.wav')) == str(root / 'clip.wav')
+    assert resolve(str(root), '../secret.wav') is None
+    assert resolve(str(root), str(tmp_path / 'secret.wav')) is None
+    assert resolve(str(root), 'link.wav') is None
+    assert resolve(str(root), 42) is None
+
+def test_ingest_paths_disabled_without_root(tmp_path):
+    assert resolve(None, str(tmp_path / 'clip.wav')) is None
+
+def test_batch_results_match_single_clip(fingerprint_system, write_song):
+    for seed in range(3):
+        fingerprint_system.add_song_to_database(f'Song {seed}', 'Artist', write_song(seed))
+    clips = [write_song(1, start=5.0, duration=6.0), write_song(99, seconds=6.0)]
+    
+    service = RecognitionService.__new__(RecognitionService)
+    service.fingerprint_system = fingerprint_system
+    saved = []
+    controller = SimpleNamespace(
+        recognition_service=service,
+        audio_service=None,
+        job_queue=SimpleNamespace(fingerprint_batch=lambda paths: [fingerprint_system.generate_fingerprint(path)
+                                                                   for path in paths]),
+        _save_result=saved.append
+    )
+    
+    results = RecognitionController.recognize_batch(controller, audio_paths=clips)
+    singles = [dict(service._recognize_by_fingerprint(clip), file_path=clip) for clip in clips]
+    
+    assert results == singles
+    assert results[0]['song_info']['title'] == 'Song 1' and not results[1]['success']
+    assert len(saved) == 1
+
+def test_submitted_jobs_use_result_cache(fingerprint_system, write_song):
+    fingerprint_system.add_song_to_database('Song 1', 'Artist', write_song(1))
+    clip = write_song(1, start=5.0, duration=6.0)
+    submitted, finished = [], []
+    
+    def submit(path, fingerprint, on_result):
+        submitted.append(fingerprint)
+        on_result({'success': True, 'service_used': 'Fingerprinting Local', 'song_info': {'title': 'Song 1'}})
+        return 'job'
+    
+    service = RecognitionService.__new__(RecognitionService)
+    service.fingerprint_system = fingerprint_system
+    controller = SimpleNamespace(
+        recognition_service=service,
+        audio_service=SimpleNamespace(save_temp_audio=lambda audio_file: audio_file,
+                                      cleanup_temp_file=lambda path: None),
+        result_cache=RecognitionCache(fingerprint_system),
+        job_queue=SimpleNamespace(submit=submit, submit_result=lambda result: finished.append(result) or 'done'),
+        _save_result=lambda result: None
+    )
+    controller._lookup_cache = lambda path: RecognitionController._lookup_cache(controller, path)
+    
+    assert RecognitionController.submit_recognition(controller, clip) == 'job'
+    assert len(submitted) == 1 and len(submitted[0][0]) > 0
+    
+    assert RecognitionController.submit_recognition(controller, clip) == 'done'
+    assert len(submitted) == 1
+    assert finished[0]['cache_hit'] == 'exact' and finished[0]['song_info'] == {'title': 'Song 1'}
@@ -0,0 +1,93 @@
+"""
+Testes da fila de jobs: estado compartilhado no SQLite e limite da fila entre processos
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from services import recognition_jobs
+from services.recognition_jobs import RecognitionJobQueue, QueueFullError
+
+@pytest.fixture
+def release(monkeypatch):
+    """Substitui o reconhecimento por um job que termina quando o evento é liberado"""
+    event = threading.Event()
+    
+    def fake_run(audio_path, job_id, db_path, fingerprint=None):
+        event.wait(10)
+        return {'result': {'success': True, 'path': audio_path}, 'timings': {}, 'started_at': time.time()}
+    
+    monkeypatch.setattr(recognition_jobs, '_run_recognition', fake_run)
+    yield event
+    event.set()
+
+def make_queue(tmp_path, **options):
+    queue = RecognitionJobQueue(db_path=str(tmp_path / 'jobs.db'), **options)
+    queue._executor = ThreadPoolExecutor(max_workers=2)
+    return queue
+
+def test_job_status_is_visible_to_other_processes(tmp_path, release):
+    owner = make_queue(tmp_path)
+    other = make_queue(tmp_path)
+    job_id = owner.submit('clip.wav')
+    
+    assert other.get_status(job_id)['status'] == 'queued'
+    assert other.get_status('desconhecido') is None
+    
+    release.set()
+    status = other.get_status(job_id, wait=5)
+    assert status['status'] == 'done'
+    assert status['result'] == {'success': True, 'path': 'clip.wav'}
+    owner.shutdown()
+    other.shutdown()
+
+def test_queue_limit_counts_jobs_of_all_processes(tmp_path, release):
+    owner = make_queue(tmp_path, max_queue=1)
+    other = make_queue(tmp_path, max_queue=1)
+    job_id = owner.submit('clip.wav')
+    
+    with pytest.raises(QueueFullError):
+        other.submit('clip2.wav')
+    assert other.get_stats()['pending'] == 1
+    
+    release.set()
+    assert owner.get_status(job_id, wait=5)['status'] == 'done'
+    other.submit('clip2.wav')
+    owner.shutdown()
+    other.shutdown()
+
+def test_batch_takes_one_queue_slot_per_clip(tmp_path, release, monkeypatch):
+    monkeypatch.setattr(recognition_jobs, '_fingerprint_clip', lambda path: path)
+    owner = make_queue(tmp_path, max_queue=3)
+    other = make_queue(tmp_path, max_queue=3)
+    owner.submit('clip.wav')
+    
+    with pytest.raises(QueueFullError):
+        other.fingerprint_batch(['a.wav', 'b.wav', 'c.wav'])
+    with pytest.raises(ValueError):
+        other.fingerprint_batch(['a.wav', 'b.wav', 'c.wav', 'd.wav'])
+    
+    assert other.fingerprint_batch(['a.wav', 'b.wav']) == ['a.wav', 'b.wav']
+    assert other.pending == 1
+    owner.shutdown()
+    other.shutdown()
+
+def test_known_result_recorded_as_finished_job(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.submit_result({'success': True, 'cache_hit': 'exact'})
+    
+    status = queue.get_status(job_id)
+    assert status['status'] == 'done'
+    assert status['result'] == {'success': True, 'cache_hit': 'exact'}
+    assert queue.get_stats()['pending'] == 0
+    queue.shutdown()
+
+def test_job_result_goes_to_its_callback(tmp_path, release):
+    queue = make_queue(tmp_path)
+    received = []
+    job_id = queue.submit('clip.wav', on_result=received.append)
+    
+    release.set()
+    assert queue.get_status(job_id, wait=5)['status'] == 'done'
+    assert received == [{'success': True, 'path': 'clip.wav'}]
+    queue.shutdown()
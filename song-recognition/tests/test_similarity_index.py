@@ -0,0 +1,112 @@
+"""
+Testes do índice de similaridade: ordem dos vizinhos, buffer de inclusões,
+remoções e alterações feitas por outro processo (log de alterações)
+"""
+import json
+import os
+import sqlite3
+import pytest
+from services.similarity_index import SimilarityIndex
+
+def analysis(tempo: float) -> dict:
+    return {'tempo': tempo, 'energy': 0.5, 'valence': 0.5, 'danceability': 0.5,
+            'spectral_features': {'mfcc_mean': [0.0] * 13}}
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = os.path.join(str(tmp_path), 'music.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('''
+            CREATE TABLE audio_features (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, song_id INTEGER, features_json TEXT
+            )
+        ''')
+    return path
+
+def insert(db_path, song_id, tempo):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('INSERT INTO audio_features (song_id, features_json) VALUES (?, ?)',
+                     (song_id, json.dumps(analysis(tempo))))
+
+def delete(db_path, song_id):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('DELETE FROM audio_features WHERE song_id = ?', (song_id,))
+
+def make_index(db_path, **options) -> SimilarityIndex:
+    index = SimilarityIndex(db_path)
+    index.refresh_interval = 0.0
+    index.search_eps = 0.0
+    for name, value in options.items():
+        setattr(index, name, value)
+    return index
+
+def ids(neighbors):
+    return [song_id for song_id, _ in neighbors]
+
+def test_neighbors_sorted_by_distance(db_path):
+    for song_id, tempo in [(1, 100), (2, 130), (3, 102), (4, 110), (5, 200)]:
+        insert(db_path, song_id, tempo)
+    index = make_index(db_path)
+    
+    neighbors = index.query(1, limit=3)
+    assert ids(neighbors) == [3, 4, 2]
+    assert neighbors[0][1] < neighbors[1][1] < neighbors[2][1]
+    assert index.query(99) == []
+
+def test_buffered_additions_and_removals(db_path):
+    for song_id, tempo in [(1, 100), (2, 130), (3, 160)]:
+        insert(db_path, song_id, tempo)
+    index = make_index(db_path, max_deleted=100)
+    index.query(1)
+    
+    # Inclusão fica no buffer (busca exaustiva) e já aparece nas consultas
+    index.add(4, analysis(101))
+    assert index.get_stats()['buffered'] == 1
+    assert ids(index.query(1, limit=2)) == [4, 2]
+    
+    # Remoção vira marca na árvore e deixa de aparecer
+    index.remove(2)
+    assert index.get_stats()['deleted'] == 1
+    assert ids(index.query(1)) == [4, 3]
+
+def test_query_fills_limit_past_removed_songs(db_path):
+    for song_id in range(1, 401):
+        insert(db_path, song_id, 100 + song_id)
+    index = make_index(db_path, max_deleted=100)
+    index.query(1)
+    
+    # Os vizinhos mais próximos foram removidos: a busca amplia k até achar vizinhos vivos
+    for song_id in range(2, 30):
+        index.remove(song_id)
+    assert index.get_stats()['deleted'] == 28
+    assert ids(index.query(1, limit=3)) == [30, 31, 32]
+    
+    # Removidos demais: a árvore é reconstruída
+    index.max_deleted = 5
+    index.remove(400)
+    assert index.get_stats()['deleted'] == 0 and index.get_stats()['tree_size'] == 371
+
+def test_changes_from_other_process(db_path):
+    for song_id, tempo in [(1, 100), (2, 130), (3, 160)]:
+        insert(db_path, song_id, tempo)
+    index = make_index(db_path)
+    assert ids(index.query(1)) == [2, 3]
+    
+    insert(db_path, 4, 101)
+    delete(db_path, 2)
+    assert ids(index.query(1)) == [4, 3]
+    assert index.get_stats()['tree_size'] == 3  # incremental, sem reconstruir
+
+def test_rebuild_when_change_log_was_trimmed(db_path):
+    for song_id, tempo in [(1, 100), (2, 130)]:
+        insert(db_path, song_id, tempo)
+    index = make_index(db_path)
+    index.query(1)
+    
+    insert(db_path, 3, 101)
+    insert(db_path, 4, 102)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('DELETE FROM audio_features_changes WHERE song_id = 3')
+    
+    assert ids(index.query(1)) == [3, 4, 2]
+    assert index.get_stats()['tree_size'] == 4
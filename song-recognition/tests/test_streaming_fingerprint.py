@@ -0,0 +1,40 @@
+"""
+Testes do modo streaming: os hashes devem ser os mesmos do processamento do sinal inteiro
+"""
+import os
+import numpy as np
+import pytest
+import soundfile as sf
+from conftest import SAMPLE_RATE, synth_song
+
+def stream_hashes(fingerprint_system, path):
+    chunks = list(fingerprint_system.iter_fingerprint_stream(path))
+    assert chunks, 'nenhum hash emitido'
+    return set(zip(np.concatenate([h for h, _ in chunks]).tolist(), np.concatenate([o for _, o in chunks]).tolist()))
+
+def batch_hashes(fingerprint_system, path):
+    hashes, offsets = fingerprint_system.fingerprint_signal(fingerprint_system.load_audio(path))
+    return set(zip(hashes.tolist(), offsets.tolist()))
+
+@pytest.mark.parametrize('block_seconds', [3.3, 7.0, 30.0])
+def test_streaming_matches_batch(fingerprint_system, tmp_path, block_seconds):
+    # Início baixo (crescendo): o ganho do começo do arquivo difere do pico global
+    y = synth_song(3, seconds=40.0)
+    y = y * np.linspace(0.05, 1.0, len(y), dtype=np.float32)
+    path = os.path.join(str(tmp_path), 'crescendo.wav')
+    sf.write(path, y, SAMPLE_RATE, subtype='FLOAT')
+    fingerprint_system.stream_block_seconds = block_seconds
+    
+    streamed = stream_hashes(fingerprint_system, path)
+    
+    assert streamed == batch_hashes(fingerprint_system, path)
+
+def test_gain_does_not_change_hashes(fingerprint_system, tmp_path):
+    y = synth_song(4, seconds=10.0)
+    paths = []
+    for gain in (1.0, 0.05):
+        paths.append(os.path.join(str(tmp_path), f'gain_{gain}.wav'))
+        sf.write(paths[-1], y * gain, SAMPLE_RATE, subtype='FLOAT')
+    
+    loud, quiet = (batch_hashes(fingerprint_system, path) for path in paths)
+    assert len(loud & quiet) >= 0.99 * len(loud)
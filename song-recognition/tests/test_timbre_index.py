@@ -0,0 +1,87 @@
+"""
+Testes do índice de embeddings de timbre: ranking, remoção, compactação e IVF
+"""
+import numpy as np
+import pytest
+from services.timbre_index import TimbreIndex, TIMBRE_DIM
+
+def unit(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def ranked_ids(results):
+    return [[song_id for song_id, _ in ranking] for ranking in results]
+
+@pytest.fixture
+def index(tmp_path):
+    return TimbreIndex(str(tmp_path / 'timbre_index'))
+
+@pytest.fixture
+def corpus():
+    """Embeddings agrupados em 8 regiões, com ids 1..400"""
+    rng = np.random.default_rng(7)
+    centers = rng.standard_normal((8, TIMBRE_DIM))
+    vectors = centers[np.arange(400) % 8] + 0.3 * rng.standard_normal((400, TIMBRE_DIM))
+    return list(range(1, 401)), unit(vectors)
+
+def test_search_ranks_by_cosine(index):
+    rng = np.random.default_rng(1)
+    query = unit(rng.standard_normal(TIMBRE_DIM))[0]
+    noise = unit(rng.standard_normal(TIMBRE_DIM))[0]
+    index.add_many([(1, noise), (2, unit(query + 0.5 * noise)[0]), (3, unit(query + 0.1 * noise)[0])])
+    
+    (results,) = index.search(query, k=3)
+    assert [song_id for song_id, _ in results] == [3, 2, 1]
+    assert results[0][1] == pytest.approx(float(unit(query + 0.1 * noise)[0] @ query), abs=1e-5)
+    
+    assert ranked_ids(index.search(query, k=2, exclude=[3])) == [[2, 1]]
+
+def test_add_replaces_previous_embedding(index):
+    a, b = np.eye(TIMBRE_DIM, dtype=np.float32)[:2]
+    index.add(1, a)
+    index.add(1, b)
+    
+    assert len(index) == 1
+    assert np.allclose(index.get_embedding(1), b)
+    assert index.search(a, k=5) == [[(1, 0.0)]]
+
+def test_remove_and_compact(index, corpus):
+    ids, vectors = corpus
+    index.add_many(zip(ids[:20], vectors[:20]))
+    index.remove(5)
+    index.remove(999)
+    
+    assert len(index) == 19 and index.get_embedding(5) is None
+    assert 5 not in ranked_ids(index.search(vectors[4], k=20))[0]
+    
+    before = index.search(vectors[:3], k=5)
+    index.compact()
+    assert index.get_stats()['rows'] == 19 and index.get_stats()['deleted_rows'] == 0
+    assert ranked_ids(index.search(vectors[:3], k=5)) == ranked_ids(before)
+    
+    # Outra instância enxerga o índice compactado
+    reopened = TimbreIndex(index.index_dir)
+    assert len(reopened) == 19 and np.allclose(reopened.get_embedding(6), vectors[5])
+
+def test_ivf_agrees_with_exhaustive_search(index, corpus):
+    ids, vectors = corpus
+    index.add_many(zip(ids, vectors))
+    queries = unit(vectors[::25] + 0.05 * np.random.default_rng(2).standard_normal((16, TIMBRE_DIM)))
+    exhaustive = index.search(queries, k=5)
+    
+    index.train_ivf(n_lists=8)
+    index.ivf_min_rows = 0
+    assert index.get_stats()['ivf_lists'] == 8
+    
+    # Todas as listas visitadas: mesmo resultado da busca exaustiva
+    index.nprobe = 8
+    assert ranked_ids(index.search(queries, k=5)) == ranked_ids(exhaustive)
+    
+    # Poucas listas: a consulta cai na lista do seu grupo e o top-1 se mantém
+    index.nprobe = 2
+    probed = index.search(queries, k=5)
+    assert [ranking[0] for ranking in ranked_ids(probed)] == [ranking[0] for ranking in ranked_ids(exhaustive)]
+    
+    # Embeddings novos entram direto na lista mais próxima
+    index.add(1000, vectors[0])
+    assert 1000 in ranked_ids(index.search(vectors[0], k=2))[0]